@@ -0,0 +1,363 @@
+"""
+Benchmarks of parsing archives, downloading them from a local http stand-in of
+data.binance.vision, and reading them back from the cache, on synthetic archives
+of realistic size. Every scenario reports the median latency, the throughput in
+rows/s and MB/s of zipped archives, the peak memory allocated by Python and numpy
+(traced by tracemalloc) and by Arrow, and the peak RSS of the process so far.
+
+    $ python benchmarks/bench.py --scale small
+    $ python benchmarks/bench.py fetch_warm multi_symbol --json results.json
+"""
+import argparse
+import json
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+import binance_history as bh
+from binance_history import config, memo, session
+from binance_history.testing import ArchiveServer, write_archives
+from binance_history.utils import load_agg_trades, load_klines
+
+DEFAULT_CACHE_FORMAT = config.CACHE_FORMAT
+
+SCALES = {
+    # months of 1m klines, days of aggTrades, the interval of aggTrades, symbols
+    "small": dict(months=1, days=1, interval="1s", symbols=2),
+    "medium": dict(months=3, days=2, interval="100ms", symbols=4),
+    "large": dict(months=12, days=7, interval="20ms", symbols=8),
+}
+
+
+class Result(NamedTuple):
+    name: str
+    # the median seconds of a run
+    latency: float
+    rows: int
+    # the bytes of the zipped archives read by a run
+    size: int
+    # the maximum bytes allocated by Python and numpy while running, traced by an
+    # extra run
+    peak_memory: int
+    # the maximum bytes allocated by Arrow's memory pool on top of the bytes already
+    # allocated, sampled during the same run, tracemalloc doesn't see them
+    arrow_memory: int
+    # the peak resident set size of the process since it started
+    max_rss: int
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.latency
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.size / 1024**2 / self.latency
+
+
+class ArrowSampler:
+    """sample ``pa.total_allocated_bytes()`` in a thread, keep the peak over the start"""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self) -> None:
+        while True:
+            self.peak = max(self.peak, pa.total_allocated_bytes() - self._start)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self) -> "ArrowSampler":
+        self._start = pa.total_allocated_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def max_rss() -> int:
+    """the peak resident set size of the process in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Bench:
+    """the synthetic archives of a scale served at ``server.url``"""
+
+    def __init__(self, root: Path, scale: str, repeat: int):
+        self.root = root
+        self.repeat = repeat
+        self.params = SCALES[scale]
+        self.symbols = [f"SYM{i}USDT" for i in range(self.params["symbols"])]
+        months, days = self.params["months"], self.params["days"]
+        self.klines_end = f"2022-{months:02d}-01"
+        # the last minute of the last month
+        last_day = pd.Timestamp(self.klines_end) + pd.offsets.MonthEnd()
+        self.klines_last = f"{last_day.date()} 23:59"
+        self.trades_end = f"2022-03-{days:02d}"
+
+        archives = root / "archives"
+        self.klines = []
+        for symbol in self.symbols:
+            self.klines += write_archives(
+                archives, symbol, "2022-01-01", self.klines_end
+            )
+        self.trades = write_archives(
+            archives,
+            self.symbols[0],
+            "2022-03-01",
+            self.trades_end,
+            data_type="aggTrades",
+            freq="daily",
+            timeframe=None,
+            interval=self.params["interval"],
+        )
+        self.server = ArchiveServer(archives)
+
+    def measure(
+        self,
+        name: str,
+        func: Callable[[], int],
+        size: int,
+        setup: Optional[Callable[[], None]] = None,
+    ) -> Result:
+        """run ``func`` returning the number of rows, after ``setup`` every time"""
+        latencies = []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            rows = func()
+            latencies.append(time.perf_counter() - start)
+
+        if setup is not None:
+            setup()
+        arrow = ArrowSampler()
+        tracemalloc.start()
+        try:
+            with arrow:
+                func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return Result(
+            name,
+            statistics.median(latencies),
+            rows,
+            size,
+            peak,
+            arrow.peak,
+            max_rss(),
+        )
+
+    def empty_cache(self) -> None:
+        """use a new cache directory, as on a machine which has never downloaded data"""
+        cache_dir = self.root / "cache"
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        config.CACHE_DIR = cache_dir
+        memo.clear()
+
+    def fetch_klines(self, symbol: str, **kwargs) -> int:
+        return len(
+            bh.fetch_klines(symbol, "2022-01-01", self.klines_last, tz="UTC", **kwargs)
+        )
+
+    def fetch_agg_trades(self) -> int:
+        end = f"{self.trades_end} 23:59:59"
+        return len(bh.fetch_agg_trades(self.symbols[0], "2022-03-01", end, tz="UTC"))
+
+
+SCENARIOS: Dict[str, Callable[[Bench], List[Result]]] = {}
+
+
+def scenario(func):
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def archive_size(paths: List[Path]) -> int:
+    return sum(path.stat().st_size for path in paths)
+
+
+@scenario
+def parse(bench: Bench) -> List[Result]:
+    """parse zipped csv archives in memory"""
+    klines, trades = bench.klines[0], bench.trades[0]
+    results = []
+    for engine in ["c", "pyarrow"]:
+        content = klines.read_bytes()
+        results.append(
+            bench.measure(
+                f"parse_klines[{engine}]",
+                lambda: len(load_klines(content, engine)),
+                len(content),
+            )
+        )
+        content = trades.read_bytes()
+        results.append(
+            bench.measure(
+                f"parse_agg_trades[{engine}]",
+                lambda: len(load_agg_trades(content, engine)),
+                len(content),
+            )
+        )
+    return results
+
+
+@scenario
+def fetch_cold(bench: Bench) -> List[Result]:
+    """download, parse and cache archives with an empty cache"""
+    klines = [p for p in bench.klines if bench.symbols[0] in p.name]
+    results = []
+    for cache_format in ["parquet", "pickle"]:
+        config.CACHE_FORMAT = cache_format
+        results.append(
+            bench.measure(
+                f"fetch_klines_cold[{cache_format}]",
+                lambda: bench.fetch_klines(bench.symbols[0]),
+                archive_size(klines),
+                setup=bench.empty_cache,
+            )
+        )
+    config.CACHE_FORMAT = DEFAULT_CACHE_FORMAT
+    results.append(
+        bench.measure(
+            "fetch_agg_trades_cold",
+            bench.fetch_agg_trades,
+            archive_size(bench.trades),
+            setup=bench.empty_cache,
+        )
+    )
+    return results
+
+
+@scenario
+def fetch_warm(bench: Bench) -> List[Result]:
+    """read the cached archives, the whole range, a slice and a few columns"""
+    klines = [p for p in bench.klines if bench.symbols[0] in p.name]
+    symbol = bench.symbols[0]
+    results = []
+    for cache_format in ["parquet", "pickle"]:
+        config.CACHE_FORMAT = cache_format
+        bench.empty_cache()
+        bench.fetch_klines(symbol)
+        results.append(
+            bench.measure(
+                f"fetch_klines_warm[{cache_format}]",
+                lambda: bench.fetch_klines(symbol),
+                archive_size(klines),
+            )
+        )
+        results.append(
+            bench.measure(
+                f"fetch_klines_slice[{cache_format}]",
+                lambda: len(
+                    bh.fetch_klines(symbol, "2022-01-10", "2022-01-10 23:59", tz="UTC")
+                ),
+                klines[0].stat().st_size,
+            )
+        )
+        results.append(
+            bench.measure(
+                f"fetch_klines_columns[{cache_format}]",
+                lambda: bench.fetch_klines(symbol, columns=["close"]),
+                archive_size(klines),
+            )
+        )
+    config.CACHE_FORMAT = DEFAULT_CACHE_FORMAT
+    bench.fetch_agg_trades()
+    results.append(
+        bench.measure(
+            "fetch_agg_trades_warm",
+            bench.fetch_agg_trades,
+            archive_size(bench.trades),
+        )
+    )
+    return results
+
+
+@scenario
+def multi_symbol(bench: Bench) -> List[Result]:
+    """fetch the klines of every symbol by one call, with an empty and a warm cache"""
+
+    def fetch_many():
+        dfs = bh.fetch_many(bench.symbols, "2022-01-01", bench.klines_last, tz="UTC")
+        return sum(map(len, dfs.values()))
+
+    size = archive_size(bench.klines)
+    return [
+        bench.measure("multi_symbol_cold", fetch_many, size, setup=bench.empty_cache),
+        bench.measure("multi_symbol_warm", fetch_many, size),
+    ]
+
+
+def format_results(results: List[Result]) -> str:
+    lines = [
+        f"{'scenario':<32} {'latency':>10} {'rows':>10} {'rows/s':>12} "
+        f"{'MB/s':>8} {'peak MB':>8} {'arrow MB':>9} {'RSS MB':>8}"
+    ]
+    for r in results:
+        lines.append(
+            f"{r.name:<32} {r.latency * 1000:>8.1f}ms {r.rows:>10} "
+            f"{r.rows_per_second:>12,.0f} {r.mb_per_second:>8.1f} "
+            f"{r.peak_memory / 1024**2:>8.1f} {r.arrow_memory / 1024**2:>9.1f} "
+            f"{r.max_rss / 1024**2:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> List[Result]:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "scenarios",
+        nargs="*",
+        choices=[[], *SCENARIOS],
+        help="The scenarios to run, default to all",
+    )
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Also write the results to this json file")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        bench = Bench(Path(root), args.scale, args.repeat)
+        with bench.server:
+            config.DATA_URL = bench.server.url
+            session.set_client(None)
+            bench.empty_cache()
+            for name in args.scenarios or SCENARIOS:
+                results += SCENARIOS[name](bench)
+        session.close_client()
+
+    print(format_results(results))
+    if args.json:
+        rows = [
+            {
+                **r._asdict(),
+                "rows_per_second": r.rows_per_second,
+                "mb_per_second": r.mb_per_second,
+            }
+            for r in results
+        ]
+        Path(args.json).write_text(json.dumps(rows, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
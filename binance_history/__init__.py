@@ -1,11 +1,74 @@
-import sys
+import importlib
+from typing import TYPE_CHECKING
 
-from .api import fetch_klines, fetch_agg_trades, fetch_data
+if TYPE_CHECKING:
+    from .api import (
+        fetch_klines,
+        fetch_agg_trades,
+        fetch_data,
+        fetch_bars,
+        fetch_many,
+        iter_klines,
+        iter_agg_trades,
+        iter_data,
+    )
+    from .bars import BarBuilder, build_bars
+    from .syncing import SyncResult, sync
 
-from importlib import metadata
+# the public names and the modules defining them, a module (and pandas, httpx, etc.
+# imported by it) is only imported when one of its names is first accessed, so
+# importing the package, e.g. by ``bh --help``, stays fast
+_LAZY_NAMES = {
+    "fetch_klines": "api",
+    "fetch_agg_trades": "api",
+    "fetch_data": "api",
+    "fetch_bars": "api",
+    "fetch_many": "api",
+    "iter_klines": "api",
+    "iter_agg_trades": "api",
+    "iter_data": "api",
+    "BarBuilder": "bars",
+    "build_bars": "bars",
+    "sync": "syncing",
+    "SyncResult": "syncing",
+}
 
-__version__ = metadata.version(__package__)
 
-del metadata, sys
+def __getattr__(name: str):
+    if name in _LAZY_NAMES:
+        module = importlib.import_module(f".{_LAZY_NAMES[name]}", __name__)
+        value = getattr(module, name)
+    elif name == "__version__":
+        from importlib import metadata
 
-__all__ = ["fetch_klines", "fetch_agg_trades", "fetch_data"]
+        value = metadata.version(__name__)
+    else:
+        # submodules, e.g. ``binance_history.config``
+        try:
+            value = importlib.import_module(f".{name}", __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f"{__name__}.{name}":
+                raise
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *_LAZY_NAMES, "__version__"])
+
+
+__all__ = [
+    "fetch_klines",
+    "fetch_agg_trades",
+    "fetch_data",
+    "fetch_bars",
+    "fetch_many",
+    "iter_klines",
+    "iter_agg_trades",
+    "iter_data",
+    "BarBuilder",
+    "build_bars",
+    "sync",
+    "SyncResult",
+]
@@ -1,11 +1,31 @@
+from concurrent.futures import Future
 from datetime import datetime
 
+import httpx
 import pandas as pd
 import pendulum
-from pandas import DataFrame
+from pandas import DataFrame, Timestamp
 
-from .utils import gen_dates, get_data, unify_datetime
-from typing import Optional, Union
+from . import config, metrics
+from .bars import iter_bars
+from .resample import (
+    KLINES_AGGREGATION,
+    check_resampleable,
+    floor_open_datetime,
+    next_open_datetime,
+    resample_klines,
+)
+from .utils import (
+    cache_data,
+    convert_tz,
+    gen_data_url,
+    gen_dates,
+    get_data,
+    get_data_chunks,
+    is_data_on_disk,
+    unify_datetime,
+)
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 
 def fetch_klines(
@@ -15,8 +35,34 @@ def fetch_klines(
     timeframe: str = "1m",
     asset_type: str = "spot",
     tz: Optional[str] = None,
+    max_concurrency: Optional[int] = None,
+    client: Optional[httpx.Client] = None,
+    columns: Optional[List[str]] = None,
+    engine: Optional[str] = None,
+    base_timeframe: Optional[str] = None,
 ) -> DataFrame:
-    """convinience function by calling ``fetch_data``"""
+    """
+    convinience function by calling ``fetch_data``
+
+    :param base_timeframe: If the klines of this finer timeframe (e.g. ``"1m"``) covering
+        the requested range are all cached, aggregate them to ``timeframe`` instead of
+        downloading the archives of ``timeframe``.
+    """
+    if base_timeframe is not None and base_timeframe != timeframe:
+        klines = _resample_cached_klines(
+            symbol,
+            start,
+            end,
+            timeframe,
+            base_timeframe,
+            asset_type,
+            tz,
+            max_concurrency=max_concurrency,
+            client=client,
+            engine=engine,
+        )
+        if klines is not None:
+            return klines if columns is None else klines[columns]
 
     return fetch_data(
         data_type="klines",
@@ -26,7 +72,73 @@ def fetch_klines(
         end=end,
         timeframe=timeframe,
         tz=tz,
+        max_concurrency=max_concurrency,
+        client=client,
+        columns=columns,
+        engine=engine,
+    )
+
+
+def _resample_cached_klines(
+    symbol: str,
+    start: Union[str, datetime],
+    end: Union[str, datetime],
+    timeframe: str,
+    base_timeframe: str,
+    asset_type: str,
+    tz: Optional[str] = None,
+    max_concurrency: Optional[int] = None,
+    client: Optional[httpx.Client] = None,
+    engine: Optional[str] = None,
+) -> Optional[DataFrame]:
+    """build klines by ``resample_klines``, None if any base archive is not cached"""
+    check_resampleable(timeframe, base_timeframe)
+    if tz is None:
+        tz = pendulum.local_timezone().name
+
+    start = pd.Timestamp(unify_datetime(start), tz=tz)
+    end = pd.Timestamp(unify_datetime(end), tz=tz)
+    # the base klines of every whole kline opened in [start, end]
+    base_start = floor_open_datetime(start, timeframe)
+    if base_start < start:
+        base_start = next_open_datetime(base_start, timeframe)
+    base_end = next_open_datetime(floor_open_datetime(end, timeframe), timeframe)
+    base_end -= pd.Timedelta(milliseconds=1)
+    if base_start > base_end:
+        return None
+
+    symbol, base_start, base_end, _, archives = _plan_archives(
+        "klines",
+        asset_type,
+        symbol,
+        base_start.tz_localize(None),
+        base_end.tz_localize(None),
+        "UTC",
+        base_timeframe,
+        client,
+    )
+    urls = [
+        gen_data_url("klines", asset_type, freq, symbol, dt, base_timeframe)
+        for freq, dt in archives
+    ]
+    if not all(is_data_on_disk(url) for url in urls):
+        return None
+
+    base = _get_archives(
+        archives,
+        max_concurrency,
+        data_type="klines",
+        asset_type=asset_type,
+        symbol=symbol,
+        timeframe=base_timeframe,
+        client=client,
+        columns=list(KLINES_AGGREGATION),
+        start=base_start,
+        end=base_end,
+        engine=engine,
     )
+    klines = resample_klines(pd.concat(base), timeframe)
+    return convert_tz(klines, tz)
 
 
 def fetch_agg_trades(
@@ -35,6 +147,10 @@ def fetch_agg_trades(
     end: Union[str, datetime],
     asset_type: str = "spot",
     tz: Optional[str] = None,
+    max_concurrency: Optional[int] = None,
+    client: Optional[httpx.Client] = None,
+    columns: Optional[List[str]] = None,
+    engine: Optional[str] = None,
 ) -> DataFrame:
     """convinience function by calling ``fetch_data``"""
 
@@ -45,7 +161,48 @@ def fetch_agg_trades(
         start=start,
         end=end,
         tz=tz,
+        max_concurrency=max_concurrency,
+        client=client,
+        columns=columns,
+        engine=engine,
+    )
+
+
+def fetch_bars(
+    symbol: str,
+    start: Union[str, datetime],
+    end: Union[str, datetime],
+    bar_type: str = "time",
+    size: Union[str, float] = "1min",
+    asset_type: str = "spot",
+    tz: Optional[str] = None,
+    chunk_rows: int = 1_000_000,
+    client: Optional[httpx.Client] = None,
+    engine: Optional[str] = None,
+) -> DataFrame:
+    """
+    Build bars from the aggTrades of ``[start, end]``, the trades are streamed by
+    ``iter_agg_trades`` so only one chunk of them is in memory at a time.
+
+    :param bar_type: ``"time"``, ``"tick"``, ``"volume"`` or ``"dollar"``,
+        see ``binance_history.bars.BarBuilder``.
+    :param size: The interval of time bars, e.g. ``"250ms"``, or the number of
+        trades, the quantity or the quote quantity of the other bars.
+    :return: A pandas dataframe with columns `open`, `high`, `low`, `close`, `volume`,
+        `quote_volume`, `buy_volume`, `sell_volume`, `trades`, `close_datetime`.
+    """
+    trades = iter_agg_trades(
+        symbol,
+        start,
+        end,
+        asset_type=asset_type,
+        tz=tz,
+        chunk_rows=chunk_rows,
+        client=client,
+        columns=["price", "quantity", "is_buyer_maker"],
+        engine=engine,
     )
+    return pd.concat(list(iter_bars(trades, bar_type, size)))
 
 
 def fetch_data(
@@ -56,6 +213,10 @@ def fetch_data(
     end: datetime,
     tz: Optional[str] = None,
     timeframe: Optional[str] = None,
+    max_concurrency: Optional[int] = None,
+    client: Optional[httpx.Client] = None,
+    columns: Optional[List[str]] = None,
+    engine: Optional[str] = None,
 ) -> DataFrame:
     """
     :param symbol: The binance market pair name. e.g. ``'BTCUSDT'``.
@@ -73,10 +234,290 @@ def fetch_data(
         `List of tz database time zones <https://en.wikipedia.org/wiki/List_of_tz_database_time_zones#List>`_.
     :param timeframe: The kline interval. e.g. "1m". see ``binance_history.constants.TIMEFRAMES``
         to see the full list of available intervals.
+    :param max_concurrency: The maximum number of archives downloaded in parallel,
+        default to ``binance_history.config.MAX_CONCURRENCY``.
+    :param client: The ``httpx.Client`` used to send requests, the shared client of
+        ``binance_history.session`` is used if omitted. A given client is used as is,
+        create it by ``session.create_client`` to retry failed requests, honor
+        ``config.RATE_LIMIT`` and read ``file://`` sources.
+    :param columns: Only return these columns, e.g. ``["close", "volume"]``, other columns
+        are not read from the cache.
+    :param engine: The csv parser of downloaded archives, ``"c"`` (pandas) or ``"pyarrow"``,
+        default to ``binance_history.config.CSV_ENGINE``.
     :return: A pandas dataframe with columns `open`, `high`, `low`, `close`, `volume`, `trades`, `close_datetime`.
         the dataframe's index is the open datetime of klines, the timezone of the datetime is set by ``tz``,
         if it is None, your local timezone will be used.
     """
+    symbol, start, end, tz, archives = _plan_archives(
+        data_type, asset_type, symbol, start, end, tz, timeframe, client
+    )
+    dfs = _get_archives(
+        archives,
+        max_concurrency,
+        data_type=data_type,
+        asset_type=asset_type,
+        symbol=symbol,
+        timeframe=timeframe,
+        client=client,
+        columns=columns,
+        start=start,
+        end=end,
+        engine=engine,
+    )
+    # every archive has been sliced to [start, end] when loading
+    with metrics.timer("concat"):
+        df = pd.concat(dfs)
+    with metrics.timer("convert_tz"):
+        return convert_tz(df, tz)
+
+
+def _get_archives(
+    archives: List[Tuple[str, Timestamp]],
+    max_concurrency: Optional[int] = None,
+    **kwargs,
+) -> List[DataFrame]:
+    """download (or load from cache) ``archives`` in parallel by calling ``get_data``
+    with ``kwargs``, the returned dataframes are in the same order as ``archives``."""
+
+    def get(archive):
+        freq, dt = archive
+        return get_data(freq=freq, dt=dt, **kwargs)
+
+    with _create_executor(max_concurrency) as executor:
+        return list(executor.map(get, archives))
+
+
+def _create_executor(
+    max_concurrency: Optional[int] = None,
+) -> metrics.ContextExecutor:
+    if max_concurrency is None:
+        max_concurrency = config.MAX_CONCURRENCY
+    if max_concurrency < 1:
+        raise ValueError(f"max_concurrency must be positive, but got {max_concurrency}")
+    return metrics.ContextExecutor(max_workers=max_concurrency)
+
+
+def fetch_many(
+    symbols: Iterable[str],
+    start: Union[str, datetime],
+    end: Union[str, datetime],
+    data_type: str = "klines",
+    asset_type: str = "spot",
+    timeframe: Optional[str] = "1m",
+    tz: Optional[str] = None,
+    as_frame: bool = False,
+    max_concurrency: Optional[int] = None,
+    client: Optional[httpx.Client] = None,
+    columns: Optional[List[str]] = None,
+    engine: Optional[str] = None,
+) -> Union[Dict[str, DataFrame], DataFrame]:
+    """
+    Fetch the same data of many symbols, the archives of all symbols are planned up front,
+    deduplicated and downloaded by one shared pool of ``max_concurrency`` workers.
+    See ``fetch_data`` for the other parameters.
+
+    :param symbols: The binance market pair names, e.g. ``["BTCUSDT", "ETHUSDT"]``.
+    :param as_frame: Return one dataframe indexed by (symbol, datetime) instead of a dict.
+    :return: A dict of dataframes keyed by the (normalized) symbol names, or a single
+        dataframe if ``as_frame`` is True.
+    """
+    # e.g. "btcusdt" and "BTC/USDT" are the same symbol and downloaded once
+    symbols = list(dict.fromkeys(s.upper().replace("/", "") for s in symbols))
+    if not symbols:
+        raise ValueError("symbols must not be empty")
+    if data_type != "klines":
+        timeframe = None
+
+    with _create_executor(max_concurrency) as executor:
+        plans = list(
+            executor.map(
+                lambda symbol: _plan_archives(
+                    data_type, asset_type, symbol, start, end, tz, timeframe, client
+                ),
+                symbols,
+            )
+        )
+
+        futures: Dict[Tuple[str, str, Timestamp], Future] = {}
+        for symbol, plan_start, plan_end, _, archives in plans:
+            for freq, dt in archives:
+                futures[(symbol, freq, dt)] = executor.submit(
+                    get_data,
+                    data_type,
+                    asset_type,
+                    freq,
+                    symbol,
+                    dt,
+                    timeframe=timeframe,
+                    client=client,
+                    columns=columns,
+                    start=plan_start,
+                    end=plan_end,
+                    engine=engine,
+                )
+
+        dfs = {}
+        for symbol, _, _, plan_tz, archives in plans:
+            parts = [futures[(symbol, *archive)].result() for archive in archives]
+            with metrics.timer("concat"):
+                df = pd.concat(parts)
+            with metrics.timer("convert_tz"):
+                dfs[symbol] = convert_tz(df, plan_tz)
+
+    if as_frame:
+        return pd.concat(dfs, names=["symbol"])
+    return dfs
+
+
+def iter_klines(
+    symbol: str,
+    start: Union[str, datetime],
+    end: Union[str, datetime],
+    timeframe: str = "1m",
+    asset_type: str = "spot",
+    tz: Optional[str] = None,
+    chunk_rows: int = 1_000_000,
+    client: Optional[httpx.Client] = None,
+    columns: Optional[List[str]] = None,
+    engine: Optional[str] = None,
+) -> Iterator[DataFrame]:
+    """convinience function by calling ``iter_data``"""
+
+    return iter_data(
+        data_type="klines",
+        asset_type=asset_type,
+        symbol=symbol,
+        start=start,
+        end=end,
+        timeframe=timeframe,
+        tz=tz,
+        chunk_rows=chunk_rows,
+        client=client,
+        columns=columns,
+        engine=engine,
+    )
+
+
+def iter_agg_trades(
+    symbol: str,
+    start: Union[str, datetime],
+    end: Union[str, datetime],
+    asset_type: str = "spot",
+    tz: Optional[str] = None,
+    chunk_rows: int = 1_000_000,
+    client: Optional[httpx.Client] = None,
+    columns: Optional[List[str]] = None,
+    engine: Optional[str] = None,
+) -> Iterator[DataFrame]:
+    """convinience function by calling ``iter_data``"""
+
+    return iter_data(
+        data_type="aggTrades",
+        asset_type=asset_type,
+        symbol=symbol,
+        start=start,
+        end=end,
+        tz=tz,
+        chunk_rows=chunk_rows,
+        client=client,
+        columns=columns,
+        engine=engine,
+    )
+
+
+def iter_data(
+    symbol: str,
+    asset_type: str,
+    data_type: str,
+    start: datetime,
+    end: datetime,
+    tz: Optional[str] = None,
+    timeframe: Optional[str] = None,
+    chunk_rows: int = 1_000_000,
+    client: Optional[httpx.Client] = None,
+    columns: Optional[List[str]] = None,
+    engine: Optional[str] = None,
+    max_concurrency: Optional[int] = None,
+) -> Iterator[DataFrame]:
+    """
+    Like ``fetch_data``, but yields the data as time-ordered dataframes of at most
+    ``chunk_rows`` rows, so the whole date range is never held in memory. Archives are
+    downloaded one by one when the iteration reaches them. The parquet cache, the
+    default, is read chunk by chunk, while a pickle cache (``config.CACHE_FORMAT``)
+    loads every archive whole.
+
+    :param chunk_rows: The maximum number of rows of every yielded dataframe.
+    :param max_concurrency: If given, the archives are downloaded to the cache by up
+        to ``max_concurrency`` threads ahead of the iteration instead.
+    """
+    if chunk_rows < 1:
+        raise ValueError(f"chunk_rows must be positive, but got {chunk_rows}")
+
+    symbol, start, end, tz, archives = _plan_archives(
+        data_type, asset_type, symbol, start, end, tz, timeframe, client
+    )
+    futures = []
+    executor = None
+    if max_concurrency is not None:
+        executor = _create_executor(max_concurrency)
+        futures = [
+            executor.submit(
+                cache_data,
+                data_type,
+                asset_type,
+                freq,
+                symbol,
+                dt,
+                timeframe,
+                client,
+                engine,
+                chunk_rows,
+            )
+            for freq, dt in archives
+        ]
+    try:
+        for i, (freq, dt) in enumerate(archives):
+            if futures:
+                futures[i].result()
+            chunks = get_data_chunks(
+                data_type,
+                asset_type,
+                freq,
+                symbol,
+                dt,
+                timeframe=timeframe,
+                client=client,
+                columns=columns,
+                start=start,
+                end=end,
+                chunk_rows=chunk_rows,
+                engine=engine,
+            )
+            for chunk in chunks:
+                with metrics.timer("convert_tz"):
+                    chunk = convert_tz(chunk, tz)
+                yield chunk
+    finally:
+        if executor is not None:
+            for future in futures:
+                future.cancel()
+            executor.shutdown()
+
+
+def _plan_archives(
+    data_type: str,
+    asset_type: str,
+    symbol: str,
+    start: Union[str, datetime],
+    end: Union[str, datetime],
+    tz: Optional[str] = None,
+    timeframe: Optional[str] = None,
+    client: Optional[httpx.Client] = None,
+) -> Tuple[str, Timestamp, Timestamp, str, List[Tuple[str, Timestamp]]]:
+    """
+    Normalize the arguments of ``fetch_data``, and list the (freq, date) of
+    archives covering ``[start, end]`` in chronological order.
+    """
     if tz is None:
         tz = pendulum.local_timezone().name
 
@@ -86,21 +527,15 @@ def fetch_data(
 
     symbol = symbol.upper().replace("/", "")
 
-    months, days = gen_dates(
-        data_type,
-        asset_type,
-        symbol,
-        start.tz_convert(None),
-        end.tz_convert(None),
-        timeframe=timeframe,
-    )
-    monthly_dfs = [
-        get_data(data_type, asset_type, "monthly", symbol, dt, tz, timeframe)
-        for dt in months
-    ]
-    daily_dfs = [
-        get_data(data_type, asset_type, "daily", symbol, dt, tz, timeframe)
-        for dt in days
-    ]
-    df = pd.concat(monthly_dfs + daily_dfs)
-    return df.loc[start:end]
+    with metrics.timer("probe"):
+        months, days = gen_dates(
+            data_type,
+            asset_type,
+            symbol,
+            start.tz_convert(None),
+            end.tz_convert(None),
+            timeframe=timeframe,
+            client=client,
+        )
+    archives = [("monthly", dt) for dt in months] + [("daily", dt) for dt in days]
+    return symbol, start, end, tz, archives
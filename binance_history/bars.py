@@ -0,0 +1,184 @@
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Timedelta
+
+BAR_TYPES = ["time", "tick", "volume", "dollar"]
+
+BAR_COLUMNS = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "quote_volume",
+    "buy_volume",
+    "sell_volume",
+    "trades",
+    "close_datetime",
+]
+
+
+class BarBuilder:
+    """
+    Build bars from aggTrades (as returned by ``load_agg_trades``) chunk by chunk,
+    the trades of the last bar are kept until a later chunk shows it is complete,
+    so the full trade history is never needed in memory.
+
+    - ``"time"`` bars cover ``size`` (e.g. ``"250ms"``) aligned on the epoch, their
+      index is the start of the interval and intervals without trades are dropped.
+    - ``"tick"`` bars hold ``size`` trades.
+    - ``"volume"``/``"dollar"`` bars close at the trade which makes the cumulative
+      quantity/quote quantity since the first trade cross a multiple of ``size``.
+
+    The index of tick, volume and dollar bars is the datetime of their first trade,
+    and ``close_datetime`` the datetime of their last trade. The taker of a trade is
+    the buyer if ``is_buyer_maker`` is False, its quantity is counted in ``buy_volume``.
+    """
+
+    def __init__(self, bar_type: str = "time", size: Union[str, float] = "1min"):
+        if bar_type not in BAR_TYPES:
+            raise ValueError(
+                f"bar_type must be one of {BAR_TYPES}, but got '{bar_type}'"
+            )
+        if bar_type == "time":
+            size = Timedelta(size).value
+        if not size > 0:
+            raise ValueError(f"size must be positive, but got {size}")
+        if bar_type == "tick" and size != int(size):
+            raise ValueError(f"size of tick bars must be an integer, but got {size}")
+
+        self.bar_type = bar_type
+        self.size = size
+        self._tail: Optional[DataFrame] = None
+        # the cumulative measure before the first trade of the tail
+        self._offset = 0
+
+    def update(self, trades: DataFrame) -> DataFrame:
+        """add the next trades in time order, return the bars completed by them"""
+        if self._tail is not None:
+            trades = pd.concat([self._tail, trades])
+        if len(trades) == 0:
+            return _empty_bars(getattr(trades.index.dtype, "tz", None))
+
+        measure = self._measure(trades)
+        ids = self._bar_ids(trades, measure)
+        last = np.searchsorted(ids, ids[-1])
+        if measure is not None:
+            self._offset += measure[:last].sum()
+        self._tail = trades.iloc[last:]
+        return self._aggregate(trades.iloc[:last], ids[:last])
+
+    def flush(self) -> DataFrame:
+        """return the last bar, which may be incomplete, and reset the builder"""
+        if self._tail is None:
+            return _empty_bars()
+        trades = self._tail
+        bars = self._aggregate(trades, self._bar_ids(trades, self._measure(trades)))
+        self._tail, self._offset = None, 0
+        return bars
+
+    def _measure(self, trades: DataFrame) -> Optional[np.ndarray]:
+        if self.bar_type == "tick":
+            return np.ones(len(trades), dtype=np.int64)
+        if self.bar_type == "volume":
+            return trades["quantity"].to_numpy()
+        if self.bar_type == "dollar":
+            return trades["price"].to_numpy() * trades["quantity"].to_numpy()
+        return None
+
+    def _bar_ids(self, trades: DataFrame, measure: Optional[np.ndarray]) -> np.ndarray:
+        if measure is None:
+            return trades.index.asi8 // self.size
+        # the cumulative measure before every trade
+        before = self._offset + np.concatenate([[0], np.cumsum(measure)[:-1]])
+        return (before // self.size).astype(np.int64)
+
+    def _aggregate(self, trades: DataFrame, ids: np.ndarray) -> DataFrame:
+        return _aggregate(trades, ids, self.size if self.bar_type == "time" else None)
+
+
+def build_bars(
+    trades: Union[DataFrame, Iterable[DataFrame]],
+    bar_type: str = "time",
+    size: Union[str, float] = "1min",
+) -> DataFrame:
+    """
+    Build bars from a dataframe of aggTrades, or from time-ordered chunks of it,
+    see ``BarBuilder`` for the available ``bar_type``.
+    """
+    if isinstance(trades, DataFrame):
+        trades = [trades]
+    return pd.concat(list(iter_bars(trades, bar_type, size)))
+
+
+def iter_bars(
+    chunks: Iterable[DataFrame],
+    bar_type: str = "time",
+    size: Union[str, float] = "1min",
+) -> Iterator[DataFrame]:
+    """yield the bars completed by every chunk of aggTrades, then the last bar"""
+    builder = BarBuilder(bar_type, size)
+    for chunk in chunks:
+        yield builder.update(chunk)
+    yield builder.flush()
+
+
+def _aggregate(
+    trades: DataFrame, ids: np.ndarray, interval: Optional[int] = None
+) -> DataFrame:
+    """aggregate sorted trades having the same consecutive ``ids`` into bars"""
+    tz = getattr(trades.index.dtype, "tz", None)
+    if len(ids) == 0:
+        return _empty_bars(tz)
+
+    price = trades["price"].to_numpy()
+    quantity = trades["quantity"].to_numpy()
+    is_buyer_maker = trades["is_buyer_maker"].to_numpy(dtype=bool)
+
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(ids)) + 1])
+    ends = np.append(starts[1:], len(ids))
+    if interval is None:
+        open_at = trades.index.asi8[starts]
+        close_at = trades.index.asi8[ends - 1]
+    else:
+        open_at = ids[starts] * interval
+        # like klines, a time bar closes one millisecond before the next one opens
+        close_at = open_at + interval - Timedelta(milliseconds=1).value
+
+    quote_quantity = price * quantity
+    buy_quantity = np.where(is_buyer_maker, 0.0, quantity)
+    sell_quantity = np.where(is_buyer_maker, quantity, 0.0)
+    bars = DataFrame(
+        {
+            "open": price[starts],
+            "high": np.maximum.reduceat(price, starts),
+            "low": np.minimum.reduceat(price, starts),
+            "close": price[ends - 1],
+            "volume": np.add.reduceat(quantity, starts),
+            "quote_volume": np.add.reduceat(quote_quantity, starts),
+            "buy_volume": np.add.reduceat(buy_quantity, starts),
+            "sell_volume": np.add.reduceat(sell_quantity, starts),
+            "trades": (ends - starts).astype(np.int64),
+            "close_datetime": _to_datetime_index(close_at, tz),
+        },
+        index=_to_datetime_index(open_at, tz).rename("open_datetime"),
+    )
+    return bars
+
+
+def _empty_bars(tz=None) -> DataFrame:
+    bars = DataFrame(
+        {name: np.empty(0) for name in BAR_COLUMNS[:-2]},
+        index=_to_datetime_index(np.empty(0), tz).rename("open_datetime"),
+    )
+    return bars.assign(
+        trades=np.empty(0, dtype=np.int64),
+        close_datetime=_to_datetime_index(np.empty(0), tz),
+    )
+
+
+def _to_datetime_index(values: np.ndarray, tz=None) -> pd.DatetimeIndex:
+    index = pd.DatetimeIndex(np.asarray(values, dtype=np.int64).view("datetime64[ns]"))
+    return index if tz is None else index.tz_localize("UTC").tz_convert(tz)
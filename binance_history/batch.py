@@ -0,0 +1,237 @@
+import csv
+import json
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+import httpx
+
+from .api import _create_executor, _plan_archives, iter_data
+from .export import Exporter, get_exporter
+from .utils import cache_data, gen_data_url
+
+
+class Job(NamedTuple):
+    symbol: str
+    start: str
+    end: str
+    data_type: str = "klines"
+    asset_type: str = "spot"
+    # the timeframe of klines, ignored by other data types
+    timeframe: str = "1m"
+    tz: Optional[str] = None
+    # the data is only downloaded to the cache if it's None, see ``bh fetch``
+    output_path: Optional[str] = None
+    format: Optional[str] = None
+    compression: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        """identify the job in the state file of resumed runs"""
+        return json.dumps(self._asdict(), sort_keys=True)
+
+    def exporter(self) -> Exporter:
+        """the exporter of the output, its format defaults to the extension name"""
+        return get_exporter(
+            self.format or self.output_path.split(".")[-1], self.compression
+        )
+
+    def __str__(self) -> str:
+        name = f"{self.asset_type}/{self.data_type}/{self.symbol}"
+        if self.data_type == "klines":
+            name += f"/{self.timeframe}"
+        return f"{name} [{self.start}, {self.end}]"
+
+
+class JobResult(NamedTuple):
+    job: Job
+    # the number of archives covering the range of the job
+    archives: int
+    # the number of archives downloaded for the job, the others were cached, an archive
+    # shared by several jobs is credited to the first one
+    downloaded: int
+    # the number of exported rows, 0 if the job has no output
+    rows: int
+    # the message of the exception the job failed by
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def load_jobs(path: Path) -> List[Job]:
+    """
+    Load jobs from a yaml, json or csv manifest. A yaml or json manifest is a list of
+    jobs, or a mapping with ``jobs`` and optional ``defaults`` shared by the jobs. A
+    csv manifest has a header of the fields of ``Job``. Reading yaml requires PyYAML,
+    install it by ``pip install 'binance-history[yaml]'``.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        with open(path, newline="") as f:
+            rows = [
+                {key: value for key, value in row.items() if value not in ("", None)}
+                for row in csv.DictReader(f)
+            ]
+        manifest = {"jobs": rows}
+    elif suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError(
+                "yaml manifests require PyYAML, "
+                "install it by: pip install 'binance-history[yaml]'"
+            )
+        manifest = yaml.safe_load(path.read_text())
+    elif suffix == ".json":
+        manifest = json.loads(path.read_text())
+    else:
+        raise ValueError(f"manifest must be a yaml, json or csv file, but got '{path}'")
+
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+    defaults = manifest.get("defaults") or {}
+    return [make_job({**defaults, **job}) for job in manifest.get("jobs") or []]
+
+
+def make_job(fields: Dict) -> Job:
+    unknown = set(fields) - set(Job._fields)
+    if unknown:
+        raise ValueError(f"unknown fields of job: {sorted(unknown)}")
+    missing = {"symbol", "start", "end"} - set(fields)
+    if missing:
+        raise ValueError(f"missing fields of job: {sorted(missing)}")
+    job = Job(**{key: str(value) for key, value in fields.items()})
+    if job.output_path is not None:
+        # fail on an invalid format or compression before anything is downloaded
+        job.exporter()
+    return job
+
+
+def run_jobs(
+    jobs: Iterable[Job],
+    max_concurrency: Optional[int] = None,
+    client: Optional[httpx.Client] = None,
+    engine: Optional[str] = None,
+    state_path: Optional[Path] = None,
+    on_result: Optional[Callable[[int, JobResult], None]] = None,
+) -> List[JobResult]:
+    """
+    Run ``jobs`` in one process. Their archives are planned and downloaded to the
+    cache by one shared pool of up to ``max_concurrency`` threads, an archive needed
+    by several jobs is downloaded once. Then the data of every job is exported to
+    its output if it has one. A failed job does not stop the others.
+
+    :param state_path: The file recording the finished jobs, the jobs found in it are
+        skipped so an interrupted run can be resumed.
+    :param on_result: Called by the index of each job and its result, in order.
+    :return: The results of the jobs which were not skipped.
+    """
+    jobs = list(jobs)
+    finished = _load_state(state_path)
+    pending = [i for i, job in enumerate(jobs) if job.key not in finished]
+
+    def plan(job):
+        timeframe = job.timeframe if job.data_type == "klines" else None
+        return _plan_archives(
+            job.data_type,
+            job.asset_type,
+            job.symbol,
+            job.start,
+            job.end,
+            job.tz,
+            timeframe,
+            client,
+        )
+
+    results = []
+    with _create_executor(max_concurrency) as executor:
+        plans = {i: executor.submit(plan, jobs[i]) for i in pending}
+        downloads = {}
+        # the archives credited to every job, see ``JobResult.downloaded``
+        credited = {i: set() for i in pending}
+        for i in pending:
+            try:
+                symbol, *_, archives = plans[i].result()
+            except Exception:
+                continue
+            job = jobs[i]
+            timeframe = job.timeframe if job.data_type == "klines" else None
+            for freq, dt in archives:
+                url = gen_data_url(
+                    job.data_type, job.asset_type, freq, symbol, dt, timeframe
+                )
+                if url not in downloads:
+                    credited[i].add(url)
+                    downloads[url] = executor.submit(
+                        cache_data,
+                        job.data_type,
+                        job.asset_type,
+                        freq,
+                        symbol,
+                        dt,
+                        timeframe,
+                        client,
+                        engine,
+                    )
+
+        for i in pending:
+            result = _finish_job(
+                jobs[i], plans[i], downloads, credited[i], client, engine
+            )
+            if result.ok:
+                _save_state(state_path, jobs[i])
+            if on_result is not None:
+                on_result(i, result)
+            results.append(result)
+    return results
+
+
+def _finish_job(job: Job, plan, downloads, credited, client, engine) -> JobResult:
+    """
+    wait for the archives of ``job``, then export its data if it has an output, only
+    the downloads of ``credited`` urls are counted
+    """
+    archives = downloaded = 0
+    try:
+        symbol, start, end, tz, planned = plan.result()
+        timeframe = job.timeframe if job.data_type == "klines" else None
+        archives = len(planned)
+        for freq, dt in planned:
+            url = gen_data_url(
+                job.data_type, job.asset_type, freq, symbol, dt, timeframe
+            )
+            if downloads[url].result() and url in credited:
+                downloaded += 1
+        if job.output_path is None:
+            return JobResult(job, archives, downloaded, 0)
+
+        chunks = iter_data(
+            symbol,
+            job.asset_type,
+            job.data_type,
+            start,
+            end,
+            tz=tz,
+            timeframe=timeframe,
+            client=client,
+            engine=engine,
+        )
+        rows = job.exporter().write_chunks(Path(job.output_path), chunks, symbol)
+        return JobResult(job, archives, downloaded, rows)
+    except Exception as e:
+        return JobResult(job, archives, downloaded, 0, f"{type(e).__name__}: {e}")
+
+
+def _load_state(state_path: Optional[Path]) -> Set[str]:
+    if state_path is None or not Path(state_path).exists():
+        return set()
+    with open(state_path) as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def _save_state(state_path: Optional[Path], job: Job) -> None:
+    if state_path is not None:
+        with open(state_path, "a") as f:
+            f.write(job.key + "\n")
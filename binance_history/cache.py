@@ -0,0 +1,328 @@
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame, Timestamp
+from pandas.api.types import is_datetime64_any_dtype
+
+from . import config
+
+
+class CacheBackend:
+    """
+    Stores the dataframe of one archive in a single file. ``path`` passed to
+    the methods is the local path of the archive, the backend replaces its
+    suffix by ``suffix``. Files are written by ``atomic_write``, so a reader
+    never sees a partially written file.
+    """
+
+    name: str
+    suffix: str
+
+    def file_path(self, path: Path) -> Path:
+        return path.with_suffix(self.suffix)
+
+    def exists(self, path: Path) -> bool:
+        return self.file_path(path).exists()
+
+    def save(self, path: Path, df: DataFrame) -> None:
+        raise NotImplementedError
+
+    def load(
+        self,
+        path: Path,
+        columns: Optional[List[str]] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> DataFrame:
+        """load the rows whose index is in ``[start, end]``, and only ``columns`` if given."""
+        raise NotImplementedError
+
+    def save_chunks(self, path: Path, chunks: Iterable[DataFrame]) -> None:
+        """save an archive given as consecutive chunks"""
+        self.save(path, pd.concat(list(chunks)))
+
+    def iter_chunks(
+        self,
+        path: Path,
+        columns: Optional[List[str]] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+        chunk_rows: int = 1_000_000,
+    ) -> Iterator[DataFrame]:
+        """
+        like ``load`` but yields non-empty chunks of at most ``chunk_rows`` rows, the
+        file is opened before returning
+        """
+        df = self.load(path, columns, start, end)
+        return (
+            df.iloc[offset : offset + chunk_rows]
+            for offset in range(0, len(df), chunk_rows)
+        )
+
+
+class PickleBackend(CacheBackend):
+    """
+    The cache of binance-history<=0.1.7. A pickle file can only be read whole, so the
+    rows out of ``[start, end]`` and the columns not requested are dropped after loading
+    the whole archive, and ``iter_chunks`` slices the loaded archive, use
+    ``ParquetBackend`` to read less.
+    """
+
+    name = "pickle"
+    suffix = ".pkl"
+
+    def save(self, path: Path, df: DataFrame) -> None:
+        with atomic_write(self.file_path(path)) as tmp_path:
+            df.to_pickle(tmp_path)
+
+    def load(
+        self,
+        path: Path,
+        columns: Optional[List[str]] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> DataFrame:
+        df = pd.read_pickle(self.file_path(path)).loc[start:end]
+        return df if columns is None else df[columns]
+
+
+class ParquetBackend(CacheBackend):
+    """
+    Columnar cache, only the requested columns are read. If
+    ``config.PARQUET_COMPACT_DTYPES`` is True, numeric columns are downcasted to 32 bits
+    when it is lossless and datetimes are stored as int64 epoch milliseconds, they are
+    converted back to the dtypes of a freshly downloaded archive when loading.
+
+    Whole days of an archive are written to row groups of at least
+    ``config.PARQUET_ROW_GROUP_ROWS`` rows, when loading a time range, row groups out
+    of the range are skipped by their statistics.
+    """
+
+    name = "parquet"
+    suffix = ".parquet"
+
+    def save(self, path: Path, df: DataFrame) -> None:
+        if config.PARQUET_COMPACT_DTYPES:
+            table = pa.Table.from_pandas(compact_dtypes(df), preserve_index=True)
+            table = to_milliseconds(table)
+        else:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+        with atomic_write(self.file_path(path)) as tmp_path:
+            with pq.ParquetWriter(tmp_path, table.schema) as writer:
+                for offset, length in row_group_slices(df.index):
+                    writer.write_table(table.slice(offset, length))
+
+    def load(
+        self,
+        path: Path,
+        columns: Optional[List[str]] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> DataFrame:
+        parquet_file = pq.ParquetFile(self.file_path(path))
+        if start is None and end is None:
+            table = parquet_file.read(columns, use_pandas_metadata=True)
+            return restore_dtypes(table.to_pandas())
+
+        row_groups = overlapped_row_groups(parquet_file, start, end)
+        table = parquet_file.read_row_groups(
+            row_groups, columns, use_pandas_metadata=True
+        )
+        return restore_dtypes(table.to_pandas()).loc[start:end]
+
+    def save_chunks(self, path: Path, chunks: Iterable[DataFrame]) -> None:
+        """
+        Write chunks one by one, the numeric columns are not downcasted since
+        the values of later chunks are unknown when the schema is decided.
+        """
+        writer = None
+        with atomic_write(self.file_path(path)) as tmp_path:
+            try:
+                for chunk in chunks:
+                    table = pa.Table.from_pandas(chunk, preserve_index=True)
+                    if writer is None:
+                        if config.PARQUET_COMPACT_DTYPES:
+                            table = to_milliseconds(table)
+                        writer = pq.ParquetWriter(tmp_path, table.schema)
+                    else:
+                        table = table.cast(writer.schema)
+                    for offset, length in row_group_slices(chunk.index):
+                        writer.write_table(table.slice(offset, length))
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    def iter_chunks(
+        self,
+        path: Path,
+        columns: Optional[List[str]] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+        chunk_rows: int = 1_000_000,
+    ) -> Iterator[DataFrame]:
+        parquet_file = pq.ParquetFile(self.file_path(path))
+        batches = parquet_file.iter_batches(
+            chunk_rows,
+            overlapped_row_groups(parquet_file, start, end),
+            columns,
+            use_pandas_metadata=True,
+        )
+        return self._iter_dataframes(parquet_file, batches, start, end)
+
+    @staticmethod
+    def _iter_dataframes(
+        parquet_file: pq.ParquetFile,
+        batches: Iterator[pa.RecordBatch],
+        start: Optional[Timestamp],
+        end: Optional[Timestamp],
+    ) -> Iterator[DataFrame]:
+        metadata = parquet_file.schema_arrow.metadata
+        for batch in batches:
+            table = pa.Table.from_batches([batch]).replace_schema_metadata(metadata)
+            df = restore_dtypes(table.to_pandas()).loc[start:end]
+            if len(df) > 0:
+                yield df
+
+
+BACKENDS: Dict[str, Type[CacheBackend]] = {
+    PickleBackend.name: PickleBackend,
+    ParquetBackend.name: ParquetBackend,
+}
+
+
+def get_backend(name: Optional[str] = None) -> CacheBackend:
+    """return the cache backend called ``name``, default to ``config.CACHE_FORMAT``"""
+    name = config.CACHE_FORMAT if name is None else name
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(
+            f"cache format must be one of {list(BACKENDS)}, but got '{name}'"
+        )
+
+
+@contextmanager
+def atomic_write(path: Path) -> Iterator[Path]:
+    """
+    Yield a temporary path next to ``path`` to write to, it's renamed to ``path``
+    on success and removed on failure. Nothing is written if the temporary file
+    is not created.
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        yield tmp_path
+        if tmp_path.exists():
+            os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def compact_dtypes(df: DataFrame) -> DataFrame:
+    """downcast 64 bits numeric columns to 32 bits where it is lossless"""
+    df = df.copy()
+    for name, col in df.items():
+        if col.dtype == np.float64:
+            downcasted = col.astype(np.float32)
+            if np.array_equal(downcasted.astype(np.float64), col, equal_nan=True):
+                df[name] = downcasted
+        elif col.dtype == np.int64:
+            info = np.iinfo(np.int32)
+            if len(col) == 0 or (info.min <= col.min() and col.max() <= info.max):
+                df[name] = col.astype(np.int32)
+    return df
+
+
+def restore_dtypes(df: DataFrame) -> DataFrame:
+    """
+    undo ``compact_dtypes`` and use nanosecond datetimes as pandas does by default,
+    columns which are already in these dtypes are not copied
+    """
+    for name, col in df.items():
+        if col.dtype == np.float32:
+            df[name] = col.astype(np.float64)
+        elif col.dtype == np.int32:
+            df[name] = col.astype(np.int64)
+        elif is_datetime64_any_dtype(col.dtype):
+            df[name] = _to_nanoseconds(col)
+    if is_datetime64_any_dtype(df.index.dtype):
+        df.index = _to_nanoseconds(df.index)
+    return df
+
+
+def row_group_slices(
+    index: pd.Index, min_rows: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """
+    split a sorted datetime index into (offset, length) of consecutive whole days
+    of at least ``min_rows`` rows (except the last one), default to
+    ``config.PARQUET_ROW_GROUP_ROWS``
+    """
+    min_rows = config.PARQUET_ROW_GROUP_ROWS if min_rows is None else min_rows
+    slices = []
+    for offset, length in daily_slices(index):
+        if slices and slices[-1][1] < min_rows:
+            slices[-1] = (slices[-1][0], slices[-1][1] + length)
+        else:
+            slices.append((offset, length))
+    return slices
+
+
+def daily_slices(index: pd.Index) -> List[Tuple[int, int]]:
+    """split a sorted datetime index into (offset, length) of every day"""
+    if len(index) == 0 or not is_datetime64_any_dtype(index.dtype):
+        return [(0, len(index))]
+    days = index.asi8 // (24 * 3600 * 10**9)
+    offsets = [0, *(np.flatnonzero(np.diff(days)) + 1), len(index)]
+    return [(int(a), int(b - a)) for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+def overlapped_row_groups(
+    parquet_file: pq.ParquetFile,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+) -> List[int]:
+    """the row groups whose datetime index may be in ``[start, end]``"""
+    index_name = parquet_file.schema_arrow.pandas_metadata["index_columns"][0]
+    field = parquet_file.schema_arrow.field(index_name)
+    column = parquet_file.schema_arrow.get_field_index(index_name)
+    # statistics are the raw int64 values in the unit of the timestamp column
+    factor = {"s": 10**9, "ms": 10**6, "us": 10**3, "ns": 1}[field.type.unit]
+    lower = -(2**63) if start is None else Timestamp(start).value // factor
+    upper = 2**63 - 1 if end is None else Timestamp(end).value // factor
+
+    row_groups = []
+    for i in range(parquet_file.num_row_groups):
+        stats = parquet_file.metadata.row_group(i).column(column).statistics
+        if stats is None or not stats.has_min_max:
+            row_groups.append(i)
+        elif stats.max_raw >= lower and stats.min_raw <= upper:
+            row_groups.append(i)
+    return row_groups
+
+
+def to_milliseconds(table: pa.Table) -> pa.Table:
+    """store timestamps as epoch milliseconds if no value has a sub-millisecond part"""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_timestamp(field.type) and field.type.unit == "ns":
+            try:
+                column = table.column(i).cast(pa.timestamp("ms", field.type.tz))
+            except pa.ArrowInvalid:
+                continue
+            table = table.set_column(i, field.with_type(column.type), column)
+    return table
+
+
+def _to_nanoseconds(values):
+    dtype = values.dtype
+    unit = getattr(dtype, "unit", None) or np.datetime_data(dtype)[0]
+    if unit == "ns":
+        return values
+    tz = getattr(dtype, "tz", None)
+    return values.astype("datetime64[ns]" if tz is None else f"datetime64[ns, {tz}]")
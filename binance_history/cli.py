@@ -1,14 +1,98 @@
+import functools
+import re
 import sys
+from pathlib import Path
 
 import click
-from loguru import logger
 
-from .api import fetch_data
-from .constants import TIMEFRAMES
-from .utils import unify_datetime
+from . import config
+from .constants import EXPORT_FORMATS, TIMEFRAMES
 
+# pandas, httpx, pyarrow and loguru are imported by the commands when they run,
+# so ``bh --help`` and argument errors return without importing them
 
-@click.command()
+
+class LazyLogger:
+    """``loguru.logger`` imported on first use"""
+
+    def __getattr__(self, name):
+        from loguru import logger
+
+        return getattr(logger, name)
+
+
+logger = LazyLogger()
+
+
+def catch_errors(func):
+    """log the uncaught exception of a command and exit with 1, like ``logger.catch``"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            logger.exception(f"An error has been caught in function '{func.__name__}'")
+            sys.exit(1)
+
+    return wrapper
+
+
+def create_client(**kwargs):
+    """``binance_history.session.create_client`` imported on first use"""
+    from .session import create_client
+
+    return create_client(**kwargs)
+
+
+class DefaultGroup(click.Group):
+    """run the ``fetch`` command if no command is given, e.g. ``bh --symbol BTCUSDT ...``"""
+
+    default_command = "fetch"
+
+    def parse_args(self, ctx, args):
+        # the options of the group itself, e.g. ``bh --profile --symbol BTCUSDT ...``
+        i = 0
+        while i < len(args) and args[i] in ["--profile", "--metrics-file"]:
+            i += 1 if args[i] == "--profile" else 2
+        rest = args[i:]
+        if rest and rest[0] not in self.commands and rest[0] != "--help":
+            args = [*args[:i], self.default_command, *rest]
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultGroup)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print the seconds spent in every stage, the downloaded bytes, parsed rows "
+    "and cache hits of the command to stderr",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the metrics of the command to this file in the Prometheus text format",
+)
+@click.pass_context
+def main(ctx, profile, metrics_file):
+    """Fetch binance public data, the fetch command runs if no command is given."""
+    if not profile and metrics_file is None:
+        return
+    from . import metrics
+
+    stats = ctx.with_resource(metrics.collect())
+
+    def report():
+        if profile:
+            click.echo(stats.format(), err=True)
+        if metrics_file is not None:
+            Path(metrics_file).write_text(metrics.to_prometheus(stats))
+
+    ctx.call_on_close(report)
+
+
+@main.command()
 @click.option(
     "--symbol", required=True, help="The binance market pair name, e.g. BTCUSDT"
 )
@@ -37,14 +121,89 @@ from .utils import unify_datetime
     default=None,
     help="The tz database name of time zone, use your local time zone if omitted'",
 )
+@click.option(
+    "--max-concurrency",
+    type=click.IntRange(min=1),
+    default=None,
+    help="The maximum number of archives downloaded in parallel, "
+    "default to binance_history.config.MAX_CONCURRENCY",
+)
+@click.option(
+    "--http2/--no-http2",
+    default=None,
+    help="Use HTTP/2 to download data, it requires the 'h2' package, "
+    "default to binance_history.config.HTTP2",
+)
+@click.option(
+    "--data-url",
+    default=None,
+    help="Download archives from a mirror of data.binance.vision, or a local directory",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Never access the network, only use the cached data",
+)
 @click.option(
     "--output-path",
-    help="The path you want to save the downloaded data, support format: [csv, json, xlsx], e.g. a.xlsx",
+    help="The path you want to save the downloaded data, support format: "
+    "[csv, json, xlsx, parquet, feather], e.g. a.xlsx",
     required=True,
 )
-@logger.catch(onerror=lambda _: sys.exit(1))
-def main(data_type, asset_type, symbol, timeframe, start, end, tz, output_path):
-    df = fetch_data(
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["json", "xlsx", *EXPORT_FORMATS]),
+    default=None,
+    help="The format of the output, default to the extension name of --output-path, "
+    "'partitioned' writes a directory of parquet files by symbol and date",
+)
+@click.option(
+    "--compression",
+    default=None,
+    help="The compression codec of csv (gzip, bz2, xz), parquet (snappy, zstd, gzip, "
+    "brotli, lz4, none) or feather (lz4, zstd, uncompressed) output",
+)
+@catch_errors
+def fetch(
+    data_type,
+    asset_type,
+    symbol,
+    timeframe,
+    start,
+    end,
+    tz,
+    max_concurrency,
+    http2,
+    data_url,
+    offline,
+    output_path,
+    output_format,
+    compression,
+):
+    """
+    Download data of [start, end] to a file. Csv, parquet, feather and partitioned
+    outputs are written archive by archive, other formats are written at once.
+    """
+    from .api import fetch_data, iter_data
+    from .export import get_exporter
+    from .utils import unify_datetime
+
+    if output_format is None:
+        ext = output_path.split(".")[-1]
+        if ext not in ["json", "xlsx", *EXPORT_FORMATS]:
+            raise ValueError(f"not support extension name: {ext}")
+        output_format = ext
+    exporter = None
+    if output_format in EXPORT_FORMATS:
+        exporter = get_exporter(output_format, compression)
+    elif compression is not None:
+        raise ValueError(f"{output_format} output can't be compressed")
+
+    config.OFFLINE = offline
+    if data_url is not None:
+        config.DATA_URL = data_url
+    kwargs = dict(
         data_type=data_type,
         asset_type=asset_type,
         symbol=symbol,
@@ -52,17 +211,347 @@ def main(data_type, asset_type, symbol, timeframe, start, end, tz, output_path):
         start=unify_datetime(start),
         end=unify_datetime(end),
         tz=tz,
+        max_concurrency=max_concurrency or config.MAX_CONCURRENCY,
     )
-    ext = output_path.split(".")[-1]
+    with create_client(http2=http2) as client:
+        if exporter is not None:
+            chunks = iter_data(**kwargs, client=client)
+            rows = exporter.write_chunks(
+                Path(output_path), chunks, symbol.upper().replace("/", "")
+            )
+            logger.info(f"{rows} rows written to {output_path}")
+            return
+        df = fetch_data(**kwargs, client=client)
 
-    if ext == "csv":
-        df.to_csv(output_path)
-    elif ext == "json":
+    if output_format == "json":
         df.to_json(output_path, orient="records")
-    elif ext == "xlsx":
+    else:
         df.index = df.index.tz_convert(None)
         if "close_datetime" in df.columns:
             df["close_datetime"] = df.close_datetime.dt.tz_convert(None)
         df.to_excel(output_path)
-    else:
-        raise ValueError(f"not support extension name: {ext}")
+
+
+@main.command()
+@click.option(
+    "--symbol", required=True, help="The binance market pair name, e.g. BTCUSDT"
+)
+@click.option(
+    "--start",
+    default=None,
+    help="The first day to sync (UTC), required by the first sync of the dataset",
+)
+@click.option(
+    "--end", default=None, help="The last day to sync (UTC), default to yesterday"
+)
+@click.option(
+    "--data-type",
+    type=click.Choice(["klines", "aggTrades"]),
+    default="klines",
+    help="choose klines or aggTrades to sync, default to 'klines'",
+)
+@click.option(
+    "--asset-type",
+    type=click.Choice(["spot", "futures/um", "futures/cm"]),
+    default="spot",
+    help="choose spot or futures data, default to 'spot'",
+)
+@click.option(
+    "--timeframe",
+    default="1m",
+    type=click.Choice(TIMEFRAMES),
+    help="The timeframe of klines, default to '1m'",
+)
+@click.option(
+    "--max-concurrency",
+    type=click.IntRange(min=1),
+    default=None,
+    help="The maximum number of archives downloaded in parallel, "
+    "default to binance_history.config.MAX_CONCURRENCY",
+)
+@click.option(
+    "--http2/--no-http2",
+    default=None,
+    help="Use HTTP/2 to download data, it requires the 'h2' package, "
+    "default to binance_history.config.HTTP2",
+)
+@click.option(
+    "--data-url",
+    default=None,
+    help="Download archives from a mirror of data.binance.vision, or a local directory",
+)
+@catch_errors
+def sync(
+    symbol,
+    start,
+    end,
+    data_type,
+    asset_type,
+    timeframe,
+    max_concurrency,
+    http2,
+    data_url,
+):
+    """Download the archives published since the last sync to the cache."""
+    from .syncing import sync as sync_dataset
+
+    if data_url is not None:
+        config.DATA_URL = data_url
+    with create_client(http2=http2) as client:
+        result = sync_dataset(
+            symbol,
+            data_type=data_type,
+            asset_type=asset_type,
+            timeframe=timeframe,
+            start=start,
+            end=end,
+            max_concurrency=max_concurrency,
+            client=client,
+        )
+    logger.info(
+        f"synced until {result.synced_until.date()}, "
+        f"{len(result.downloaded)} archives downloaded, "
+        f"{len(result.compacted)} monthly archives compacted"
+    )
+
+
+@main.command()
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--max-concurrency",
+    type=click.IntRange(min=1),
+    default=None,
+    help="The maximum number of archives downloaded in parallel, "
+    "default to binance_history.config.MAX_CONCURRENCY",
+)
+@click.option(
+    "--http2/--no-http2",
+    default=None,
+    help="Use HTTP/2 to download data, it requires the 'h2' package, "
+    "default to binance_history.config.HTTP2",
+)
+@click.option(
+    "--data-url",
+    default=None,
+    help="Download archives from a mirror of data.binance.vision, or a local directory",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Never access the network, only use the cached data",
+)
+@click.option(
+    "--state",
+    "state_path",
+    default=None,
+    help="The file recording the finished jobs, default to the manifest path with "
+    "a '.state' suffix",
+)
+@click.option(
+    "--restart",
+    is_flag=True,
+    help="Run the finished jobs again instead of resuming",
+)
+@catch_errors
+def batch(manifest, max_concurrency, http2, data_url, offline, state_path, restart):
+    """
+    Run the jobs of a yaml, json or csv manifest in one process. Each job downloads
+    a dataset of [start, end] to the cache, and writes it to its output_path if it's
+    given. Finished jobs are skipped when the manifest is run again.
+    """
+    from .batch import load_jobs, run_jobs
+
+    jobs = load_jobs(Path(manifest))
+    state_path = Path(state_path or manifest + ".state")
+    if restart:
+        state_path.unlink(missing_ok=True)
+    config.OFFLINE = offline
+    if data_url is not None:
+        config.DATA_URL = data_url
+
+    def report(i, result):
+        prefix = f"[{i + 1}/{len(jobs)}] {result.job}"
+        if result.ok:
+            logger.info(
+                f"{prefix}: {result.archives} archives, "
+                f"{result.downloaded} downloaded, {result.rows} rows written"
+            )
+        else:
+            logger.error(f"{prefix}: failed by {result.error}")
+
+    with create_client(http2=http2) as client:
+        results = run_jobs(
+            jobs,
+            max_concurrency=max_concurrency,
+            client=client,
+            state_path=state_path,
+            on_result=report,
+        )
+    failed = sum(not result.ok for result in results)
+    logger.info(
+        f"{len(results) - failed} jobs finished, {failed} failed, "
+        f"{len(jobs) - len(results)} skipped as finished before"
+    )
+    if failed:
+        sys.exit(1)
+
+
+def parse_size(size: str) -> int:
+    """parse a number of bytes like ``"500M"`` or ``"10GB"``"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMGT]?)B?", size.strip().upper())
+    if match is None:
+        raise click.BadParameter(f"invalid size: {size}")
+    return int(float(match[1]) * 1024 ** " KMGT".index(match[2] or " "))
+
+
+def format_size(size: int) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{size}B"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+@main.group()
+def cache():
+    """Manage the cached data."""
+
+
+@cache.command()
+@click.option("--symbol", default=None, help="Only compact this market pair")
+@click.option(
+    "--data-type",
+    type=click.Choice(["klines", "aggTrades"]),
+    default=None,
+    help="Only compact klines or aggTrades",
+)
+@click.option(
+    "--asset-type",
+    type=click.Choice(["spot", "futures/um", "futures/cm"]),
+    default=None,
+    help="Only compact spot or futures data",
+)
+@click.option(
+    "--verify",
+    is_flag=True,
+    help="Compare the merged data with the official monthly archive if it's published",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Never access the network",
+)
+@catch_errors
+def compact(symbol, data_type, asset_type, verify, offline):
+    """Merge the cached daily archives of complete months into monthly archives."""
+    from .compact import compact as compact_cache
+
+    config.OFFLINE = offline
+    with create_client() as client:
+        compacted = compact_cache(
+            symbol, data_type, asset_type, verify=verify, client=client
+        )
+    logger.info(f"{len(compacted)} monthly archives compacted")
+
+
+def filter_options(func):
+    """the options selecting datasets of the ``cache`` commands"""
+    options = [
+        click.option("--symbol", default=None, help="Only this market pair"),
+        click.option(
+            "--data-type",
+            type=click.Choice(["klines", "aggTrades"]),
+            default=None,
+            help="Only klines or aggTrades",
+        ),
+        click.option(
+            "--asset-type",
+            type=click.Choice(["spot", "futures/um", "futures/cm"]),
+            default=None,
+            help="Only spot or futures data",
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+@cache.command()
+@filter_options
+@catch_errors
+def ls(symbol, data_type, asset_type):
+    """List the cached files from the least recently used one."""
+    from .manager import list_cache
+
+    files = list_cache(symbol, data_type, asset_type)
+    for row in files.itertuples():
+        click.echo(
+            f"{row.accessed_at:%Y-%m-%d %H:%M:%S}  {format_size(row.size):>9}  {row.path}"
+        )
+
+
+@cache.command()
+@filter_options
+@click.option(
+    "--by",
+    type=click.Choice(["asset_type", "data_type", "symbol", "timeframe", "format"]),
+    multiple=True,
+    help="Group the usage by these fields, default to asset_type, data_type and symbol",
+)
+@catch_errors
+def du(symbol, data_type, asset_type, by):
+    """Show the disk usage of the cache."""
+    import pandas as pd
+
+    from .manager import disk_usage
+
+    by = by or ("asset_type", "data_type", "symbol")
+    usage = disk_usage(
+        by, symbol=symbol, data_type=data_type, asset_type=asset_type
+    ).reset_index()
+    for row in usage.itertuples(index=False):
+        group = "/".join("-" if pd.isna(v) else str(v) for v in row[: len(by)])
+        click.echo(f"{format_size(row.size):>9}  {row.files:>6} files  {group}")
+    click.echo(
+        f"{format_size(usage['size'].sum()):>9}  {usage.files.sum():>6} files  total"
+    )
+
+
+@cache.command()
+@click.option(
+    "--max-size",
+    default=None,
+    callback=lambda ctx, param, value: None if value is None else parse_size(value),
+    help="Remove the least recently used files until the cache takes at most this size, e.g. 10GB",
+)
+@click.option(
+    "--max-age",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Remove the files not used for more than this number of days",
+)
+@click.option("--dry-run", is_flag=True, help="Only show the files to remove")
+def prune(max_size, max_age, dry_run):
+    """Evict files from the cache."""
+    # a usage error must not be caught by ``catch_errors``, click exits with 2
+    if max_size is None and max_age is None:
+        max_size = config.CACHE_MAX_BYTES
+        if max_size is None:
+            raise click.UsageError("--max-size or --max-age is required")
+    prune_files(max_size, max_age, dry_run)
+
+
+@catch_errors
+def prune_files(max_size, max_age, dry_run):
+    from .manager import prune as prune_cache
+
+    removed = prune_cache(
+        max_bytes=max_size,
+        max_age=None if max_age is None else max_age * 24 * 3600,
+        dry_run=dry_run,
+    )
+    for entry in removed:
+        click.echo(entry.path)
+    size = format_size(sum(entry.size for entry in removed))
+    verb = "would be removed" if dry_run else "removed"
+    logger.info(f"{len(removed)} files ({size}) {verb}")
@@ -0,0 +1,125 @@
+import warnings
+from typing import Dict, List, NamedTuple, Optional
+
+import httpx
+import pandas as pd
+from pandas import Timestamp
+
+from . import config
+from .manager import CACHE_PATH_PATTERN, relative_path
+from .utils import (
+    download_data,
+    exists_month,
+    gen_data_url,
+    is_data_on_disk,
+    load_data_from_disk,
+    merge_data_on_disk,
+    remove_data_from_disk,
+    save_data_to_disk,
+)
+
+
+class Dataset(NamedTuple):
+    data_type: str
+    asset_type: str
+    symbol: str
+    timeframe: Optional[str]
+
+
+def cached_daily_archives(
+    symbol: Optional[str] = None,
+    data_type: Optional[str] = None,
+    asset_type: Optional[str] = None,
+) -> Dict[Dataset, List[Timestamp]]:
+    """the sorted dates of the cached daily archives of every dataset"""
+    datasets: Dict[Dataset, set] = {}
+    for path in (config.CACHE_DIR / "data").glob("**/daily/**/*.*"):
+        match = CACHE_PATH_PATTERN.match(relative_path(path))
+        if match is None or match["freq"] != "daily":
+            continue
+        dataset = Dataset(
+            match["data_type"], match["asset_type"], match["symbol"], match["timeframe"]
+        )
+        if (
+            (symbol is None or dataset.symbol == symbol.upper().replace("/", ""))
+            and (data_type is None or dataset.data_type == data_type)
+            and (asset_type is None or dataset.asset_type == asset_type)
+        ):
+            datasets.setdefault(dataset, set()).add(Timestamp(match["date"]))
+    return {dataset: sorted(dates) for dataset, dates in datasets.items()}
+
+
+def compact_month(
+    dataset: Dataset,
+    month: Timestamp,
+    verify: bool = False,
+    client: Optional[httpx.Client] = None,
+    engine: Optional[str] = None,
+) -> bool:
+    """
+    Merge the cached daily archives of ``month`` into the cache of its monthly archive,
+    it's only done if every day of the month is cached. If ``verify`` is True and the
+    official monthly archive is published, it's downloaded and replaces the merged
+    archives if they differ. The daily archives are removed once the monthly archive
+    is cached, return whether it's cached.
+    """
+    data_type, asset_type, symbol, timeframe = dataset
+    month_url = gen_data_url(data_type, asset_type, "monthly", symbol, month, timeframe)
+    days = pd.date_range(month, month + pd.offsets.MonthEnd())
+    daily_urls = [
+        gen_data_url(data_type, asset_type, "daily", symbol, day, timeframe)
+        for day in days
+    ]
+
+    if not is_data_on_disk(month_url):
+        if not all(map(is_data_on_disk, daily_urls)):
+            return False
+        merge_data_on_disk(daily_urls, month_url)
+        if verify and not config.OFFLINE and exists_month(month_url, client):
+            official = download_data(data_type, month_url, client, engine)
+            if not official.equals(load_data_from_disk(month_url)):
+                warnings.warn(
+                    f"the cached daily archives differ from {month_url}, "
+                    f"it's cached instead"
+                )
+                save_data_to_disk(month_url, official)
+
+    for url in daily_urls:
+        remove_data_from_disk(url)
+    return True
+
+
+def compact(
+    symbol: Optional[str] = None,
+    data_type: Optional[str] = None,
+    asset_type: Optional[str] = None,
+    verify: bool = False,
+    client: Optional[httpx.Client] = None,
+    engine: Optional[str] = None,
+) -> List[str]:
+    """
+    Merge the cached daily archives of every complete month into one monthly
+    cache entry, see ``compact_month``. Only the datasets matching ``symbol``,
+    ``data_type`` and ``asset_type`` are compacted if they are given.
+
+    :return: The urls of the monthly archives which are cached now.
+    """
+    current_month = Timestamp.now("UTC").tz_localize(None).normalize().replace(day=1)
+    compacted = []
+    for dataset, dates in cached_daily_archives(symbol, data_type, asset_type).items():
+        months = sorted({dt.replace(day=1) for dt in dates})
+        for month in months:
+            if month < current_month and compact_month(
+                dataset, month, verify, client, engine
+            ):
+                compacted.append(
+                    gen_data_url(
+                        dataset.data_type,
+                        dataset.asset_type,
+                        "monthly",
+                        dataset.symbol,
+                        month,
+                        dataset.timeframe,
+                    )
+                )
+    return compacted
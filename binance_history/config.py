@@ -1,3 +1,81 @@
 from pathlib import Path
 
 CACHE_DIR = Path.home() / ".binance-history"
+
+# the root url of the archives, e.g. an http(s) mirror of data.binance.vision, or a
+# ``file://`` url (or the path) of a local directory with the same layout
+DATA_URL = "https://data.binance.vision/"
+
+# default number of archives downloaded in parallel by ``fetch_data``
+MAX_CONCURRENCY = 8
+
+# settings of the shared http client, see ``binance_history.session``
+HTTP2 = False
+TIMEOUT = 30.0
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+
+# a request failed by a network error or a transient status (e.g. 503) is retried up to
+# ``RETRIES`` times, waiting a random time up to ``BACKOFF_FACTOR * 2 ** attempt`` seconds
+# (or the ``Retry-After`` header), which is capped at ``BACKOFF_MAX``
+RETRIES = 5
+BACKOFF_FACTOR = 0.5
+BACKOFF_MAX = 60.0
+
+# monthly archives larger than this many bytes are downloaded by ``DOWNLOAD_CONNECTIONS``
+# ranged requests in parallel, archives are downloaded by one request if None
+PARALLEL_DOWNLOAD_SIZE = 64 * 1024**2
+DOWNLOAD_CONNECTIONS = 4
+
+# called as ``PROGRESS_HOOK(url, downloaded_bytes, total_bytes)`` while an archive is
+# downloaded, ``total_bytes`` is None if it's unknown
+PROGRESS_HOOK = None
+
+# called as ``METRICS_HOOK(name, value)`` by every timed stage, e.g. ("download_seconds",
+# 1.5), and every counter increment, e.g. ("downloaded_bytes", 65536), see
+# ``binance_history.metrics``
+METRICS_HOOK = None
+
+# the maximum number of requests per second sent by all threads, unlimited if None
+RATE_LIMIT = None
+
+# the file format of cached archives, "parquet" or "pickle", see ``binance_history.cache``,
+# only parquet files are read by column, by time range and chunk by chunk
+CACHE_FORMAT = "parquet"
+
+# the days of a cached parquet archive are written to row groups of at least this many
+# rows, row groups out of a requested time range are not read
+PARQUET_ROW_GROUP_ROWS = 128 * 1024
+
+# downcast the numeric columns of cached parquet files to 32 bits where it's lossless and
+# store datetimes as int64 epoch milliseconds, they are upcasted again when read
+PARQUET_COMPACT_DTYPES = True
+
+# keep the raw zip archives under ``CACHE_DIR / "archives"`` after they are parsed,
+# so the cache can be rebuilt (e.g. in another format) without downloading again
+KEEP_ARCHIVES = False
+
+# compare the sha256 of downloaded archives with their published ``.CHECKSUM`` files
+VERIFY_CHECKSUM = True
+
+# the default csv parser of archives, "c" (pandas) or "pyarrow"
+CSV_ENGINE = "c"
+
+# whether an archive exists is remembered in ``CACHE_DIR / "index.sqlite"``,
+# an archive found missing is probed again after ``AVAILABILITY_TTL`` seconds
+AVAILABILITY_TTL = 6 * 3600
+
+# never access the network, only the cached data and the availability index are used
+OFFLINE = False
+
+# evict the least recently used files of ``CACHE_DIR`` once they take more bytes
+# than this, see ``binance_history.manager``, the cache is unbounded if None
+CACHE_MAX_BYTES = None
+
+# reading a cached file only updates its access time, which orders the files evicted
+# by ``CACHE_MAX_BYTES``, once it's older than this many seconds
+ACCESS_TIME_RESOLUTION = 3600
+
+# keep up to this many bytes of recently used archives in memory, so reading them
+# again in the same process is free, see ``binance_history.memo``, 0 disables it
+MEMORY_CACHE_MAX_BYTES = 0
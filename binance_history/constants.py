@@ -16,3 +16,6 @@ TIMEFRAMES = [
     "1w",
     "1M",
 ]
+
+# the formats written chunk by chunk by ``binance_history.export``
+EXPORT_FORMATS = ["csv", "parquet", "feather", "partitioned"]
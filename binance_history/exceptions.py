@@ -4,3 +4,7 @@ class NetworkError(Exception):
 
 class DataNotFound(Exception):
     pass
+
+
+class ChecksumError(NetworkError):
+    pass
@@ -0,0 +1,172 @@
+import bz2
+import gzip
+import lzma
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Type
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+from .cache import atomic_write
+
+
+class Exporter:
+    """
+    Writes data given as consecutive chunks to ``path`` one by one, so the exported
+    data is never held in memory at once. Files are written by ``atomic_write``.
+    ``compression`` must be one of ``compressions``, None uses the first one.
+    """
+
+    name: str
+    compressions: Tuple[Optional[str], ...]
+
+    def __init__(self, compression: Optional[str] = None):
+        if compression is None:
+            compression = self.compressions[0]
+        if compression not in self.compressions:
+            raise ValueError(
+                f"compression of {self.name} must be one of {list(self.compressions)}, "
+                f"but got '{compression}'"
+            )
+        self.compression = compression
+
+    def write_chunks(
+        self, path: Path, chunks: Iterable[DataFrame], symbol: Optional[str] = None
+    ) -> int:
+        """
+        Write ``chunks`` of the data of ``symbol`` to ``path``, return the number of
+        written rows. Nothing is written if there is no chunk.
+        """
+        raise NotImplementedError
+
+
+class CsvExporter(Exporter):
+    name = "csv"
+    compressions = (None, "gzip", "bz2", "xz")
+    openers = {None: open, "gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+    def write_chunks(
+        self, path: Path, chunks: Iterable[DataFrame], symbol: Optional[str] = None
+    ) -> int:
+        rows = 0
+        with atomic_write(path) as tmp_path:
+            f = None
+            try:
+                for chunk in chunks:
+                    if f is None:
+                        f = self.openers[self.compression](tmp_path, "wt", newline="")
+                    chunk.to_csv(f, header=rows == 0)
+                    rows += len(chunk)
+            finally:
+                if f is not None:
+                    f.close()
+        return rows
+
+
+class ParquetExporter(Exporter):
+    name = "parquet"
+    compressions = ("snappy", "zstd", "gzip", "brotli", "lz4", "none")
+
+    def write_chunks(
+        self, path: Path, chunks: Iterable[DataFrame], symbol: Optional[str] = None
+    ) -> int:
+        rows = 0
+        writer = None
+        with atomic_write(path) as tmp_path:
+            try:
+                for chunk in chunks:
+                    table = pa.Table.from_pandas(chunk, preserve_index=True)
+                    if writer is None:
+                        writer = pq.ParquetWriter(
+                            tmp_path, table.schema, compression=self.compression
+                        )
+                    else:
+                        table = table.cast(writer.schema)
+                    writer.write_table(table)
+                    rows += len(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
+        return rows
+
+
+class FeatherExporter(Exporter):
+    """the feather (Arrow IPC) file format, which can be memory-mapped by readers"""
+
+    name = "feather"
+    compressions = ("lz4", "zstd", "uncompressed")
+
+    def write_chunks(
+        self, path: Path, chunks: Iterable[DataFrame], symbol: Optional[str] = None
+    ) -> int:
+        rows = 0
+        writer = schema = None
+        compression = None if self.compression == "uncompressed" else self.compression
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with atomic_write(path) as tmp_path:
+            try:
+                for chunk in chunks:
+                    table = pa.Table.from_pandas(chunk, preserve_index=True)
+                    if writer is None:
+                        schema = table.schema
+                        writer = pa.ipc.new_file(str(tmp_path), schema, options=options)
+                    else:
+                        table = table.cast(schema)
+                    writer.write_table(table)
+                    rows += len(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
+        return rows
+
+
+class PartitionedExporter(Exporter):
+    """
+    A directory of parquet files partitioned by the symbol and the date in the time
+    zone of the data, e.g. ``path/symbol=BTCUSDT/date=2022-01-02/part-00000.parquet``,
+    as read by Spark, pyarrow datasets, etc. The parquet files in a partition which
+    is written are removed first, so an export can be run again.
+    """
+
+    name = "partitioned"
+    compressions = ParquetExporter.compressions
+
+    def write_chunks(
+        self, path: Path, chunks: Iterable[DataFrame], symbol: Optional[str] = None
+    ) -> int:
+        rows = 0
+        # the number of files written to every partition
+        partitions: Dict[Path, int] = {}
+        parquet = ParquetExporter(self.compression)
+        for chunk in chunks:
+            for day, rows_of_day in chunk.groupby(chunk.index.normalize(), sort=False):
+                date = day.strftime("%Y-%m-%d")
+                partition = path / f"date={date}"
+                if symbol is not None:
+                    partition = path / f"symbol={symbol}" / f"date={date}"
+                if partition not in partitions:
+                    partitions[partition] = 0
+                    partition.mkdir(parents=True, exist_ok=True)
+                    for old in partition.glob("*.parquet"):
+                        old.unlink()
+                file_path = partition / f"part-{partitions[partition]:05d}.parquet"
+                partitions[partition] += 1
+                rows += parquet.write_chunks(file_path, [rows_of_day])
+        return rows
+
+
+EXPORTERS: Dict[str, Type[Exporter]] = {
+    CsvExporter.name: CsvExporter,
+    ParquetExporter.name: ParquetExporter,
+    FeatherExporter.name: FeatherExporter,
+    PartitionedExporter.name: PartitionedExporter,
+}
+
+
+def get_exporter(name: str, compression: Optional[str] = None) -> Exporter:
+    """return the exporter of the format ``name``"""
+    try:
+        return EXPORTERS[name](compression)
+    except KeyError:
+        raise ValueError(f"format must be one of {list(EXPORTERS)}, but got '{name}'")
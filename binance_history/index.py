@@ -0,0 +1,181 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set
+
+from . import config
+from .source import archive_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    path TEXT PRIMARY KEY,
+    available INTEGER NOT NULL,
+    size INTEGER,
+    checksum TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    key TEXT PRIMARY KEY,
+    start TEXT NOT NULL,
+    synced_until TEXT NOT NULL,
+    daily_from TEXT,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+"""
+
+
+class ArchiveInfo(NamedTuple):
+    path: str
+    available: bool
+    size: Optional[int]
+    checksum: Optional[str]
+    checked_at: float
+
+    @property
+    def expired(self) -> bool:
+        """published archives never change, only a missing archive expires"""
+        return (
+            not self.available
+            and time.time() - self.checked_at > config.AVAILABILITY_TTL
+        )
+
+
+class DatasetInfo(NamedTuple):
+    key: str
+    # the first and the last day of the synced archives
+    start: str
+    synced_until: str
+    # the first day of the daily archives not compacted into monthly archives yet
+    daily_from: Optional[str]
+    synced_at: float
+
+
+# the indexes whose tables were created by this process
+_initialized: Set[Path] = set()
+
+
+def get_index_path(cache_dir: Optional[Path] = None) -> Path:
+    return (config.CACHE_DIR if cache_dir is None else cache_dir) / "index.sqlite"
+
+
+@contextmanager
+def connect(cache_dir: Optional[Path] = None) -> Iterator[sqlite3.Connection]:
+    """
+    connect to the index under ``cache_dir``, default to ``config.CACHE_DIR``, it is
+    shared by processes
+    """
+    path = get_index_path(cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # the tables are created once per process, or again if the index was removed
+    created = not path.exists()
+    conn = sqlite3.connect(path, timeout=60)
+    try:
+        if created or path not in _initialized:
+            conn.executescript(SCHEMA)
+            _initialized.add(path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def lookup(url: str) -> Optional[ArchiveInfo]:
+    """return what is known about the archive at ``url``, None if it was never checked"""
+    with connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM archives WHERE path = ?", ("/" + archive_key(url),)
+        ).fetchone()
+    if row is None:
+        return None
+    return ArchiveInfo(row[0], bool(row[1]), *row[2:])
+
+
+def record(
+    url: str,
+    available: bool,
+    size: Optional[int] = None,
+    checksum: Optional[str] = None,
+) -> None:
+    """remember whether the archive at ``url`` exists, known size and checksum are kept"""
+    with connect() as conn:
+        conn.execute(
+            """
+            INSERT INTO archives VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (path) DO UPDATE SET
+                available = excluded.available,
+                size = COALESCE(excluded.size, size),
+                checksum = COALESCE(excluded.checksum, checksum),
+                checked_at = excluded.checked_at
+            """,
+            ("/" + archive_key(url), available, size, checksum, time.time()),
+        )
+
+
+def lookup_dataset(key: str) -> Optional[DatasetInfo]:
+    """return the sync state of the dataset ``key``, None if it was never synced"""
+    with connect() as conn:
+        row = conn.execute("SELECT * FROM datasets WHERE key = ?", (key,)).fetchone()
+    return None if row is None else DatasetInfo(*row)
+
+
+def record_dataset(
+    key: str, start: str, synced_until: str, daily_from: Optional[str]
+) -> None:
+    with connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?)",
+            (key, start, synced_until, daily_from, time.time()),
+        )
+
+
+class EntryInfo(NamedTuple):
+    # the path of a cached file relative to ``config.CACHE_DIR``
+    path: str
+    size: int
+    accessed_at: float
+
+
+def record_entries(entries: Iterable[EntryInfo]) -> None:
+    with connect() as conn:
+        conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", entries)
+
+
+def record_accesses(
+    entries: Iterable[EntryInfo], resolution: float, cache_dir: Optional[Path] = None
+) -> None:
+    """
+    record the access times of cached files, a stored access time is only updated if
+    it's older by at least ``resolution`` seconds
+    """
+    with connect(cache_dir) as conn:
+        conn.executemany(
+            """
+            INSERT INTO entries VALUES (?, ?, ?)
+            ON CONFLICT (path) DO UPDATE SET accessed_at = excluded.accessed_at
+            WHERE excluded.accessed_at - accessed_at >= ?
+            """,
+            ((*entry, resolution) for entry in entries),
+        )
+
+
+def remove_entries(paths: Iterable[str]) -> None:
+    with connect() as conn:
+        conn.executemany("DELETE FROM entries WHERE path = ?", ((p,) for p in paths))
+
+
+def list_entries() -> List[EntryInfo]:
+    """the cached files from the least recently used one"""
+    with connect() as conn:
+        rows = conn.execute("SELECT * FROM entries ORDER BY accessed_at").fetchall()
+    return [EntryInfo(*row) for row in rows]
+
+
+def total_size() -> int:
+    with connect() as conn:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
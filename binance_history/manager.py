@@ -0,0 +1,263 @@
+import atexit
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from pandas import DataFrame
+
+from . import config, index
+from .index import EntryInfo
+
+# the relative path of a file in ``config.CACHE_DIR``, an archive cached in any
+# format, a raw zip archive kept under "archives", or the lock file of an archive
+# under "locks" (empty and never pruned), see ``utils.lock_archive``
+CACHE_PATH_PATTERN = re.compile(
+    r"^((?P<raw>archives/)|(?P<lock>locks/))?"
+    r"data/(?P<asset_type>spot|futures/um|futures/cm)"
+    r"/(?P<freq>daily|monthly)/(?P<data_type>klines|aggTrades)"
+    r"/(?P<symbol>[^/]+)(/(?P<timeframe>[^/]+))?"
+    r"/[^/]+-(?P<date>\d{4}-\d{2}(-\d{2})?)\.(?P<suffix>\w+)(?(lock)\.lock)$"
+)
+
+# the pickle cache of binance-history<=0.1.7 is saved to the path of the archive
+FORMATS = {"parquet": "parquet", "pkl": "pickle", "zip": "pickle"}
+
+# write the access times recorded by ``touch`` to the index once there are this many
+ACCESS_BATCH_SIZE = 64
+
+_prune_lock = threading.Lock()
+
+# guards the access times and the pinned files below
+_lock = threading.Lock()
+# the access times recorded by ``touch`` but not written to the index yet, by cache
+# directory and relative path
+_pending: Dict[Path, Dict[str, EntryInfo]] = defaultdict(dict)
+# the last access times recorded by this process, by cache directory and relative path
+_recorded: Dict[Tuple[Path, str], float] = {}
+# the relative paths of the files ``prune`` must not remove, see ``pin``
+_pinned: Counter = Counter()
+
+
+def relative_path(path: Path) -> str:
+    return Path(path).relative_to(config.CACHE_DIR).as_posix()
+
+
+def track(path: Path) -> None:
+    """
+    Record that the cached file ``path`` has just been written, then evict the least
+    recently used files if the cache is larger than ``config.CACHE_MAX_BYTES``.
+    """
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        return
+    entry = EntryInfo(relative_path(path), size, time.time())
+    index.record_entries([entry])
+    with _lock:
+        _pending[config.CACHE_DIR].pop(entry.path, None)
+        _recorded[config.CACHE_DIR, entry.path] = entry.accessed_at
+    max_bytes = config.CACHE_MAX_BYTES
+    if max_bytes is not None and index.total_size() > max_bytes:
+        prune(max_bytes=max_bytes, keep=[path], rescan=False)
+
+
+def touch(path: Path) -> None:
+    """
+    Record that the cached file ``path`` has just been read. Reads only update an access
+    time older than ``config.ACCESS_TIME_RESOLUTION`` seconds, and write them to the
+    index in batches, the cache is never pruned by reads.
+    """
+    key = (config.CACHE_DIR, relative_path(path))
+    now = time.time()
+    with _lock:
+        if now - _recorded.get(key, 0.0) < config.ACCESS_TIME_RESOLUTION:
+            return
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        return
+    with _lock:
+        _recorded[key] = now
+        pending = _pending[config.CACHE_DIR]
+        pending[key[1]] = EntryInfo(key[1], size, now)
+        if len(pending) < ACCESS_BATCH_SIZE:
+            return
+    flush()
+
+
+@atexit.register
+def flush() -> None:
+    """write the access times recorded by ``touch`` to the index"""
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    for cache_dir, entries in pending.items():
+        # the cache directory may have been removed since, e.g. a temporary one
+        if entries and cache_dir.is_dir():
+            index.record_accesses(
+                entries.values(), config.ACCESS_TIME_RESOLUTION, cache_dir
+            )
+
+
+def untrack(paths: Iterable[Path]) -> None:
+    names = [relative_path(path) for path in paths]
+    with _lock:
+        for name in names:
+            _pending[config.CACHE_DIR].pop(name, None)
+            _recorded.pop((config.CACHE_DIR, name), None)
+    index.remove_entries(names)
+
+
+@contextmanager
+def pin(path: Path) -> Iterator[None]:
+    """
+    ``prune`` doesn't remove the cached file ``path`` in the block, e.g. between writing
+    and opening it, though a ``prune`` in another process still may.
+    """
+    name = relative_path(path)
+    with _lock:
+        _pinned[name] += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _pinned[name] -= 1
+            if _pinned[name] == 0:
+                del _pinned[name]
+
+
+def scan() -> List[EntryInfo]:
+    """
+    Synchronize the index with the files in ``config.CACHE_DIR``, a file unknown to
+    the index is recorded with its modification time as its access time. Return the
+    cached files from the least recently used one.
+    """
+    flush()
+    known = {entry.path: entry for entry in index.list_entries()}
+    found = {}
+    for path in config.CACHE_DIR.glob("**/*"):
+        name = relative_path(path)
+        if CACHE_PATH_PATTERN.match(name) is None or not path.is_file():
+            continue
+        stat = path.stat()
+        accessed_at = known[name].accessed_at if name in known else stat.st_mtime
+        found[name] = EntryInfo(name, stat.st_size, accessed_at)
+
+    index.remove_entries(set(known) - set(found))
+    index.record_entries(e for e in found.values() if known.get(e.path) != e)
+    return sorted(found.values(), key=lambda entry: entry.accessed_at)
+
+
+def prune(
+    max_bytes: Optional[int] = None,
+    max_age: Optional[float] = None,
+    dry_run: bool = False,
+    keep: Sequence[Path] = (),
+    rescan: bool = True,
+) -> List[EntryInfo]:
+    """
+    Remove the cached files not used for more than ``max_age`` seconds, then the least
+    recently used files until the cache takes at most ``max_bytes``. Lock files are
+    listed by ``list_cache`` but never removed, a process waiting for a lock could
+    otherwise hold a removed one while another process creates it again.
+
+    :param dry_run: Only return the files which would be removed.
+    :param keep: The files which are never removed, nor the files pinned by ``pin``.
+    :param rescan: Scan ``config.CACHE_DIR`` for files unknown to the index first.
+    :return: The removed files.
+    """
+    with _prune_lock:
+        if rescan:
+            entries = scan()
+        else:
+            flush()
+            entries = index.list_entries()
+        with _lock:
+            keep = {relative_path(path) for path in keep} | set(_pinned)
+        total = sum(entry.size for entry in entries)
+        now = time.time()
+        removed = []
+        for entry in entries:
+            too_old = max_age is not None and now - entry.accessed_at > max_age
+            too_large = max_bytes is not None and total > max_bytes
+            if not too_old and not too_large:
+                break
+            if entry.path in keep or entry.path.startswith("locks/"):
+                continue
+            if not dry_run:
+                (config.CACHE_DIR / entry.path).unlink(missing_ok=True)
+            total -= entry.size
+            removed.append(entry)
+        if not dry_run:
+            index.remove_entries(entry.path for entry in removed)
+    return removed
+
+
+def list_cache(
+    symbol: Optional[str] = None,
+    data_type: Optional[str] = None,
+    asset_type: Optional[str] = None,
+) -> DataFrame:
+    """
+    List the cached files from the least recently used one, with the dataset and the
+    date of their archive, their format ("lock" for the lock file of an archive), size
+    in bytes and last access time.
+    """
+    columns = [
+        "path",
+        "asset_type",
+        "data_type",
+        "symbol",
+        "timeframe",
+        "freq",
+        "date",
+        "format",
+        "size",
+        "accessed_at",
+    ]
+    rows = []
+    for entry in scan():
+        match = CACHE_PATH_PATTERN.match(entry.path)
+        if (
+            (symbol is not None and match["symbol"] != symbol.upper().replace("/", ""))
+            or (data_type is not None and match["data_type"] != data_type)
+            or (asset_type is not None and match["asset_type"] != asset_type)
+        ):
+            continue
+        if match["lock"]:
+            fmt = "lock"
+        elif match["raw"]:
+            fmt = "zip"
+        else:
+            fmt = FORMATS.get(match["suffix"], match["suffix"])
+        row = {name: match[name] for name in columns[1:7]}
+        rows.append(
+            {
+                **row,
+                "path": entry.path,
+                "format": fmt,
+                "size": entry.size,
+                "accessed_at": pd.Timestamp(entry.accessed_at, unit="s", tz="UTC"),
+            }
+        )
+    return DataFrame(rows, columns=columns)
+
+
+def disk_usage(
+    by: Sequence[str] = ("asset_type", "data_type", "symbol"), **filters
+) -> DataFrame:
+    """
+    The number of files and bytes used by the cache grouped by the columns ``by`` of
+    ``list_cache``, ``filters`` are passed to ``list_cache``.
+    """
+    files = list_cache(**filters)
+    return (
+        files.groupby(list(by), dropna=False)
+        .agg(files=("path", "count"), size=("size", "sum"))
+        .sort_values("size", ascending=False)
+    )
@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from pandas import DataFrame
+
+from . import config
+
+
+class MemoryCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    entries: int
+    # the memory used by the cached dataframes in bytes
+    size: int
+
+
+class MemoryCache:
+    """
+    A thread-safe LRU cache of archive dataframes in UTC keyed by their url, it sits in
+    front of the disk cache so an archive read again in the same process is neither read
+    from disk nor parsed again. The least recently used dataframes are dropped once they
+    take more than ``config.MEMORY_CACHE_MAX_BYTES``, it's disabled if that is 0.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames: "OrderedDict[str, DataFrame]" = OrderedDict()
+        self._sizes = {}
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return config.MEMORY_CACHE_MAX_BYTES > 0
+
+    def get(self, url: str) -> Optional[DataFrame]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            df = self._frames.get(url)
+            if df is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._frames.move_to_end(url)
+            return df
+
+    def put(self, url: str, df: DataFrame) -> None:
+        size = int(df.memory_usage(index=True).sum())
+        max_bytes = config.MEMORY_CACHE_MAX_BYTES
+        if size > max_bytes:
+            return
+        with self._lock:
+            self._discard(url)
+            self._frames[url] = df
+            self._sizes[url] = size
+            self._size += size
+            while self._size > max_bytes:
+                self._discard(next(iter(self._frames)))
+
+    def discard(self, url: str) -> None:
+        with self._lock:
+            self._discard(url)
+
+    def clear(self) -> None:
+        """drop every dataframe and reset the statistics"""
+        with self._lock:
+            self._frames.clear()
+            self._sizes.clear()
+            self._size = 0
+            self.hits = self.misses = 0
+
+    def stats(self) -> MemoryCacheStats:
+        with self._lock:
+            return MemoryCacheStats(
+                self.hits, self.misses, len(self._frames), self._size
+            )
+
+    def _discard(self, url: str) -> None:
+        if url in self._frames:
+            del self._frames[url]
+            self._size -= self._sizes.pop(url)
+
+
+MEMORY_CACHE = MemoryCache()
+
+
+def clear() -> None:
+    """clear the memory cache shared by the process"""
+    MEMORY_CACHE.clear()
+
+
+def stats() -> MemoryCacheStats:
+    """the hits, misses, number of entries and size of the shared memory cache"""
+    return MEMORY_CACHE.stats()
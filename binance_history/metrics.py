@@ -0,0 +1,207 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+from . import config
+
+T = TypeVar("T")
+
+# the stages timed by ``timer``, they may nest, e.g. the parsing of an archive saved to
+# the cache chunk by chunk is timed by both "parse" and "cache_write"
+STAGES = {
+    "probe": "find the archives covering the requested range (gen_dates)",
+    "download": "download a zip archive and verify its checksum",
+    "parse": "decompress and parse the csv file of an archive",
+    "cache_read": "read an archive from the disk cache",
+    "cache_write": "write an archive to the disk cache",
+    "concat": "concatenate and slice the archives",
+    "convert_tz": "convert the datetimes to the requested time zone",
+}
+
+# the counters incremented by ``count``
+COUNTERS = {
+    # by the clients of ``session.create_client``
+    "http_requests": "http requests sent, retries included",
+    "http_retries": "http requests retried after a network error or a transient status",
+    "downloaded_bytes": "bytes of archives downloaded",
+    "parsed_rows": "rows parsed from csv files",
+    "cache_hits": "archives read from the disk cache",
+    "cache_misses": "archives downloaded as they were not cached",
+    "memory_cache_hits": "archives read from the memory cache",
+}
+
+
+class Stats:
+    """
+    Thread-safe totals of the seconds and calls of every stage and of the counters,
+    see ``STAGES`` and ``COUNTERS``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    def add_count(self, name: str, n: int) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def clear(self) -> None:
+        with self._lock:
+            self.seconds.clear()
+            self.calls.clear()
+            self.counters.clear()
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "seconds": dict(self.seconds),
+                "calls": dict(self.calls),
+                "counters": dict(self.counters),
+            }
+
+    def format(self) -> str:
+        """a table of the stages and the counters, e.g. printed by ``bh --profile``"""
+        d = self.as_dict()
+        lines = [f"{'stage':<12} {'calls':>8} {'seconds':>10}"]
+        for stage in STAGES:
+            if stage in d["calls"]:
+                lines.append(
+                    f"{stage:<12} {d['calls'][stage]:>8} {d['seconds'][stage]:>10.3f}"
+                )
+        lines.append("")
+        for name in COUNTERS:
+            lines.append(f"{name:<20} {d['counters'].get(name, 0):>12}")
+        return "\n".join(lines)
+
+
+# the totals of the process, e.g. exported by ``to_prometheus``
+REGISTRY = Stats()
+
+# the ``Stats`` of the enclosing ``collect`` blocks
+_collectors: "contextvars.ContextVar[Tuple[Stats, ...]]" = contextvars.ContextVar(
+    "collectors", default=()
+)
+
+
+@contextmanager
+def collect() -> Iterator[Stats]:
+    """
+    Collect the metrics of the code in the block, including the tasks it submits to the
+    thread pools of binance-history, e.g. to find where a slow job spends its time::
+
+        with metrics.collect() as stats:
+            bh.fetch_klines("BTCUSDT", "2022-1-1", "2022-12-31")
+        print(stats.format())
+    """
+    stats = Stats()
+    token = _collectors.set((*_collectors.get(), stats))
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+class timer:
+    """time the block as ``stage``, see ``STAGES``"""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        seconds = time.perf_counter() - self.start
+        REGISTRY.add_time(self.stage, seconds)
+        for stats in _collectors.get():
+            stats.add_time(self.stage, seconds)
+        if config.METRICS_HOOK is not None:
+            config.METRICS_HOOK(f"{self.stage}_seconds", seconds)
+
+
+_done = object()
+
+
+def timed_iter(stage: str, iterator: Iterable[T]) -> Iterator[T]:
+    """time producing every item of a lazy iterator as ``stage``"""
+    iterator = iter(iterator)
+    while True:
+        with timer(stage):
+            item = next(iterator, _done)
+        if item is _done:
+            return
+        yield item
+
+
+def count(name: str, n: int = 1) -> None:
+    """increment the counter ``name`` by ``n``, see ``COUNTERS``"""
+    REGISTRY.add_count(name, n)
+    for stats in _collectors.get():
+        stats.add_count(name, n)
+    if config.METRICS_HOOK is not None:
+        config.METRICS_HOOK(name, n)
+
+
+class ContextExecutor(ThreadPoolExecutor):
+    """
+    A thread pool running every task in a copy of the context of its submitter, so the
+    metrics of the tasks are collected by the ``collect`` blocks around the submitter.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+def to_prometheus(stats: Optional[Stats] = None) -> str:
+    """
+    The metrics in the Prometheus text format, the totals of the process if ``stats``
+    is None, e.g. to be written to a file read by node_exporter's textfile collector.
+    """
+    d = (REGISTRY if stats is None else stats).as_dict()
+    lines = [
+        "# HELP binance_history_stage_seconds_total Seconds spent in every stage.",
+        "# TYPE binance_history_stage_seconds_total counter",
+    ]
+    for stage, seconds in d["seconds"].items():
+        lines.append(
+            f'binance_history_stage_seconds_total{{stage="{stage}"}} {seconds}'
+        )
+    lines += [
+        "# HELP binance_history_stage_calls_total Times every stage was run.",
+        "# TYPE binance_history_stage_calls_total counter",
+    ]
+    for stage, calls in d["calls"].items():
+        lines.append(f'binance_history_stage_calls_total{{stage="{stage}"}} {calls}')
+    for name, description in COUNTERS.items():
+        metric = f"binance_history_{name}_total"
+        lines += [
+            f"# HELP {metric} The {description}.",
+            f"# TYPE {metric} counter",
+            f"{metric} {d['counters'].get(name, 0)}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def clear() -> None:
+    """reset the totals of the process"""
+    REGISTRY.clear()
+
+
+def stats() -> Stats:
+    """the totals of the process"""
+    return REGISTRY
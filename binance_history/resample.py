@@ -0,0 +1,81 @@
+from typing import Optional
+
+import pandas as pd
+from pandas import DataFrame, Timedelta, Timestamp
+
+from .constants import TIMEFRAMES
+
+KLINES_AGGREGATION = {
+    "open": "first",
+    "high": "max",
+    "low": "min",
+    "close": "last",
+    "volume": "sum",
+    "quote_volume": "sum",
+    "trades": "sum",
+}
+
+
+def timeframe_to_timedelta(timeframe: str) -> Optional[Timedelta]:
+    """the length of a kline interval, None for ``"1M"`` whose length varies"""
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(
+            f"timeframe must be one of {TIMEFRAMES}, but got '{timeframe}'"
+        )
+    if timeframe == "1M":
+        return None
+    unit = {"s": "s", "m": "min", "h": "h", "d": "D", "w": "W"}[timeframe[-1]]
+    return Timedelta(int(timeframe[:-1]), unit=unit)
+
+
+def check_resampleable(timeframe: str, base_timeframe: str) -> None:
+    """klines of ``timeframe`` can be built from klines of ``base_timeframe``"""
+    length = timeframe_to_timedelta(timeframe)
+    base_length = timeframe_to_timedelta(base_timeframe)
+    # a month is made of whole days
+    period = Timedelta(days=1) if length is None else length
+    if base_length is None or period % base_length != Timedelta(0):
+        raise ValueError(
+            f"klines of '{timeframe}' can not be built from klines of '{base_timeframe}'"
+        )
+
+
+def floor_open_datetime(dt: Timestamp, timeframe: str) -> Timestamp:
+    """
+    The open datetime of the kline containing ``dt`` (tz-aware). Like binance, klines are
+    aligned in UTC, weekly klines open on Mondays, monthly klines on the first day
+    of months, and other klines on multiples of their length since the epoch.
+    """
+    dt = dt.tz_convert("UTC")
+    if timeframe == "1M":
+        return dt.normalize().replace(day=1)
+    if timeframe == "1w":
+        return dt.normalize() - Timedelta(days=dt.weekday())
+    return dt.floor(timeframe_to_timedelta(timeframe))
+
+
+def next_open_datetime(open_datetime: Timestamp, timeframe: str) -> Timestamp:
+    if timeframe == "1M":
+        return open_datetime + pd.offsets.MonthBegin()
+    return open_datetime + timeframe_to_timedelta(timeframe)
+
+
+def resample_klines(df: DataFrame, timeframe: str) -> DataFrame:
+    """
+    Aggregate finer klines (indexed by their UTC open datetime) to ``timeframe``,
+    intervals without any kline are dropped.
+    """
+    if timeframe == "1M":
+        resampler = df.resample("MS")
+    elif timeframe == "1w":
+        resampler = df.resample("W-MON", label="left", closed="left")
+    else:
+        resampler = df.resample(timeframe_to_timedelta(timeframe), origin="epoch")
+
+    aggregation = {k: v for k, v in KLINES_AGGREGATION.items() if k in df.columns}
+    klines = resampler.agg(aggregation)[resampler.size() > 0]
+    if timeframe == "1M":
+        close = klines.index + pd.offsets.MonthBegin()
+    else:
+        close = klines.index + timeframe_to_timedelta(timeframe)
+    return klines.assign(close_datetime=close - Timedelta(milliseconds=1))
@@ -0,0 +1,167 @@
+import atexit
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+
+from . import config, metrics
+from .source import FileTransport
+
+_client: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+# the statuses of responses which are retried
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Space requests evenly so at most ``config.RATE_LIMIT`` requests are sent per
+    second, it's shared by all threads. It's disabled if ``config.RATE_LIMIT`` is None.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self) -> None:
+        rate = config.RATE_LIMIT
+        if rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + 1 / rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+RATE_LIMITER = RateLimiter()
+
+
+class RetryTransport(httpx.BaseTransport):
+    """
+    Retry requests failed by a network error or a transient status, up to
+    ``config.RETRIES`` times, with exponential backoff and full jitter. A
+    ``Retry-After`` header is honored. Every attempt waits for ``RATE_LIMITER``.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(config.RETRIES + 1):
+            last_attempt = attempt == config.RETRIES
+            RATE_LIMITER.acquire()
+            metrics.count("http_requests")
+            try:
+                response = self.transport.handle_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError):
+                if last_attempt:
+                    raise
+                metrics.count("http_retries")
+                time.sleep(backoff(attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                return response
+            metrics.count("http_retries")
+            delay = retry_after(response)
+            response.close()
+            time.sleep(backoff(attempt) if delay is None else delay)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+def backoff(attempt: int) -> float:
+    """the seconds to wait before retrying the ``attempt``-th (from 0) failed attempt"""
+    cap = min(config.BACKOFF_MAX, config.BACKOFF_FACTOR * 2**attempt)
+    return random.uniform(0, cap)
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """the seconds to wait by the ``Retry-After`` header, capped at ``config.BACKOFF_MAX``"""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0.0), config.BACKOFF_MAX)
+
+
+def create_client(
+    http2: Optional[bool] = None,
+    timeout: Optional[float] = None,
+    max_connections: Optional[int] = None,
+    max_keepalive_connections: Optional[int] = None,
+) -> httpx.Client:
+    """
+    Create a pooled ``httpx.Client`` retrying failed requests by ``RetryTransport``,
+    ``file://`` urls are read by ``FileTransport``. Arguments default to the values
+    in ``binance_history.config``.
+
+    :param http2: Whether to enable HTTP/2, it requires the ``h2`` package,
+        install it by ``pip install 'binance-history[http2]'``.
+    :param timeout: The timeout in seconds of every request.
+    :param max_connections: The maximum number of connections in the pool.
+    :param max_keepalive_connections: The maximum number of idle connections kept alive.
+    """
+    limits = httpx.Limits(
+        max_connections=max_connections or config.MAX_CONNECTIONS,
+        max_keepalive_connections=(
+            max_keepalive_connections or config.MAX_KEEPALIVE_CONNECTIONS
+        ),
+    )
+    transport = httpx.HTTPTransport(
+        http2=config.HTTP2 if http2 is None else http2, limits=limits
+    )
+    return httpx.Client(
+        transport=FileTransport(RetryTransport(transport)),
+        timeout=config.TIMEOUT if timeout is None else timeout,
+    )
+
+
+def get_client(client: Optional[httpx.Client] = None) -> httpx.Client:
+    """
+    return ``client`` if given, otherwise the shared client which is created on first use.
+    ``client`` is not wrapped, it only retries, rate limits and reads ``file://`` urls if
+    it was created by ``create_client``.
+    """
+    global _client
+
+    if client is not None:
+        return client
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = create_client()
+        return _client
+
+
+def set_client(client: Optional[httpx.Client]) -> None:
+    """
+    Replace the shared client by ``client``, the previous one is not closed.
+    If ``client`` is None, a new client will be created on next request.
+    """
+    global _client
+
+    with _lock:
+        _client = client
+
+
+@atexit.register
+def close_client() -> None:
+    """close the shared client."""
+    global _client
+
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,107 @@
+import email.utils
+import re
+from pathlib import Path
+from typing import Optional
+from urllib.parse import unquote, urlparse
+
+import httpx
+
+from . import config
+
+# the path of an archive under the root of a data source
+ARCHIVE_KEY_PATTERN = re.compile(r"data/(spot|futures/um|futures/cm)/.+$")
+
+
+def base_url() -> str:
+    """
+    The root url of the archives, ``config.DATA_URL`` ending with a slash. A local
+    directory may be given as a path, it's converted to a ``file://`` url.
+    """
+    url = str(config.DATA_URL)
+    if "://" not in url:
+        url = Path(url).expanduser().resolve().as_uri()
+    if url.startswith("file:///"):
+        # httpx takes a url without host as a relative one
+        url = "file://localhost/" + url[len("file:///") :]
+    return url if url.endswith("/") else url + "/"
+
+
+def archive_key(url: str) -> str:
+    """
+    The path of the archive at ``url`` relative to the root of its source, e.g.
+    ``"data/spot/daily/klines/BTCUSDT/1m/BTCUSDT-1m-2022-01-01.zip"``, it keys the
+    cache and the availability index so every source shares them.
+    """
+    path = urlparse(url).path
+    match = ARCHIVE_KEY_PATTERN.search(path)
+    return path.lstrip("/") if match is None else match.group()
+
+
+class FileStream(httpx.SyncByteStream):
+    """the bytes ``[start, end)`` of a file read chunk by chunk"""
+
+    chunk_size = 1 << 20
+
+    def __init__(self, path: Path, start: int, end: int):
+        self.path = path
+        self.start = start
+        self.end = end
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            f.seek(self.start)
+            remaining = self.end - self.start
+            while remaining > 0:
+                data = f.read(min(self.chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+
+class FileTransport(httpx.BaseTransport):
+    """
+    Serve ``file://`` urls from the local file system like ``data.binance.vision``,
+    i.e. a directory with the same layout of archives, ranged requests included.
+    Requests of other urls are sent by ``transport``.
+    """
+
+    def __init__(self, transport: Optional[httpx.BaseTransport] = None):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.scheme != "file":
+            if self.transport is None:
+                raise httpx.UnsupportedProtocol(f"{request.url} is not a file url")
+            return self.transport.handle_request(request)
+
+        path = Path(unquote(request.url.path))
+        if not path.is_file():
+            return httpx.Response(404, request=request)
+        stat = path.stat()
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Last-Modified": email.utils.formatdate(stat.st_mtime, usegmt=True),
+        }
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(stat.st_size)
+            return httpx.Response(200, headers=headers, request=request)
+
+        status, first, last = 200, 0, stat.st_size - 1
+        if "Range" in request.headers:
+            first, _, end = request.headers["Range"][len("bytes=") :].partition("-")
+            first = int(first)
+            if first >= stat.st_size:
+                headers["Content-Range"] = f"bytes */{stat.st_size}"
+                return httpx.Response(416, headers=headers, request=request)
+            if end:
+                last = min(int(end), last)
+            status = 206
+            headers["Content-Range"] = f"bytes {first}-{last}/{stat.st_size}"
+        headers["Content-Length"] = str(last - first + 1)
+        stream = FileStream(path, first, last + 1)
+        return httpx.Response(status, headers=headers, stream=stream, request=request)
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
@@ -0,0 +1,177 @@
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+import httpx
+import pandas as pd
+from pandas import Timestamp
+
+from . import index
+from .api import _create_executor
+from .compact import Dataset, compact_month
+from .exceptions import DataNotFound
+from .utils import (
+    cache_data,
+    exists_month,
+    gen_data_url,
+    is_data_on_disk,
+    remove_data_from_disk,
+    unify_datetime,
+)
+
+
+class SyncResult(NamedTuple):
+    # the last day of the synced archives, before ``start`` if nothing is published
+    synced_until: Timestamp
+    # the urls of the downloaded archives
+    downloaded: List[str]
+    # the urls of the monthly archives built from the cached daily archives
+    compacted: List[str]
+
+
+def dataset_key(
+    data_type: str, asset_type: str, symbol: str, timeframe: Optional[str] = None
+) -> str:
+    """the name of a dataset in the index, e.g. ``"spot/klines/BTCUSDT/1m"``"""
+    parts = [asset_type, data_type, symbol]
+    if data_type == "klines":
+        parts.append(timeframe)
+    return "/".join(parts)
+
+
+def sync(
+    symbol: str,
+    data_type: str = "klines",
+    asset_type: str = "spot",
+    timeframe: Optional[str] = "1m",
+    start: Union[str, datetime, None] = None,
+    end: Union[str, datetime, None] = None,
+    max_concurrency: Optional[int] = None,
+    client: Optional[httpx.Client] = None,
+    engine: Optional[str] = None,
+) -> SyncResult:
+    """
+    Bring the cache of a dataset up to date. The last synced day is recorded in the
+    index, later syncs only download the archives published since then: monthly
+    archives for whole months which are published, daily archives otherwise. Once the
+    monthly archive of synced daily archives is published, the daily archives are
+    merged into the cache of the monthly archive.
+
+    :param start: The first day of the dataset (UTC), it's required by the first sync.
+    :param end: The last day to sync (UTC), default to yesterday.
+    :return: The last synced day, the downloaded and the compacted archives.
+    """
+    symbol = symbol.upper().replace("/", "")
+    if data_type != "klines":
+        timeframe = None
+    dataset = Dataset(data_type, asset_type, symbol, timeframe)
+    key = dataset_key(*dataset)
+    state = index.lookup_dataset(key)
+    today = Timestamp.now("UTC").tz_localize(None).normalize()
+    one_day = pd.Timedelta(days=1)
+
+    if start is not None:
+        start = Timestamp(unify_datetime(start)).normalize()
+    elif state is not None:
+        start = Timestamp(state.start)
+    else:
+        raise ValueError(f"start must be given to sync '{key}' for the first time")
+    end = today - one_day if end is None else Timestamp(unify_datetime(end)).normalize()
+
+    if state is None or start < Timestamp(state.start):
+        synced_until = start - one_day
+    else:
+        synced_until = Timestamp(state.synced_until)
+    daily_from = None
+    if state is not None and state.daily_from is not None:
+        daily_from = Timestamp(state.daily_from)
+
+    def archive_url(freq, dt):
+        return gen_data_url(data_type, asset_type, freq, symbol, dt, timeframe)
+
+    compacted, downloaded = [], []
+    if daily_from is not None:
+        month = daily_from.replace(day=1)
+        # a month is compacted once all its days are synced and its archive published
+        while month + pd.offsets.MonthEnd() <= synced_until:
+            days = pd.date_range(month, month + pd.offsets.MonthEnd())
+            # the days before ``start`` are never synced, keep the daily archives
+            if days[0] >= start:
+                month_url = archive_url("monthly", month)
+                if not exists_month(month_url, client):
+                    break
+                daily_urls = [archive_url("daily", day) for day in days]
+                if not is_data_on_disk(month_url):
+                    if compact_month(dataset, month, client=client, engine=engine):
+                        compacted.append(month_url)
+                    else:
+                        cache_data(
+                            data_type,
+                            asset_type,
+                            "monthly",
+                            symbol,
+                            month,
+                            timeframe,
+                            client,
+                            engine,
+                        )
+                        downloaded.append(month_url)
+                for url in daily_urls:
+                    remove_data_from_disk(url)
+            month += pd.offsets.MonthBegin()
+        daily_from = month if month <= synced_until else None
+
+    archives = _plan_sync(archive_url, synced_until + one_day, end, today, client)
+
+    def fetch(archive):
+        freq, dt, _ = archive
+        try:
+            return cache_data(
+                data_type, asset_type, freq, symbol, dt, timeframe, client, engine
+            )
+        except DataNotFound:
+            return None
+
+    with _create_executor(max_concurrency) as executor:
+        results = list(executor.map(fetch, archives))
+    for (freq, dt, last_day), is_downloaded in zip(archives, results):
+        # daily archives are published in order, stop at the first missing one
+        if is_downloaded is None:
+            break
+        if is_downloaded:
+            downloaded.append(archive_url(freq, dt))
+        synced_until = last_day
+        if freq == "daily" and daily_from is None:
+            daily_from = dt
+
+    index.record_dataset(
+        key,
+        str(start.date()),
+        str(synced_until.date()),
+        None if daily_from is None else str(daily_from.date()),
+    )
+    return SyncResult(synced_until, downloaded, compacted)
+
+
+def _plan_sync(
+    archive_url, start: Timestamp, end: Timestamp, today: Timestamp, client=None
+) -> List[Tuple[str, Timestamp, Timestamp]]:
+    """
+    List (freq, date, last day) of the archives covering ``[start, end]``, monthly
+    archives are probed only for whole months, and not after the first missing one.
+    """
+    archives = []
+    month_published = True
+    day = start
+    while day <= end:
+        month_end = day + pd.offsets.MonthEnd(0)
+        whole_month = day.day == 1 and month_end <= end and month_end < today
+        if whole_month and month_published:
+            month_published = exists_month(archive_url("monthly", day), client)
+        if whole_month and month_published:
+            archives.append(("monthly", day, month_end))
+        else:
+            last_day = min(month_end, end)
+            for dt in pd.date_range(day, last_day):
+                archives.append(("daily", dt, dt))
+        day = month_end + pd.Timedelta(days=1)
+    return archives
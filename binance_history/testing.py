@@ -0,0 +1,181 @@
+import functools
+import hashlib
+import http.server
+import io
+import threading
+import zipfile
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .source import archive_key
+from .utils import gen_data_url
+
+
+def make_klines_csv(start, end, timeframe) -> bytes:
+    """generate binance-format klines of [start, end) in UTC"""
+    freq = pd.Timedelta(timeframe.replace("m", "min"))
+    open_ms = np.arange(
+        pd.Timestamp(start).value // 10**6,
+        pd.Timestamp(end).value // 10**6,
+        freq.value // 10**6,
+        dtype="int64",
+    )
+    price = 100 + (open_ms // 60000 % 1000) / 100
+    df = pd.DataFrame(
+        {
+            "open_ms": open_ms,
+            "open": price,
+            "high": price + 1,
+            "low": price - 1,
+            "close": price + 0.5,
+            "volume": 1.5,
+            "close_ms": open_ms + freq.value // 10**6 - 1,
+            "quote_volume": price * 1.5,
+            "trades": open_ms // 60000 % 100,
+            "taker_buy_volume": 0.5,
+            "taker_buy_quote_volume": price * 0.5,
+            "ignore": 0,
+        }
+    )
+    return df.to_csv(header=False, index=False).encode()
+
+
+def make_agg_trades_csv(start, end, interval="10s") -> bytes:
+    """generate binance-format aggTrades of [start, end) in UTC"""
+    timestamp = np.arange(
+        pd.Timestamp(start).value // 10**6,
+        pd.Timestamp(end).value // 10**6,
+        pd.Timedelta(interval).value // 10**6,
+        dtype="int64",
+    )
+    n = len(timestamp)
+    df = pd.DataFrame(
+        {
+            "agg_trade_id": np.arange(n),
+            "price": 100 + np.arange(n) % 50 / 10,
+            "quantity": 1 + np.arange(n) % 3,
+            "first_trade_id": np.arange(n) * 2,
+            "last_trade_id": np.arange(n) * 2 + 1,
+            "timestamp": timestamp,
+            "is_buyer_maker": np.arange(n) % 2 == 0,
+            "is_best_match": True,
+        }
+    )
+    return df.to_csv(header=False, index=False).encode()
+
+
+def make_zip(name: str, content: bytes) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zipf:
+        # a fixed modification time makes the archive and its checksum reproducible
+        zipf.writestr(zipfile.ZipInfo(name, (2023, 1, 1, 0, 0, 0)), content)
+    return buf.getvalue()
+
+
+def write_archives(
+    directory: Union[str, Path],
+    symbol: str,
+    start: str,
+    end: str,
+    data_type: str = "klines",
+    asset_type: str = "spot",
+    freq: str = "monthly",
+    timeframe: Optional[str] = "1m",
+    interval: str = "10s",
+) -> List[Path]:
+    """
+    Write synthetic archives of the months or days in ``[start, end]`` and their
+    ``.CHECKSUM`` files to ``directory`` in the layout of ``data.binance.vision``.
+    aggTrades are generated every ``interval``.
+    """
+    dates = pd.date_range(start, end, freq="MS" if freq == "monthly" else "D")
+    paths = []
+    for dt in dates:
+        url = gen_data_url(data_type, asset_type, freq, symbol, dt, timeframe)
+        path = Path(directory) / archive_key(url)
+        next_dt = dt + (
+            pd.offsets.MonthBegin() if freq == "monthly" else pd.Timedelta(days=1)
+        )
+        if data_type == "klines":
+            content = make_klines_csv(dt, next_dt, timeframe)
+        else:
+            content = make_agg_trades_csv(dt, next_dt, interval)
+        archive = make_zip(path.with_suffix(".csv").name, content)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(archive)
+        checksum = hashlib.sha256(archive).hexdigest()
+        path.with_name(path.name + ".CHECKSUM").write_text(f"{checksum}  {path.name}\n")
+        paths.append(path)
+    return paths
+
+
+class _ArchiveHandler(http.server.SimpleHTTPRequestHandler):
+    """serve files like ``data.binance.vision``, ranged requests included"""
+
+    def send_head(self):
+        path = Path(self.translate_path(self.path))
+        if "Range" not in self.headers or not path.is_file():
+            return super().send_head()
+        size = path.stat().st_size
+        first, _, last = self.headers["Range"][len("bytes=") :].partition("-")
+        first, last = int(first), min(int(last or size - 1), size - 1)
+        if first >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.end_headers()
+            return None
+        with open(path, "rb") as f:
+            f.seek(first)
+            content = f.read(last - first + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(str(path)))
+        self.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        return io.BytesIO(content)
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ArchiveServer:
+    """
+    A local http stand-in of ``data.binance.vision`` serving ``directory``, which has
+    the same layout of archives, e.g. to run tests without the network. Use it as a
+    context manager, the server runs in a thread at ``url`` until it exits::
+
+        with ArchiveServer("mirror") as server:
+            config.DATA_URL = server.url
+    """
+
+    def __init__(self, directory: Union[str, Path], host: str = "127.0.0.1"):
+        handler = functools.partial(_ArchiveHandler, directory=str(directory))
+        self.server = http.server.ThreadingHTTPServer((host, 0), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "ArchiveServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
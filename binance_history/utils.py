@@ -1,19 +1,31 @@
 import datetime
+import hashlib
 import io
+import itertools
 import os
-import os.path
+import pickle
+import shutil
+import threading
+import time
 import zipfile
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Union
-from urllib.parse import urlparse
+from typing import IO, Iterable, Iterator, List, Optional, Tuple, Union
 
 import httpx
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import pendulum
+from filelock import FileLock
 from pandas import Timestamp, DataFrame
 
-from . import config
-from .exceptions import NetworkError, DataNotFound
+from . import config, index, manager, memo, metrics
+from .cache import BACKENDS, CacheBackend, get_backend
+from .exceptions import ChecksumError, NetworkError, DataNotFound
+from .session import backoff, get_client
+from .source import archive_key, base_url
 
 
 def gen_data_url(
@@ -38,12 +50,12 @@ def gen_data_url(
         if timeframe is None:
             raise ValueError("'timeframe' must not be None when data_type is 'klines'")
         url = (
-            f"https://data.binance.vision/data/{asset_type}/{freq}/{data_type}/{symbol}/{timeframe}"
+            f"{base_url()}data/{asset_type}/{freq}/{data_type}/{symbol}/{timeframe}"
             f"/{symbol}-{timeframe}-{date_str}.zip"
         )
     elif data_type == "aggTrades":
         url = (
-            f"https://data.binance.vision/data/{asset_type}/{freq}/{data_type}/{symbol}"
+            f"{base_url()}data/{asset_type}/{freq}/{data_type}/{symbol}"
             f"/{symbol}-{data_type}-{date_str}.zip"
         )
     else:
@@ -60,15 +72,32 @@ def unify_datetime(input: Union[str, datetime.datetime]) -> datetime.datetime:
         raise TypeError(input)
 
 
-def exists_month(month_url):
+def exists_month(month_url, client: Optional[httpx.Client] = None):
+    """
+    The archive is only probed by a HEAD request if it's neither cached nor in
+    the availability index, or it was found missing more than
+    ``config.AVAILABILITY_TTL`` seconds ago. In offline mode it's never probed.
+    """
+    if is_data_on_disk(month_url):
+        return True
+
+    info = index.lookup(month_url)
+    if info is not None and (not info.expired or config.OFFLINE):
+        return info.available
+    if config.OFFLINE:
+        return False
+
     try:
-        resp = httpx.head(month_url)
+        resp = get_client(client).head(month_url)
     except (httpx.TimeoutException, httpx.NetworkError) as e:
         raise NetworkError(e)
 
     if resp.status_code == 200:
+        size = resp.headers.get("Content-Length")
+        index.record(month_url, True, size=None if size is None else int(size))
         return True
     elif resp.status_code == 404:
+        index.record(month_url, False)
         return False
     else:
         raise NetworkError(resp.status_code)
@@ -81,6 +110,7 @@ def gen_dates(
     start: Timestamp,
     end: Timestamp,
     timeframe: Optional[str] = None,
+    client: Optional[httpx.Client] = None,
 ):
     assert start.tz is None and end.tz is None
 
@@ -99,7 +129,7 @@ def gen_dates(
         data_type, asset_type, "monthly", symbol, months[-1], timeframe=timeframe
     )
 
-    if not exists_month(last_month_url):
+    if not exists_month(last_month_url, client):
         daily_month = months.pop()
         if len(months) > 1:
             second_last_month_url = gen_data_url(
@@ -110,7 +140,7 @@ def gen_dates(
                 months[-1],
                 timeframe=timeframe,
             )
-            if not exists_month(second_last_month_url):
+            if not exists_month(second_last_month_url, client):
                 daily_month = months.pop()
 
         days = pd.date_range(
@@ -130,106 +160,673 @@ def get_data(
     freq: str,
     symbol: str,
     dt: Timestamp,
-    data_tz: str,
     timeframe: Optional[str] = None,
+    client: Optional[httpx.Client] = None,
+    columns: Optional[List[str]] = None,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+    engine: Optional[str] = None,
 ) -> DataFrame:
     if data_type == "klines":
         assert timeframe is not None
 
     url = gen_data_url(data_type, asset_type, freq, symbol, dt, timeframe)
 
+    df = memo.MEMORY_CACHE.get(url)
+    if df is None:
+        if not memo.MEMORY_CACHE.enabled:
+            # only the requested rows and columns are read
+            df = load_data_from_disk(url, columns, start, end)
+            if df is not None:
+                metrics.count("cache_hits")
+                return df
+        df = load_or_download_data(data_type, url, client, engine)
+        memo.MEMORY_CACHE.put(url, df)
+    else:
+        metrics.count("memory_cache_hits")
+
+    with metrics.timer("concat"):
+        df = df.loc[start:end]
+        if columns is not None:
+            df = df[columns]
+    return df
+
+
+def get_data_chunks(
+    data_type: str,
+    asset_type: str,
+    freq: str,
+    symbol: str,
+    dt: Timestamp,
+    timeframe: Optional[str] = None,
+    client: Optional[httpx.Client] = None,
+    columns: Optional[List[str]] = None,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+    chunk_rows: int = 1_000_000,
+    engine: Optional[str] = None,
+) -> Iterator[DataFrame]:
+    """
+    Like ``get_data`` but yields the archive in chunks of at most ``chunk_rows`` rows,
+    an archive not cached yet is converted to the cache chunk by chunk as well.
+    """
+    if data_type == "klines":
+        assert timeframe is not None
+
+    url = gen_data_url(data_type, asset_type, freq, symbol, dt, timeframe)
+
+    chunks = iter_data_from_disk(url, columns, start, end, chunk_rows)
+    if chunks is not None:
+        metrics.count("cache_hits")
+        return chunks
+
+    backend = get_backend()
+    path = get_local_data_path(url)
+    # the file is opened by ``iter_data_from_disk``, until then it must not be pruned,
+    # e.g. to keep the cache under ``config.CACHE_MAX_BYTES`` by a concurrent write
+    with lock_archive(url), manager.pin(backend.file_path(path)):
+        if not backend.exists(path):
+            metrics.count("cache_misses")
+            with fetch_archive(url, client) as archive:
+                chunks = iter_csv_chunks(data_type, archive, chunk_rows, engine)
+                save_data_chunks_to_disk(url, chunks)
+        else:
+            metrics.count("cache_hits")
+        chunks = iter_data_from_disk(url, columns, start, end, chunk_rows)
+    if chunks is None:
+        raise FileNotFoundError(
+            f"the cache of {url} was removed by another process right after it was "
+            "written, e.g. by 'bh cache prune'"
+        )
+    return chunks
+
+
+def cache_data(
+    data_type: str,
+    asset_type: str,
+    freq: str,
+    symbol: str,
+    dt: Timestamp,
+    timeframe: Optional[str] = None,
+    client: Optional[httpx.Client] = None,
+    engine: Optional[str] = None,
+    chunk_rows: int = 1_000_000,
+) -> bool:
+    """
+    Download the archive to the cache unless it's cached, return whether it was
+    downloaded. It's parsed and cached chunk by chunk of ``chunk_rows`` rows, so
+    prefetching archives in parallel never holds whole archives in memory.
+    """
+    url = gen_data_url(data_type, asset_type, freq, symbol, dt, timeframe)
+    if is_data_on_disk(url):
+        return False
+    with lock_archive(url):
+        if is_data_on_disk(url):
+            return False
+        metrics.count("cache_misses")
+        with fetch_archive(url, client) as archive:
+            chunks = iter_csv_chunks(data_type, archive, chunk_rows, engine)
+            save_data_chunks_to_disk(url, chunks)
+    return True
+
+
+def load_or_download_data(
+    data_type: str,
+    url: str,
+    client: Optional[httpx.Client] = None,
+    engine: Optional[str] = None,
+) -> DataFrame:
+    """
+    Load the whole archive from the cache, or download and cache it while holding
+    its lock, so it's downloaded once by concurrent threads and processes.
+    """
     df = load_data_from_disk(url)
     if df is None:
-        df = download_data(data_type, data_tz, url)
-        save_data_to_disk(url, df)
+        with lock_archive(url):
+            df = load_data_from_disk(url)
+            if df is None:
+                metrics.count("cache_misses")
+                df = download_data(data_type, url, client, engine)
+                save_data_to_disk(url, df)
+                return df
+    metrics.count("cache_hits")
     return df
 
 
-def download_data(data_type: str, data_tz: str, url: str) -> DataFrame:
+@contextmanager
+def lock_archive(url: str) -> Iterator[None]:
+    """hold the lock of an archive, it's a file shared by processes using the cache"""
+    path = config.CACHE_DIR / "locks" / (archive_key(url) + ".lock")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with FileLock(path):
+        yield
+
+
+def download_data(
+    data_type: str,
+    url: str,
+    client: Optional[httpx.Client] = None,
+    engine: Optional[str] = None,
+) -> DataFrame:
     assert data_type in ["klines", "aggTrades"]
 
+    with fetch_archive(url, client) as archive:
+        if data_type == "klines":
+            return load_klines(archive, engine)
+        elif data_type == "aggTrades":
+            return load_agg_trades(archive, engine)
+
+
+@contextmanager
+def fetch_archive(url: str, client: Optional[httpx.Client] = None) -> Iterator[Path]:
+    """
+    Yield the local path of the raw zip archive, download it if it's not kept
+    locally, and remove it on exit unless ``config.KEEP_ARCHIVES`` is True.
+    """
+    path = get_local_archive_path(url)
+    if not path.exists():
+        if config.OFFLINE:
+            raise NetworkError(f"{url} is not cached and config.OFFLINE is True")
+        download_archive(url, path, client)
+        if config.KEEP_ARCHIVES:
+            manager.track(path)
     try:
-        resp = httpx.get(url)
-    except (httpx.TimeoutException, httpx.NetworkError) as e:
+        yield path
+    finally:
+        if not config.KEEP_ARCHIVES:
+            path.unlink(missing_ok=True)
+
+
+def download_archive(
+    url: str, path: Path, client: Optional[httpx.Client] = None
+) -> None:
+    """
+    Stream the archive to ``path`` with a ``.part`` suffix and rename it once complete.
+    An interrupted download is resumed by a ranged request, within this call up to
+    ``config.RETRIES`` times or by a later call. Monthly archives larger than
+    ``config.PARALLEL_DOWNLOAD_SIZE`` are downloaded by ``config.DOWNLOAD_CONNECTIONS``
+    ranged requests in parallel. The progress is reported to ``config.PROGRESS_HOOK``.
+
+    The size and sha256 of the archive are recorded in the availability index. If
+    ``config.VERIFY_CHECKSUM`` is True, the sha256 is compared with the published
+    ``.CHECKSUM`` file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = path.with_name(path.name + ".part")
+    client = get_client(client)
+    try:
+        with metrics.timer("download"):
+            size = _parallel_download_size(url, part_path)
+            if size is None:
+                _download_range(url, part_path, client, DownloadProgress(url))
+            else:
+                _download_in_parallel(url, part_path, size, client)
+            sha256 = file_sha256(part_path)
+            if config.VERIFY_CHECKSUM:
+                checksum = get_checksum(url, client)
+                if checksum is not None and checksum != sha256:
+                    part_path.unlink()
+                    raise ChecksumError(f"the sha256 of {url} is not {checksum}")
+    except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as e:
+        # the downloaded part is kept to be resumed
         raise NetworkError(e)
+    except DataNotFound:
+        index.record(url, False)
+        raise
+    os.replace(part_path, path)
+    index.record(url, True, path.stat().st_size, sha256)
+
+
+class DownloadProgress:
+    """count the downloaded bytes of an archive and report them to ``config.PROGRESS_HOOK``"""
+
+    def __init__(self, url: str, total: Optional[int] = None):
+        self.url = url
+        self.total = total
+        self.downloaded = 0
+        self._lock = threading.Lock()
+
+    def update(self, n: int) -> None:
+        with self._lock:
+            self.downloaded += n
+            downloaded = self.downloaded
+        if config.PROGRESS_HOOK is not None:
+            config.PROGRESS_HOOK(self.url, downloaded, self.total)
+
+
+class _RangesIgnored(Exception):
+    """a ranged request was answered by the whole file, e.g. by a mirror"""
+
+
+def _download_range(
+    url: str,
+    path: Path,
+    client: httpx.Client,
+    progress: DownloadProgress,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> None:
+    """
+    Download the bytes ``[start, end]`` (to the end if ``end`` is None) of ``url`` to
+    ``path``, the bytes already in ``path`` are skipped. Network errors and transient
+    statuses are retried by the client, see ``session.RetryTransport``, only a stream
+    broken after some bytes arrived is resumed here, up to ``config.RETRIES`` times.
+    Raise ``_RangesIgnored`` if ``end`` is given but the whole file is responded.
+    """
+    done = 0
+    resumes = 0
+    while True:
+        offset = start + (path.stat().st_size if path.exists() else 0)
+        if end is not None and offset > end:
+            return
+        headers = {}
+        if offset > 0 or end is not None:
+            headers["Range"] = f"bytes={offset}-{'' if end is None else end}"
+        received = 0
+        try:
+            with client.stream("GET", url, headers=headers) as resp:
+                if resp.status_code == 404:
+                    raise DataNotFound(url)
+                elif resp.status_code == 416 and end is None:
+                    # a previous download is complete but not renamed
+                    return
+                elif resp.status_code == 200 and end is None:
+                    # the range is ignored, download from the first byte
+                    mode, offset = "wb", 0
+                elif resp.status_code == 200:
+                    raise _RangesIgnored(url)
+                elif resp.status_code == 206:
+                    mode = "ab"
+                else:
+                    raise NetworkError(f"{url} responded {resp.status_code}")
+                if progress.total is None:
+                    progress.total = _content_total(resp, offset)
+                # the bytes downloaded by a previous call count as downloaded
+                progress.update(offset - start - done)
+                done = offset - start
+                with open(path, mode) as f:
+                    for data in resp.iter_bytes():
+                        f.write(data)
+                        received += len(data)
+                        done += len(data)
+                        progress.update(len(data))
+                        metrics.count("downloaded_bytes", len(data))
+            return
+        except (httpx.ReadError, httpx.ReadTimeout, httpx.RemoteProtocolError):
+            if received == 0 or resumes == config.RETRIES:
+                raise
+            time.sleep(backoff(resumes))
+            resumes += 1
+
+
+def _download_in_parallel(
+    url: str, path: Path, size: int, client: httpx.Client
+) -> None:
+    """
+    Download ``size`` bytes of ``url`` by ranged requests in parallel, then join them.
+    If the server ignores ranges, the archive is downloaded by one request instead.
+    """
+    chunk_size = -(-size // config.DOWNLOAD_CONNECTIONS)
+    ranges = [(s, min(s + chunk_size, size) - 1) for s in range(0, size, chunk_size)]
+    chunk_paths = [path.with_name(f"{path.name}.{i}") for i in range(len(ranges))]
+    progress = DownloadProgress(url, size)
+
+    def download(i):
+        _download_range(url, chunk_paths[i], client, progress, *ranges[i])
 
-    if resp.status_code == 200:
-        pass
-    elif resp.status_code == 404:
-        raise DataNotFound(url)
-    else:
-        raise NetworkError(url)
+    try:
+        with metrics.ContextExecutor(config.DOWNLOAD_CONNECTIONS) as executor:
+            list(executor.map(download, range(len(ranges))))
+    except _RangesIgnored:
+        for chunk_path in chunk_paths:
+            chunk_path.unlink(missing_ok=True)
+        _download_range(url, path, client, DownloadProgress(url, size))
+        return
+    with open(path, "wb") as f:
+        for chunk_path in chunk_paths:
+            with open(chunk_path, "rb") as chunk:
+                shutil.copyfileobj(chunk, f)
+    for chunk_path in chunk_paths:
+        chunk_path.unlink()
+
+
+def _parallel_download_size(url: str, part_path: Path) -> Optional[int]:
+    """
+    The size of the archive if it should be downloaded in parallel, it's known from the
+    availability index for monthly archives probed by ``exists_month``.
+    """
+    threshold = config.PARALLEL_DOWNLOAD_SIZE
+    if threshold is None or "/monthly/" not in url or part_path.exists():
+        return None
+    info = index.lookup(url)
+    if info is None or info.size is None or info.size < threshold:
+        return None
+    return info.size
 
-    if data_type == "klines":
-        return load_klines(data_tz, resp.content)
-    elif data_type == "aggTrades":
-        return load_agg_trades(data_tz, resp.content)
+
+def _content_total(resp: httpx.Response, offset: int) -> Optional[int]:
+    """the size of the whole file from the headers of a (ranged) response"""
+    content_range = resp.headers.get("Content-Range")
+    if content_range is not None and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    length = resp.headers.get("Content-Length")
+    return None if length is None else offset + int(length)
+
+
+def file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(data)
+    return sha256.hexdigest()
 
 
-def load_klines(data_tz: str, content: bytes) -> DataFrame:
-    with zipfile.ZipFile(io.BytesIO(content)) as zipf:
+def get_checksum(url: str, client: Optional[httpx.Client] = None) -> Optional[str]:
+    """the sha256 published in ``url + ".CHECKSUM"``, None if it's not published"""
+    resp = get_client(client).get(url + ".CHECKSUM")
+    if resp.status_code == 404:
+        return None
+    elif resp.status_code != 200:
+        raise NetworkError(url + ".CHECKSUM")
+    # e.g. "<sha256>  BTCUSDT-1m-2022-01.zip"
+    return resp.text.split()[0].lower()
+
+
+# the used columns of every data type, {column position: (name, dtype)}
+CSV_COLUMNS = {
+    "klines": {
+        0: ("open_ms", "int64"),
+        1: ("open", "float64"),
+        2: ("high", "float64"),
+        3: ("low", "float64"),
+        4: ("close", "float64"),
+        5: ("volume", "float64"),
+        6: ("close_ms", "int64"),
+        7: ("quote_volume", "float64"),
+        8: ("trades", "int64"),
+    },
+    "aggTrades": {
+        1: ("price", "float64"),
+        2: ("quantity", "float64"),
+        5: ("timestamp", "int64"),
+        6: ("is_buyer_maker", "bool"),
+    },
+}
+
+CSV_ENGINES = ["c", "pyarrow"]
+
+
+@contextmanager
+def open_csv(archive: Union[bytes, Path]) -> Iterator[IO[bytes]]:
+    """open the csv file in a zip archive given as its content or its path"""
+    if isinstance(archive, bytes):
+        archive = io.BytesIO(archive)
+    with zipfile.ZipFile(archive) as zipf:
         csv_name = zipf.namelist()[0]
         with zipf.open(csv_name, "r") as csvfile:
-            df = pd.read_csv(
-                csvfile,
-                usecols=range(9),
-                header=None,
-                names=[
-                    "open_ms",
-                    "open",
-                    "high",
-                    "low",
-                    "close",
-                    "volume",
-                    "close_ms",
-                    "quote_volume",
-                    "trades",
-                ],
-            )
-            df["open_datetime"] = pd.to_datetime(
-                df.open_ms, unit="ms", utc=True
-            ).dt.tz_convert(data_tz)
-            df["close_datetime"] = pd.to_datetime(
-                df.close_ms, unit="ms", utc=True
-            ).dt.tz_convert(data_tz)
-            del df["open_ms"]
-            del df["close_ms"]
-            df.set_index("open_datetime", inplace=True)
+            yield csvfile
+
+
+def sniff_csv(csvfile) -> Tuple[bool, int]:
+    """
+    Return whether the csv file has a header and its number of columns, binance
+    archives have a header row or not depending on the market and the date.
+    """
+    first_line = csvfile.peek(4096).split(b"\n", 1)[0]
+    return not first_line[:1].isdigit(), first_line.count(b",") + 1
+
+
+def load_klines(archive: Union[bytes, Path], engine: Optional[str] = None) -> DataFrame:
+    with metrics.timer("parse"), open_csv(archive) as csvfile:
+        df = parse_klines(read_csv(csvfile, "klines", engine))
+    metrics.count("parsed_rows", len(df))
     return df
 
 
-def load_agg_trades(data_tz: str, content: bytes) -> DataFrame:
-    with zipfile.ZipFile(io.BytesIO(content)) as zipf:
-        csv_name = zipf.namelist()[0]
-        with zipf.open(csv_name, "r") as csvfile:
-            df = pd.read_csv(
-                csvfile,
-                header=0,
-                usecols=[1, 2, 5, 6],
-                names=["price", "quantity", "timestamp", "is_buyer_maker"],
-            )
-            df["datetime"] = pd.to_datetime(
-                df.timestamp, unit="ms", utc=True
-            ).dt.tz_convert(data_tz)
-            del df["timestamp"]
-            df.set_index("datetime", inplace=True)
+def load_agg_trades(
+    archive: Union[bytes, Path], engine: Optional[str] = None
+) -> DataFrame:
+    with metrics.timer("parse"), open_csv(archive) as csvfile:
+        df = parse_agg_trades(read_csv(csvfile, "aggTrades", engine))
+    metrics.count("parsed_rows", len(df))
+    return df
+
+
+def iter_csv_chunks(
+    data_type: str,
+    archive: Union[bytes, Path],
+    chunk_rows: int,
+    engine: Optional[str] = None,
+) -> Iterator[DataFrame]:
+    """yield the parsed archive in chunks of about ``chunk_rows`` rows"""
+    parse = parse_klines if data_type == "klines" else parse_agg_trades
+    with open_csv(archive) as csvfile:
+        chunks = read_csv(csvfile, data_type, engine, chunk_rows)
+        for chunk in metrics.timed_iter("parse", map(parse, chunks)):
+            metrics.count("parsed_rows", len(chunk))
+            yield chunk
+
+
+def read_csv(
+    csvfile,
+    data_type: str,
+    engine: Optional[str] = None,
+    chunk_rows: Optional[int] = None,
+) -> Union[DataFrame, Iterator[DataFrame]]:
+    """
+    Read the used columns of a binance csv file with explicit dtypes by pandas' C engine or
+    pyarrow's multithreaded csv reader. If ``chunk_rows`` is given, return an iterator of
+    dataframes with about ``chunk_rows`` rows.
+    """
+    assert data_type in ["klines", "aggTrades"]
+
+    engine = config.CSV_ENGINE if engine is None else engine
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"engine must be one of {CSV_ENGINES}, but got '{engine}'")
+
+    columns = CSV_COLUMNS[data_type]
+    names = [name for name, _ in columns.values()]
+    has_header, n_columns = sniff_csv(csvfile)
+
+    if engine == "c":
+        reader = pd.read_csv(
+            csvfile,
+            header=None,
+            skiprows=int(has_header),
+            usecols=list(columns),
+            names=range(n_columns),
+            dtype={i: dtype for i, (_, dtype) in columns.items()},
+            chunksize=chunk_rows,
+        )
+        if chunk_rows is None:
+            return _rename(reader, names)
+        return (_rename(chunk, names) for chunk in reader)
+
+    read_options = pa_csv.ReadOptions(
+        column_names=[str(i) for i in range(n_columns)],
+        skip_rows=int(has_header),
+    )
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=[str(i) for i in columns],
+        column_types={
+            str(i): pa.from_numpy_dtype(np.dtype(d)) for i, (_, d) in columns.items()
+        },
+    )
+    if chunk_rows is None:
+        table = pa_csv.read_csv(csvfile, read_options, convert_options=convert_options)
+        return _rename(table.to_pandas(), names)
+
+    # a batch of the streaming reader holds ``block_size`` bytes of the csv file
+    read_options.block_size = max(chunk_rows * 64, 1 << 20)
+    reader = pa_csv.open_csv(csvfile, read_options, convert_options=convert_options)
+    return (_rename(batch.to_pandas(), names) for batch in reader)
+
+
+def _rename(df: DataFrame, names: List[str]) -> DataFrame:
+    df.columns = names
+    return df
+
+
+def epoch_to_datetime(values) -> pd.DatetimeIndex:
+    """
+    Convert epoch timestamps to UTC datetimes by viewing them as ``datetime64[ns]``,
+    they are milliseconds, except spot archives since 2025 use microseconds.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    factor = 1_000 if len(values) > 0 and values[0] > 10**14 else 1_000_000
+    return pd.DatetimeIndex((values * factor).view("datetime64[ns]")).tz_localize("UTC")
+
+
+def parse_klines(df: DataFrame) -> DataFrame:
+    df.index = epoch_to_datetime(df.pop("open_ms")).rename("open_datetime")
+    df["close_datetime"] = epoch_to_datetime(df.pop("close_ms"))
+    return df
+
+
+def parse_agg_trades(df: DataFrame) -> DataFrame:
+    df.index = epoch_to_datetime(df.pop("timestamp")).rename("datetime")
     return df
 
 
 def get_local_data_path(url: str) -> Path:
-    path = urlparse(url).path
-    return config.CACHE_DIR / path[1:]
+    return config.CACHE_DIR / archive_key(url)
+
+
+def is_data_on_disk(url: str) -> bool:
+    """whether the archive is cached in any format or kept as a raw zip"""
+    path = get_local_data_path(url)
+    return (
+        path.is_file()
+        or get_local_archive_path(url).exists()
+        or any(backend().exists(path) for backend in BACKENDS.values())
+    )
+
+
+def get_local_archive_path(url: str) -> Path:
+    return config.CACHE_DIR / "archives" / archive_key(url)
 
 
 def save_data_to_disk(url: str, df: DataFrame) -> None:
     path = get_local_data_path(url)
     path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_pickle(path)
+    backend = get_backend()
+    with metrics.timer("cache_write"):
+        backend.save(path, df)
+    memo.MEMORY_CACHE.discard(url)
+    manager.track(backend.file_path(path))
 
 
-def load_data_from_disk(url: str) -> Union[DataFrame, None]:
+def save_data_chunks_to_disk(url: str, chunks: Iterable[DataFrame]) -> None:
     path = get_local_data_path(url)
-    if os.path.exists(path):
-        return pd.read_pickle(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    backend = get_backend()
+    with metrics.timer("cache_write"):
+        backend.save_chunks(path, chunks)
+    memo.MEMORY_CACHE.discard(url)
+    manager.track(backend.file_path(path))
+
+
+# the errors raised by reading a damaged cache file
+CORRUPTED_FILE_ERRORS = (pa.ArrowInvalid, EOFError, pickle.UnpicklingError)
+
+
+def load_data_from_disk(
+    url: str,
+    columns: Optional[List[str]] = None,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+) -> Union[DataFrame, None]:
+    """load the cached archive, only the rows in ``[start, end]`` (tz-aware) are read"""
+    path = get_local_data_path(url)
+    backend = get_backend()
+    if backend.exists(path) or migrate_data_on_disk(path, backend):
+        manager.touch(backend.file_path(path))
+        try:
+            with metrics.timer("cache_read"):
+                df = backend.load(path, columns, start, end)
+        except CORRUPTED_FILE_ERRORS:
+            # e.g. truncated by a crash before writes were atomic, download it again
+            remove_data_from_disk(url)
+            return None
+        return convert_tz(df, "UTC")
+    return None
+
+
+def iter_data_from_disk(
+    url: str,
+    columns: Optional[List[str]] = None,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+    chunk_rows: int = 1_000_000,
+) -> Union[Iterator[DataFrame], None]:
+    """
+    like ``load_data_from_disk`` but yields chunks of at most ``chunk_rows`` rows, the
+    file is opened before returning, so removing it later doesn't break the iteration
+    """
+    path = get_local_data_path(url)
+    backend = get_backend()
+    if backend.exists(path) or migrate_data_on_disk(path, backend):
+        manager.touch(backend.file_path(path))
+        with metrics.timer("cache_read"):
+            chunks = backend.iter_chunks(path, columns, start, end, chunk_rows)
+        chunks = metrics.timed_iter("cache_read", chunks)
+        return (convert_tz(chunk, "UTC") for chunk in chunks)
+    return None
+
+
+def merge_data_on_disk(urls: List[str], url: str) -> None:
+    """
+    Write the cached archives of ``urls`` one after another to the cache of ``url``
+    without loading them at once, then remove them.
+    """
+    chunks = itertools.chain.from_iterable(iter_data_from_disk(u) for u in urls)
+    save_data_chunks_to_disk(url, chunks)
+    for u in urls:
+        remove_data_from_disk(u)
+
+
+def remove_data_from_disk(url: str) -> None:
+    """remove the cached archive in any format and its raw zip"""
+    path = get_local_data_path(url)
+    paths = [backend().file_path(path) for backend in BACKENDS.values()]
+    paths += [path, get_local_archive_path(url)]
+    for p in paths:
+        if p.is_file():
+            p.unlink()
+    manager.untrack(paths)
+    memo.MEMORY_CACHE.discard(url)
+
+
+def migrate_data_on_disk(path: Path, backend: CacheBackend) -> bool:
+    """
+    Convert the archive cached by other backends, or by the pickle cache of
+    binance-history<=0.1.7 which was saved to the path of the archive itself,
+    to ``backend``. Return False if the archive is not cached at all.
+    """
+    others = [cls() for name, cls in BACKENDS.items() if name != backend.name]
+    for other in others:
+        if other.exists(path):
+            df = other.load(path)
+            old_path = other.file_path(path)
+            break
     else:
-        return None
+        if not path.is_file():
+            return False
+        df = pd.read_pickle(path)
+        old_path = path
+
+    # binance-history<=0.1.7 cached archives in the timezone of the first request
+    backend.save(path, convert_tz(df, "UTC"))
+    os.remove(old_path)
+    manager.untrack([old_path])
+    return True
+
+
+def convert_tz(df: DataFrame, tz: str) -> DataFrame:
+    """convert the datetime index and datetime columns of ``df`` to ``tz``"""
+    if df.index.tz is not None and str(df.index.tz) != tz:
+        df = df.tz_convert(tz, copy=False)
+    for name, col in df.items():
+        if isinstance(col.dtype, pd.DatetimeTZDtype) and str(col.dt.tz) != tz:
+            df[name] = col.dt.tz_convert(tz)
+    return df
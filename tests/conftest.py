@@ -1,7 +1,13 @@
+import hashlib
+import re
+
 import coverage
+import httpx
+import pandas as pd
 import pytest
 
-from binance_history import config
+from binance_history import config, memo, session
+from binance_history.testing import make_agg_trades_csv, make_klines_csv, make_zip
 
 coverage.process_startup()
 
@@ -9,3 +15,118 @@ coverage.process_startup()
 @pytest.fixture(scope="session", autouse=True)
 def set_cache_dir(tmp_path_factory):
     config.CACHE_DIR = tmp_path_factory.getbasetemp()
+
+
+class InterruptedStream(httpx.SyncByteStream):
+    """a response body which breaks after ``n`` bytes"""
+
+    def __init__(self, content: bytes, n: int):
+        self.content = content
+        self.n = n
+
+    def __iter__(self):
+        yield self.content[: self.n]
+        raise httpx.ReadError("connection reset")
+
+
+class MockBinance:
+    """
+    A fake ``data.binance.vision`` serving synthetic archives and their checksums,
+    monthly archives after ``last_month`` and daily archives after ``last_day`` are
+    not published. Requests of archives are recorded in ``requests``, and requests
+    of checksums in ``checksum_requests``. Ranged requests are supported unless
+    ``ignore_ranges`` is True, like some mirrors. If ``fail_after`` is set, the first
+    response of each archive is interrupted after that many bytes.
+    """
+
+    url_pattern = re.compile(
+        r"/data/(?P<asset_type>spot|futures/um|futures/cm)/(?P<freq>monthly|daily)"
+        r"/(?P<data_type>klines|aggTrades)/(?P<symbol>\w+)(/(?P<timeframe>\w+))?"
+        r"/(?P<name>[\w-]+-(?P<date>\d{4}-\d{2}(-\d{2})?)\.zip)$"
+    )
+
+    def __init__(self, last_month="2022-10", last_day="2030-1-1", fail_after=None):
+        self.last_month = pd.Timestamp(last_month)
+        self.last_day = pd.Timestamp(last_day)
+        self.fail_after = fail_after
+        self.ignore_ranges = False
+        self.requests = []
+        self.checksum_requests = []
+        self.range_requests = []
+        self._failed = set()
+
+    def archive(self, path: str) -> bytes:
+        match = self.url_pattern.search(path)
+        if match is None:
+            return None
+        start = pd.Timestamp(match["date"])
+        if match["freq"] == "monthly":
+            if start > self.last_month:
+                return None
+            end = start + pd.offsets.MonthBegin()
+        else:
+            if start > self.last_day:
+                return None
+            end = start + pd.Timedelta(days=1)
+        if match["data_type"] == "klines":
+            content = make_klines_csv(start, end, match["timeframe"])
+        else:
+            content = make_agg_trades_csv(start, end)
+        return make_zip(match["name"].replace(".zip", ".csv"), content)
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith(".CHECKSUM"):
+            self.checksum_requests.append((request.method, path))
+            content = self.archive(path[: -len(".CHECKSUM")])
+            if content is None:
+                return httpx.Response(404)
+            checksum = hashlib.sha256(content).hexdigest()
+            return httpx.Response(200, text=f"{checksum}  {path.split('/')[-1][:-9]}\n")
+
+        self.requests.append((request.method, path))
+        content = self.archive(path)
+        if content is None:
+            return httpx.Response(404)
+        size = len(content)
+        headers = {} if self.ignore_ranges else {"Accept-Ranges": "bytes"}
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={**headers, "Content-Length": str(size)})
+
+        status = 200
+        if "Range" in request.headers and not self.ignore_ranges:
+            self.range_requests.append((path, request.headers["Range"]))
+            first, last = request.headers["Range"][len("bytes=") :].split("-")
+            first, last = int(first), int(last or size - 1)
+            if first >= size:
+                return httpx.Response(416, headers={"Content-Range": f"bytes */{size}"})
+            content = content[first : last + 1]
+            headers[
+                "Content-Range"
+            ] = f"bytes {first}-{first + len(content) - 1}/{size}"
+            status = 206
+        headers["Content-Length"] = str(len(content))
+        if self.fail_after is not None and path not in self._failed:
+            self._failed.add(path)
+            return httpx.Response(
+                status,
+                headers=headers,
+                stream=InterruptedStream(content, self.fail_after),
+            )
+        return httpx.Response(status, headers=headers, content=content)
+
+    def client(self) -> httpx.Client:
+        return httpx.Client(transport=httpx.MockTransport(self.handler))
+
+
+@pytest.fixture
+def mock_binance(monkeypatch, tmp_path):
+    """serve synthetic archives through the shared client with an empty cache"""
+    mock = MockBinance()
+    client = mock.client()
+    monkeypatch.setattr(config, "CACHE_DIR", tmp_path / "cache")
+    session.set_client(client)
+    memo.clear()
+    yield mock
+    session.set_client(None)
+    client.close()
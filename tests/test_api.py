@@ -1,10 +1,29 @@
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
 
+import pandas as pd
 import pendulum
 import pytest
 from pandas import Timestamp, Timedelta
+from pandas.testing import assert_frame_equal
 
-from binance_history import fetch_klines, fetch_agg_trades
+from binance_history.cache import BACKENDS, get_backend
+from binance_history.exceptions import ChecksumError, NetworkError
+
+from binance_history import (
+    config,
+    index,
+    api,
+    utils,
+    fetch_klines,
+    fetch_agg_trades,
+    fetch_bars,
+    fetch_many,
+    iter_agg_trades,
+    iter_klines,
+)
 
 
 @pytest.mark.parametrize(
@@ -141,3 +160,317 @@ def test_fetch_agg_trades_one_month(symbol, start, end, tz, asset_type):
 def test_wrong_datetime_type():
     with pytest.raises(TypeError):
         fetch_klines("btcusdt", 3, 4)
+
+
+def test_fetch_data_concurrently(monkeypatch):
+    months = [Timestamp("2022-1"), Timestamp("2022-2")]
+    days = [Timestamp("2022-3-1"), Timestamp("2022-3-2")]
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def fake_gen_dates(*args, **kwargs):
+        return list(months), list(days)
+
+    def fake_get_data(freq, dt, **kwargs):
+        with lock:
+            running.append(dt)
+            peak.append(len(running))
+        # later archives finish first to make sure the order is restored
+        time.sleep(0.05 * (5 - len(peak)))
+        with lock:
+            running.remove(dt)
+        index = pd.DatetimeIndex([dt], tz="UTC", name="open_datetime")
+        return pd.DataFrame({"freq": [freq]}, index=index)
+
+    monkeypatch.setattr(api, "gen_dates", fake_gen_dates)
+    monkeypatch.setattr(api, "get_data", fake_get_data)
+
+    df = fetch_klines("BTCUSDT", "2022-1-1", "2022-3-2", tz="UTC", max_concurrency=4)
+    assert str(df.index.tz) == "UTC"
+    assert list(df.index.tz_convert(None)) == months + days
+    assert list(df.freq) == ["monthly", "monthly", "daily", "daily"]
+    assert max(peak) > 1
+
+    peak.clear()
+    fetch_klines("BTCUSDT", "2022-1-1", "2022-3-2", tz="UTC", max_concurrency=1)
+    assert max(peak) == 1
+
+    with pytest.raises(ValueError):
+        fetch_klines("BTCUSDT", "2022-1-1", "2022-3-2", max_concurrency=0)
+
+
+def test_fetch_data_with_mock_binance(mock_binance):
+    klines = fetch_klines(
+        "BTCUSDT", "2022-10-30 5:29", "2022-11-2 11:31", timeframe="1m", tz="UTC"
+    )
+    assert klines.index[0] == Timestamp("2022-10-30 5:29", tz="UTC")
+    assert klines.index[-1] == Timestamp("2022-11-2 11:31", tz="UTC")
+    assert klines.close_datetime[-1] == Timestamp("2022-11-2 11:31:59.999", tz="UTC")
+    assert klines.index.is_monotonic_increasing and klines.index.is_unique
+
+    assert ("GET", "/data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2022-10.zip") in (
+        mock_binance.requests
+    )
+    assert ("GET", "/data/spot/daily/klines/BTCUSDT/1m/BTCUSDT-1m-2022-11-02.zip") in (
+        mock_binance.requests
+    )
+
+
+def test_fetch_data_with_injected_client(mock_binance):
+    other = type(mock_binance)()
+    with other.client() as client:
+        fetch_agg_trades("ETCBTC", "2022-10-2", "2022-10-3", tz="UTC", client=client)
+    assert mock_binance.requests == []
+    assert len(other.requests) == 2
+
+
+def test_cache_is_shared_across_timezones(mock_binance):
+    start, end = "2022-10-2", "2022-10-3"
+    utc = fetch_klines("BTCUSDT", start, end, tz="UTC", columns=["close_datetime"])
+    shanghai = fetch_klines("BTCUSDT", start, end, tz="Asia/Shanghai")
+    assert [method for method, _ in mock_binance.requests].count("GET") == 1
+
+    assert str(shanghai.index.tz) == "Asia/Shanghai"
+    assert str(shanghai.close_datetime.dt.tz) == "Asia/Shanghai"
+    assert shanghai.index[0] == Timestamp("2022-10-2", tz="Asia/Shanghai")
+    assert utc.index[0] == Timestamp("2022-10-2", tz="UTC")
+    assert list(utc.columns) == ["close_datetime"]
+
+
+@pytest.mark.parametrize("cache_format", list(BACKENDS))
+@pytest.mark.parametrize("warm_cache", [False, True])
+def test_iter_agg_trades(mock_binance, monkeypatch, warm_cache, cache_format):
+    monkeypatch.setattr(config, "CACHE_FORMAT", cache_format)
+    start, end = "2022-10-30 5:29", "2022-11-2 11:31"
+    if warm_cache:
+        expected = fetch_agg_trades("ETCBTC", start, end, tz="Asia/Shanghai")
+
+    chunks = list(
+        iter_agg_trades("ETCBTC", start, end, tz="Asia/Shanghai", chunk_rows=5000)
+    )
+    assert all(0 < len(chunk) <= 5000 for chunk in chunks)
+    assert str(chunks[0].index.tz) == "Asia/Shanghai"
+    assert chunks[0].index[0] >= Timestamp(start, tz="Asia/Shanghai")
+    assert chunks[-1].index[-1] <= Timestamp(end, tz="Asia/Shanghai")
+
+    if not warm_cache:
+        expected = fetch_agg_trades("ETCBTC", start, end, tz="Asia/Shanghai")
+    assert [method for method, _ in mock_binance.requests].count("GET") == 3
+    assert_frame_equal(pd.concat(chunks), expected)
+
+    with pytest.raises(ValueError):
+        next(iter_klines("BTCUSDT", start, end, chunk_rows=0))
+
+
+@pytest.mark.parametrize("max_concurrency", [None, 2])
+def test_iter_agg_trades_streams(mock_binance, monkeypatch, max_concurrency):
+    def load(*args, **kwargs):
+        raise AssertionError("the whole archive is loaded")
+
+    # neither the download nor the cache of the default format is loaded whole
+    monkeypatch.setattr(utils, "load_agg_trades", load)
+    monkeypatch.setattr(type(get_backend()), "load", load)
+    # nor by the threads prefetching the archives
+    chunks = api.iter_data(
+        "ETCBTC",
+        "spot",
+        "aggTrades",
+        "2022-10-31",
+        "2022-11-1 23:59",
+        chunk_rows=5000,
+        max_concurrency=max_concurrency,
+    )
+    assert max(map(len, chunks)) == 5000
+
+
+def test_keep_archives(mock_binance, monkeypatch):
+    monkeypatch.setattr(config, "KEEP_ARCHIVES", True)
+    fetch_klines("BTCUSDT", "2022-10-2", "2022-10-3", tz="UTC")
+    archives = list((config.CACHE_DIR / "archives").rglob("*"))
+    assert [p.name for p in archives if p.is_file()] == ["BTCUSDT-1m-2022-10.zip"]
+
+    # rebuild the cache in another format from the kept archive
+    monkeypatch.setattr(config, "CACHE_FORMAT", "pickle")
+    for path in config.CACHE_DIR.rglob("*.parquet"):
+        path.unlink()
+    fetch_klines("BTCUSDT", "2022-10-2", "2022-10-3", tz="UTC")
+    assert [method for method, _ in mock_binance.requests].count("GET") == 1
+
+    monkeypatch.setattr(config, "KEEP_ARCHIVES", False)
+    fetch_klines("BTCUSDT", "2022-11-2", "2022-11-3", tz="UTC")
+    assert not list((config.CACHE_DIR / "archives").rglob("*2022-11-0*.zip"))
+
+
+def test_availability_index(mock_binance, monkeypatch):
+    def count(method):
+        return [m for m, _ in mock_binance.requests].count(method)
+
+    fetch_klines("BTCUSDT", "2022-10-2", "2022-11-2", tz="UTC")
+    assert count("HEAD") == 1 and count("GET") == 3
+
+    # the missing november archive is not probed again
+    fetch_klines("BTCUSDT", "2022-10-2", "2022-11-2", tz="UTC")
+    assert count("HEAD") == 1 and count("GET") == 3
+
+    info = index.lookup(
+        "https://data.binance.vision/data/spot/daily/klines/BTCUSDT/1m/BTCUSDT-1m-2022-11-02.zip"
+    )
+    assert info.available and info.size > 0 and len(info.checksum) == 64
+
+    monkeypatch.setattr(config, "AVAILABILITY_TTL", -1)
+    fetch_klines("BTCUSDT", "2022-10-2", "2022-11-2", tz="UTC")
+    assert count("HEAD") == 2
+
+    monkeypatch.setattr(config, "OFFLINE", True)
+    fetch_klines("BTCUSDT", "2022-10-2", "2022-11-2", tz="UTC")
+    with pytest.raises(NetworkError):
+        fetch_klines("BTCUSDT", "2022-10-2", "2022-11-3", tz="UTC")
+    assert count("HEAD") == 2 and count("GET") == 3
+
+
+def test_fetch_many(mock_binance):
+    start, end = "2022-10-30", "2022-11-2"
+    dfs = fetch_many(["btcusdt", "ETHUSDT", "BTC/USDT"], start, end, tz="UTC")
+    assert list(dfs) == ["BTCUSDT", "ETHUSDT"]
+    assert [method for method, _ in mock_binance.requests].count("GET") == 6
+    assert_frame_equal(dfs["ETHUSDT"], fetch_klines("ETHUSDT", start, end, tz="UTC"))
+
+    df = fetch_many(
+        ["BTCUSDT", "ETHUSDT"], start, end, tz="UTC", columns=["close"], as_frame=True
+    )
+    assert df.index.names == ["symbol", "open_datetime"]
+    assert_frame_equal(df.loc["BTCUSDT"], dfs["BTCUSDT"][["close"]])
+
+    with pytest.raises(ValueError):
+        fetch_many([], start, end, as_frame=True)
+
+
+def test_resample_cached_klines(mock_binance):
+    start, end = "2022-10-2 5:29", "2022-10-3 11:31"
+    fetch_klines("BTCUSDT", "2022-10-1", "2022-10-2", tz="UTC")
+    assert [method for method, _ in mock_binance.requests].count("GET") == 1
+
+    klines = fetch_klines(
+        "BTCUSDT", start, end, timeframe="15m", tz="Asia/Shanghai", base_timeframe="1m"
+    )
+    assert [method for method, _ in mock_binance.requests].count("GET") == 1
+
+    base = fetch_klines(
+        "BTCUSDT", "2022-10-2 5:30", "2022-10-2 5:44", tz="Asia/Shanghai"
+    )
+    assert klines.index[0] == Timestamp("2022-10-2 5:30", tz="Asia/Shanghai")
+    assert klines.index[-1] == Timestamp("2022-10-3 11:30", tz="Asia/Shanghai")
+    assert klines.close_datetime[0] == Timestamp(
+        "2022-10-2 5:44:59.999", tz="Asia/Shanghai"
+    )
+    assert klines.open[0] == base.open[0] and klines.close[0] == base.close[-1]
+    assert klines.high[0] == base.high.max() and klines.low[0] == base.low.min()
+    assert klines.volume[0] == base.volume.sum()
+    assert klines.trades[0] == base.trades.sum()
+
+    # the archives of november are not cached, so 1h klines are downloaded
+    fetch_klines(
+        "BTCUSDT",
+        "2022-11-1",
+        "2022-11-2",
+        timeframe="1h",
+        tz="UTC",
+        base_timeframe="1m",
+    )
+    assert (
+        "GET",
+        "/data/spot/daily/klines/BTCUSDT/1h/BTCUSDT-1h-2022-11-01.zip",
+    ) in mock_binance.requests
+
+    with pytest.raises(ValueError):
+        fetch_klines("BTCUSDT", start, end, timeframe="1w", base_timeframe="3d")
+
+
+def test_fetch_bars(mock_binance):
+    start, end = "2022-10-1 10:00", "2022-10-2 12:00"
+    trades = fetch_agg_trades("BTCUSDT", start, end, tz="UTC")
+    bars = fetch_bars("BTCUSDT", start, end, size="15min", tz="UTC", chunk_rows=1000)
+    assert bars.index[0] == Timestamp("2022-10-1 10:00", tz="UTC")
+    assert bars.trades.sum() == len(trades)
+    assert bars.volume.sum() == pytest.approx(trades.quantity.sum())
+
+
+def test_checksum(mock_binance, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(utils, "get_checksum", lambda url, client: "0" * 64)
+        with pytest.raises(ChecksumError):
+            fetch_klines("BTCUSDT", "2022-11-1", "2022-11-1", tz="UTC")
+    assert list((config.CACHE_DIR / "archives").glob("**/*.zip*")) == []
+    assert [p for p in (config.CACHE_DIR / "data").rglob("*") if p.is_file()] == []
+
+    fetch_klines("BTCUSDT", "2022-11-1", "2022-11-1", tz="UTC")
+    assert len(mock_binance.checksum_requests) == 1
+
+
+def test_archive_is_downloaded_once(mock_binance):
+    with ThreadPoolExecutor(8) as executor:
+        futures = [
+            executor.submit(fetch_klines, "BTCUSDT", "2022-11-1", "2022-11-1", tz="UTC")
+            for _ in range(8)
+        ]
+        dfs = [future.result() for future in futures]
+    downloads = [path for method, path in mock_binance.requests if method == "GET"]
+    assert downloads == ["/data/spot/daily/klines/BTCUSDT/1m/BTCUSDT-1m-2022-11-01.zip"]
+    for df in dfs[1:]:
+        assert_frame_equal(df, dfs[0])
+
+
+def test_resume_download(mock_binance, monkeypatch):
+    expected = fetch_klines("BTCUSDT", "2022-11-1", "2022-11-1", tz="UTC")
+    monkeypatch.setattr(config, "CACHE_DIR", config.CACHE_DIR / "resume")
+    monkeypatch.setattr(config, "BACKOFF_FACTOR", 0)
+    mock_binance.fail_after = 100
+    path = "/data/spot/daily/klines/BTCUSDT/1m/BTCUSDT-1m-2022-11-01.zip"
+
+    # the interrupted stream is resumed by the same call
+    assert_frame_equal(
+        fetch_klines("BTCUSDT", "2022-11-1", "2022-11-1", tz="UTC"), expected
+    )
+    assert mock_binance.range_requests == [(path, "bytes=100-")]
+
+    # or by the next call once the retries are exhausted
+    mock_binance.range_requests.clear()
+    monkeypatch.setattr(config, "RETRIES", 0)
+    with pytest.raises(NetworkError):
+        fetch_klines("BTCUSDT", "2022-11-2", "2022-11-2", tz="UTC")
+    assert [p.stat().st_size for p in config.CACHE_DIR.glob("**/*.part")] == [100]
+    fetch_klines("BTCUSDT", "2022-11-2", "2022-11-2", tz="UTC")
+    assert mock_binance.range_requests == [(path.replace("01", "02"), "bytes=100-")]
+    assert list(config.CACHE_DIR.glob("**/*.part")) == []
+
+
+def test_parallel_download(mock_binance, monkeypatch):
+    progress = []
+    monkeypatch.setattr(config, "PARALLEL_DOWNLOAD_SIZE", 1)
+    monkeypatch.setattr(config, "DOWNLOAD_CONNECTIONS", 3)
+    monkeypatch.setattr(config, "PROGRESS_HOOK", lambda *args: progress.append(args))
+    df = fetch_klines("BTCUSDT", "2022-10-1", "2022-10-31 23:59", tz="UTC")
+    assert len(df) == 31 * 24 * 60
+    assert df.index.is_monotonic_increasing
+
+    url = "https://data.binance.vision/data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2022-10.zip"
+    size = progress[-1][2]
+    assert progress[-1] == (url, size, size)
+    ranges = sorted(r for _, r in mock_binance.range_requests)
+    assert len(ranges) == 3
+    assert ranges[0].startswith("bytes=0-") and ranges[-1].endswith(f"-{size - 1}")
+    assert list(config.CACHE_DIR.glob("**/*.part*")) == []
+
+
+def test_parallel_download_ignored_ranges(mock_binance, monkeypatch):
+    monkeypatch.setattr(config, "PARALLEL_DOWNLOAD_SIZE", 1)
+    monkeypatch.setattr(config, "DOWNLOAD_CONNECTIONS", 3)
+    mock_binance.ignore_ranges = True
+    df = fetch_klines("BTCUSDT", "2022-10-1", "2022-10-31 23:59", tz="UTC")
+    assert len(df) == 31 * 24 * 60
+
+    # the whole archive is downloaded again by one request
+    path = "/data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2022-10.zip"
+    assert mock_binance.requests.count(("GET", path)) == 3 + 1
+    assert list(config.CACHE_DIR.glob("**/*.part*")) == []
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas import Timestamp
+from pandas.testing import assert_frame_equal
+
+from binance_history.bars import BarBuilder, build_bars
+
+
+@pytest.fixture
+def trades():
+    rng = np.random.default_rng(0)
+    n = 10_000
+    offsets = np.sort(rng.integers(0, 3600_000, n))
+    index = pd.to_datetime(offsets, unit="ms").tz_localize("UTC")
+    return pd.DataFrame(
+        {
+            "price": rng.uniform(100, 110, n).round(2),
+            "quantity": rng.uniform(0, 2, n).round(3),
+            "is_buyer_maker": rng.integers(0, 2, n).astype(bool),
+        },
+        index=index.tz_convert("Asia/Shanghai").rename("datetime"),
+    )
+
+
+def chunks(df, size):
+    return [df.iloc[i : i + size] for i in range(0, len(df), size)]
+
+
+@pytest.mark.parametrize(
+    "bar_type, size",
+    [("time", "250ms"), ("time", "10s"), ("tick", 100), ("volume", 50)],
+)
+def test_incremental_bars(trades, bar_type, size):
+    bars = build_bars(trades, bar_type, size)
+    assert bars.trades.sum() == len(trades)
+    assert bars.index.is_monotonic_increasing
+    assert_frame_equal(build_bars(chunks(trades, 777), bar_type, size), bars)
+
+
+def test_time_bars(trades):
+    bars = build_bars(trades, "time", "10s")
+    grouped = trades.groupby(trades.index.floor("10s"))
+    assert_frame_equal(
+        bars[["open", "high", "low", "close"]],
+        grouped.price.agg(["first", "max", "min", "last"]).set_axis(
+            ["open", "high", "low", "close"], axis=1
+        ),
+        check_names=False,
+    )
+    assert np.allclose(bars.volume, grouped.quantity.sum())
+    assert np.allclose(bars.buy_volume + bars.sell_volume, bars.volume)
+    sells = trades.quantity.where(trades.is_buyer_maker, 0)
+    assert np.allclose(bars.sell_volume, sells.groupby(trades.index.floor("10s")).sum())
+    assert (bars.close_datetime - bars.index == pd.Timedelta("9.999s")).all()
+    assert str(bars.index.tz) == "Asia/Shanghai"
+
+
+def test_information_bars(trades):
+    bars = build_bars(trades, "tick", 300)
+    assert (bars.trades[:-1] == 300).all()
+    assert bars.index[1] == trades.index[300]
+    assert bars.close_datetime[0] == trades.index[299]
+
+    bars = build_bars(trades, "dollar", 10_000)
+    # every bar but the last one crosses a multiple of the size
+    crossed = (bars.quote_volume.cumsum() // 10_000).diff().fillna(1)
+    assert (crossed[:-1] >= 1).all()
+    assert np.isclose(bars.quote_volume.sum(), (trades.price * trades.quantity).sum())
+
+
+def test_bar_builder():
+    builder = BarBuilder("time", "1s")
+    assert len(builder.flush()) == 0
+    trades = pd.DataFrame(
+        {"price": [1.0, 2.0, 3.0], "quantity": 1.0, "is_buyer_maker": False},
+        index=pd.DatetimeIndex(
+            ["2022-1-1 0:00:00.1", "2022-1-1 0:00:00.9", "2022-1-1 0:00:01.5"]
+        ),
+    )
+    assert len(builder.update(trades[:2])) == 0
+    bars = builder.update(trades[2:])
+    assert list(bars.close) == [2.0] and bars.index[0] == Timestamp("2022-1-1")
+    assert list(builder.flush().open) == [3.0]
+
+    with pytest.raises(ValueError):
+        BarBuilder("range", 1)
+    with pytest.raises(ValueError):
+        BarBuilder("volume", 0)
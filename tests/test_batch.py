@@ -0,0 +1,99 @@
+import json
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from binance_history import cli
+from binance_history.batch import Job, load_jobs, run_jobs
+
+JOBS = [
+    {"symbol": "BTCUSDT", "start": "2022-11-1", "end": "2022-11-2 23:59"},
+    {"symbol": "BTCUSDT", "start": "2022-11-2", "end": "2022-11-3 23:59"},
+    {
+        "symbol": "ETHUSDT",
+        "data_type": "aggTrades",
+        "start": "2022-11-1",
+        "end": "2022-11-1 23:59",
+    },
+]
+
+
+@pytest.mark.parametrize("suffix", [".json", ".yaml", ".csv"])
+def test_load_jobs(tmp_path, suffix):
+    path = tmp_path / f"jobs{suffix}"
+    if suffix == ".json":
+        path.write_text(json.dumps({"defaults": {"tz": "UTC"}, "jobs": JOBS}))
+    elif suffix == ".yaml":
+        yaml = pytest.importorskip("yaml")
+        path.write_text(yaml.safe_dump({"defaults": {"tz": "UTC"}, "jobs": JOBS}))
+    else:
+        pd.DataFrame(JOBS).assign(tz="UTC").to_csv(path, index=False)
+
+    jobs = load_jobs(path)
+    assert jobs == [Job(**job, tz="UTC") for job in JOBS]
+    assert str(jobs[0]) == "spot/klines/BTCUSDT/1m [2022-11-1, 2022-11-2 23:59]"
+
+
+def test_load_invalid_jobs(tmp_path):
+    path = tmp_path / "jobs.json"
+    for jobs in [
+        [{"symbol": "BTCUSDT", "start": "2022-1-1"}],
+        [{**JOBS[0], "interval": "1m"}],
+        [{**JOBS[0], "output_path": "a.orc"}],
+    ]:
+        path.write_text(json.dumps(jobs))
+        with pytest.raises(ValueError):
+            load_jobs(path)
+    with pytest.raises(ValueError):
+        load_jobs(tmp_path / "jobs.txt")
+
+
+def test_run_jobs(mock_binance, tmp_path):
+    output = tmp_path / "out.parquet"
+    jobs = [
+        Job(**JOBS[0], tz="UTC", output_path=str(output)),
+        *[Job(**job, tz="UTC") for job in JOBS[1:]],
+        Job("BTCUSDT", "2022-11-1", "2022-11-1", asset_type="margin", tz="UTC"),
+    ]
+    state_path = tmp_path / "jobs.state"
+    reported = []
+    results = run_jobs(
+        jobs, state_path=state_path, on_result=lambda i, r: reported.append(i)
+    )
+
+    assert reported == [0, 1, 2, 3]
+    assert [r.ok for r in results] == [True, True, True, False]
+    assert "DataNotFound" in results[3].error
+    assert [r.rows for r in results] == [2880, 0, 0, 0]
+    assert len(pd.read_parquet(output)) == 2880
+
+    # the archives shared by the jobs are downloaded once
+    downloads = [p for method, p in mock_binance.requests if method == "GET"]
+    assert len(downloads) == len(set(downloads))
+    # and counted once, the archive of the failed job is not found
+    assert sum(r.downloaded for r in results) == len(downloads) - 1
+
+    # only the failed job is run again
+    mock_binance.requests.clear()
+    results = run_jobs(jobs, state_path=state_path)
+    assert [r.job for r in results] == jobs[3:]
+
+
+def test_cli_batch(mock_binance, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "create_client", lambda **kwargs: mock_binance.client())
+    manifest = tmp_path / "jobs.json"
+    manifest.write_text(json.dumps({"defaults": {"tz": "UTC"}, "jobs": JOBS}))
+    runner = CliRunner()
+
+    result = runner.invoke(cli.main, ["batch", str(manifest)])
+    assert result.exit_code == 0
+    assert (tmp_path / "jobs.json.state").read_text().count("\n") == 3
+
+    mock_binance.requests.clear()
+    result = runner.invoke(cli.main, ["batch", str(manifest)])
+    assert result.exit_code == 0 and mock_binance.requests == []
+
+    result = runner.invoke(cli.main, ["batch", str(manifest), "--restart"])
+    assert result.exit_code == 0
+    assert (tmp_path / "jobs.json.state").read_text().count("\n") == 3
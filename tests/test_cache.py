@@ -0,0 +1,129 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from pandas.testing import assert_frame_equal
+
+from binance_history import config
+from binance_history.cache import get_backend, overlapped_row_groups
+from binance_history.utils import (
+    convert_tz,
+    get_local_data_path,
+    load_data_from_disk,
+    save_data_to_disk,
+)
+
+URL = "https://data.binance.vision/data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2022-01.zip"
+
+
+@pytest.fixture
+def klines(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "CACHE_DIR", tmp_path)
+    index = pd.date_range("2022-1-1", periods=5, freq="1min", tz="UTC")
+    index.freq = None
+    return pd.DataFrame(
+        {
+            "open": [1.1, 2.2, 3.3, 4.4, 5.5],
+            "volume": [1.0, 2.0, 0.5, 0.25, 8.0],
+            "trades": [1, 2, 3, 4, 5],
+            "close_datetime": index + pd.Timedelta("59.999s"),
+        },
+        index=pd.DatetimeIndex(index, name="open_datetime"),
+    )
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_parquet_cache(klines, monkeypatch, compact):
+    monkeypatch.setattr(config, "CACHE_FORMAT", "parquet")
+    monkeypatch.setattr(config, "PARQUET_COMPACT_DTYPES", compact)
+    save_data_to_disk(URL, klines)
+
+    path = get_local_data_path(URL).with_suffix(".parquet")
+    schema = pq.read_schema(path)
+    assert str(schema.field("open").type) == "double"
+    if compact:
+        assert str(schema.field("volume").type) == "float"
+        assert str(schema.field("trades").type) == "int32"
+        assert str(schema.field("close_datetime").type) == "timestamp[ms, tz=UTC]"
+    else:
+        assert str(schema.field("volume").type) == "double"
+        assert str(schema.field("trades").type) == "int64"
+        assert str(schema.field("close_datetime").type) == "timestamp[ns, tz=UTC]"
+
+    assert_frame_equal(load_data_from_disk(URL), klines)
+    assert_frame_equal(
+        load_data_from_disk(URL, ["open", "trades"]), klines[["open", "trades"]]
+    )
+
+
+def test_migrate_cache(klines, monkeypatch):
+    monkeypatch.setattr(config, "CACHE_FORMAT", "parquet")
+    legacy_path = get_local_data_path(URL)
+    legacy_path.parent.mkdir(parents=True)
+    # the old pickle cache kept the timezone of the first request
+    convert_tz(klines.copy(), "Asia/Shanghai").to_pickle(legacy_path)
+
+    assert_frame_equal(load_data_from_disk(URL, ["open"]), klines[["open"]])
+    assert not legacy_path.exists()
+    assert get_backend("parquet").exists(legacy_path)
+
+    monkeypatch.setattr(config, "CACHE_FORMAT", "pickle")
+    assert_frame_equal(load_data_from_disk(URL), klines)
+    assert not get_backend("parquet").exists(legacy_path)
+    assert get_backend("pickle").exists(legacy_path)
+
+    with pytest.raises(ValueError):
+        get_backend("csv")
+
+
+def test_parquet_cache_range_pruning(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "CACHE_DIR", tmp_path)
+    # the default format prunes, pickle files are always read whole
+    assert get_backend().name == "parquet"
+    index = pd.date_range("2022-1-1", "2022-1-3 23:59", freq="1min", tz="UTC")
+    index.freq = None
+    df = pd.DataFrame({"close": range(len(index))}, index=index.rename("open_datetime"))
+    path = get_local_data_path(URL).with_suffix(".parquet")
+
+    # small days are written to one row group
+    save_data_to_disk(URL, df)
+    assert pq.ParquetFile(path).num_row_groups == 1
+
+    monkeypatch.setattr(config, "PARQUET_ROW_GROUP_ROWS", 1000)
+    save_data_to_disk(URL, df)
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.num_row_groups == 3
+
+    start = pd.Timestamp("2022-1-2 8:00", tz="Asia/Shanghai")
+    end = pd.Timestamp("2022-1-2 18:00", tz="Asia/Shanghai")
+    assert overlapped_row_groups(parquet_file, start, end) == [1]
+    assert overlapped_row_groups(parquet_file, end=start) == [0, 1]
+    assert overlapped_row_groups(parquet_file, pd.Timestamp("2023-1-1")) == []
+
+    assert_frame_equal(
+        load_data_from_disk(URL, start=start, end=end), df.loc[start:end]
+    )
+    assert load_data_from_disk(URL, start=pd.Timestamp("2023-1-1", tz="UTC")).empty
+
+
+@pytest.mark.parametrize("cache_format", ["parquet", "pickle"])
+def test_atomic_write(klines, monkeypatch, cache_format):
+    monkeypatch.setattr(config, "CACHE_FORMAT", cache_format)
+    path = get_local_data_path(URL)
+    save_data_to_disk(URL, klines)
+
+    def fail():
+        yield klines
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        get_backend().save_chunks(path, fail())
+    # the cached file is untouched and no temporary file is left
+    assert [p.name for p in path.parent.iterdir()] == [
+        get_backend().file_path(path).name
+    ]
+    assert_frame_equal(load_data_from_disk(URL), klines)
+
+    # a damaged file is removed as if it was not cached
+    get_backend().file_path(path).write_bytes(b"damaged")
+    assert load_data_from_disk(URL) is None
+    assert list(path.parent.iterdir()) == []
@@ -1,6 +1,10 @@
 import subprocess
 
 import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from binance_history import cli, fetch_klines
 
 
 def test_cli_fetch_klines(tmp_path):
@@ -52,3 +56,66 @@ def test_cli_fetch_agg_trades(tmp_path):
     df = pd.read_csv(csv_path, parse_dates=True, index_col=0)
     assert df.index[0].day == 2
     assert df.index[-1].day == 4
+
+
+def test_cli_sync(mock_binance, monkeypatch):
+    monkeypatch.setattr(cli, "create_client", lambda **kwargs: mock_binance.client())
+    runner = CliRunner()
+    args = ["sync", "--symbol", "BTCUSDT", "--end", "2022-11-2"]
+
+    result = runner.invoke(cli.main, args)
+    assert result.exit_code == 1
+
+    result = runner.invoke(cli.main, [*args, "--start", "2022-10-30"])
+    assert result.exit_code == 0
+    assert len(mock_binance.requests) == 4
+
+    result = runner.invoke(cli.main, args)
+    assert result.exit_code == 0
+    assert len(mock_binance.requests) == 4
+
+
+@pytest.mark.parametrize(
+    "flags, http2", [([], None), (["--http2"], True), (["--no-http2"], False)]
+)
+def test_cli_http2(mock_binance, monkeypatch, flags, http2):
+    clients = []
+
+    def create_client(**kwargs):
+        clients.append(kwargs)
+        return mock_binance.client()
+
+    monkeypatch.setattr(cli, "create_client", create_client)
+    args = ["sync", "--symbol", "BTCUSDT", "--start", "2022-11-1", "--end", "2022-11-1"]
+    result = CliRunner().invoke(cli.main, [*args, *flags])
+    assert result.exit_code == 0
+    # config.HTTP2 is used unless the flag is given
+    assert clients == [{"http2": http2}]
+
+
+def test_cli_cache(mock_binance):
+    fetch_klines("BTCUSDT", "2022-11-1", "2022-11-3", tz="UTC")
+    runner = CliRunner()
+
+    # the cache and the lock file of every archive
+    result = runner.invoke(cli.main, ["cache", "ls", "--symbol", "BTCUSDT"])
+    assert result.exit_code == 0 and len(result.output.splitlines()) == 6
+
+    result = runner.invoke(cli.main, ["cache", "du", "--by", "timeframe"])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[0].endswith("6 files  1m")
+
+    result = runner.invoke(
+        cli.main, ["cache", "prune", "--max-size", "1B", "--dry-run"]
+    )
+    assert result.exit_code == 0 and len(result.output.splitlines()) == 3
+    result = runner.invoke(cli.main, ["cache", "prune", "--max-size", "0.1K"])
+    assert result.exit_code == 0
+    # only the lock files are left
+    output = runner.invoke(cli.main, ["cache", "ls"]).output
+    assert len(output.splitlines()) == 3 and output.count(".lock\n") == 3
+
+    result = runner.invoke(cli.main, ["cache", "prune"])
+    assert result.exit_code == 2 and "--max-size or --max-age" in result.output
+    result = runner.invoke(cli.main, ["cache", "prune", "--max-size", "10 apples"])
+    assert result.exit_code == 2 and "invalid size" in result.output
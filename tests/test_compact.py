@@ -0,0 +1,64 @@
+import warnings
+
+import pytest
+from pandas import Timestamp
+from pandas.testing import assert_frame_equal
+
+from binance_history import config, fetch_klines
+from binance_history.compact import cached_daily_archives, compact
+from binance_history.utils import (
+    gen_data_url,
+    is_data_on_disk,
+    load_data_from_disk,
+    save_data_to_disk,
+)
+
+
+def url(freq, dt):
+    return gen_data_url("klines", "spot", freq, "BTCUSDT", Timestamp(dt), "1m")
+
+
+def test_compact(mock_binance, monkeypatch):
+    monkeypatch.setattr(config, "AVAILABILITY_TTL", 0)
+    mock_binance.last_month = Timestamp("2022-9")
+    start, end = "2022-9-20", "2022-11-2 23:59"
+    klines = fetch_klines("BTCUSDT", start, end, tz="UTC")
+    assert is_data_on_disk(url("daily", "2022-10-1"))
+    (dataset, dates), *_ = cached_daily_archives("BTCUSDT").items()
+    assert dataset.timeframe == "1m" and len(dates) == 33
+
+    # the official archive of october is published but identical
+    mock_binance.last_month = Timestamp("2022-10")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert compact(verify=True) == [url("monthly", "2022-10")]
+    assert not is_data_on_disk(url("daily", "2022-10-1"))
+    assert is_data_on_disk(url("daily", "2022-11-1"))
+    assert cached_daily_archives(data_type="aggTrades") == {}
+
+    mock_binance.requests.clear()
+    klines_compacted = fetch_klines("BTCUSDT", start, end, tz="UTC")
+    assert [path for method, path in mock_binance.requests if method == "GET"] == []
+    assert_frame_equal(klines_compacted, klines)
+
+
+def test_compact_verify(mock_binance, monkeypatch):
+    monkeypatch.setattr(config, "AVAILABILITY_TTL", 0)
+    mock_binance.last_month = Timestamp("2022-9")
+    fetch_klines("BTCUSDT", "2022-10-1", "2022-10-31 23:59", tz="UTC")
+
+    # without the official archive the cache is compacted as it is
+    daily = load_data_from_disk(url("daily", "2022-10-2"))
+    save_data_to_disk(url("daily", "2022-10-2"), daily.assign(close=0.0))
+    with monkeypatch.context() as m:
+        m.setattr(config, "OFFLINE", True)
+        assert compact(verify=True) == [url("monthly", "2022-10")]
+    assert (load_data_from_disk(url("monthly", "2022-10")).close == 0).any()
+
+    fetch_klines("BTCUSDT", "2022-12-1", "2022-12-31 23:59", tz="UTC")
+    daily = load_data_from_disk(url("daily", "2022-12-2"))
+    save_data_to_disk(url("daily", "2022-12-2"), daily.assign(close=0.0))
+    mock_binance.last_month = Timestamp("2022-12")
+    with pytest.warns(UserWarning):
+        assert compact("BTCUSDT", verify=True) == [url("monthly", "2022-12")]
+    assert (load_data_from_disk(url("monthly", "2022-12")).close > 0).all()
@@ -0,0 +1,108 @@
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+from click.testing import CliRunner
+from pandas.testing import assert_frame_equal
+
+from binance_history import cli, fetch_klines
+from binance_history.constants import EXPORT_FORMATS
+from binance_history.export import EXPORTERS, get_exporter
+
+
+@pytest.fixture
+def chunks():
+    index = pd.date_range(
+        "2022-1-1 22:00", periods=6, freq="1h", tz="Asia/Shanghai", name="open_datetime"
+    )
+    index.freq = None
+    df = pd.DataFrame(
+        {"close": [1.5, 2.5, 3.5, 4.5, 5.5, 6.5], "trades": [1, 2, 3, 4, 5, 6]},
+        index=index,
+    )
+    return [df.iloc[:3], df.iloc[3:]]
+
+
+@pytest.mark.parametrize(
+    ("name", "compression", "read"),
+    [
+        ("csv", None, lambda p: pd.read_csv(p, index_col=0)),
+        ("csv", "gzip", lambda p: pd.read_csv(p, index_col=0, compression="gzip")),
+        ("parquet", None, pd.read_parquet),
+        ("parquet", "zstd", pd.read_parquet),
+        ("feather", None, pd.read_feather),
+        ("feather", "uncompressed", pd.read_feather),
+    ],
+)
+def test_export_file(chunks, tmp_path, name, compression, read):
+    path = tmp_path / f"out.{name}"
+    rows = get_exporter(name, compression).write_chunks(path, iter(chunks))
+    assert rows == 6
+    df = read(path)
+    if name == "csv":
+        df.index = pd.to_datetime(df.index, utc=True).tz_convert("Asia/Shanghai")
+        df.index.name = "open_datetime"
+    assert_frame_equal(df, pd.concat(chunks), check_freq=False)
+
+
+def test_export_partitioned(chunks, tmp_path):
+    exporter = get_exporter("partitioned", "zstd")
+    assert exporter.write_chunks(tmp_path, iter(chunks), "BTCUSDT") == 6
+    files = sorted(p.relative_to(tmp_path).as_posix() for p in tmp_path.glob("**/*.*"))
+    assert files == [
+        "symbol=BTCUSDT/date=2022-01-01/part-00000.parquet",
+        "symbol=BTCUSDT/date=2022-01-02/part-00000.parquet",
+        "symbol=BTCUSDT/date=2022-01-02/part-00001.parquet",
+    ]
+    assert pq.read_metadata(tmp_path / files[0]).row_group(0).column(0).compression == (
+        "ZSTD"
+    )
+
+    # exporting again replaces the written partitions
+    exporter.write_chunks(tmp_path, iter(chunks[1:]), "BTCUSDT")
+    table = ds.dataset(tmp_path, partitioning="hive").to_table()
+    assert table.column("date").to_pylist() == ["2022-01-01"] * 2 + ["2022-01-02"] * 3
+    assert sorted(set(table.column("symbol").to_pylist())) == ["BTCUSDT"]
+
+
+def test_export_invalid():
+    assert list(EXPORTERS) == EXPORT_FORMATS
+    with pytest.raises(ValueError):
+        get_exporter("orc")
+    with pytest.raises(ValueError):
+        get_exporter("feather", "snappy")
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather", "partitioned"])
+def test_cli_fetch_export(mock_binance, monkeypatch, tmp_path, fmt):
+    monkeypatch.setattr(cli, "create_client", lambda **kwargs: mock_binance.client())
+    output = tmp_path / ("out" if fmt == "partitioned" else f"out.{fmt}")
+    args = [
+        "--symbol",
+        "BTCUSDT",
+        "--start",
+        "2022-11-1",
+        "--end",
+        "2022-11-3 23:59",
+        "--timeframe",
+        "1m",
+        "--tz",
+        "UTC",
+        "--output-path",
+        str(output),
+    ]
+    if fmt == "partitioned":
+        args += ["--format", "partitioned"]
+    result = CliRunner().invoke(cli.main, args)
+    assert result.exit_code == 0, result.output
+
+    expected = fetch_klines("BTCUSDT", "2022-11-1", "2022-11-3 23:59", tz="UTC")
+    if fmt == "parquet":
+        assert_frame_equal(pd.read_parquet(output), expected, check_freq=False)
+    elif fmt == "feather":
+        assert_frame_equal(pd.read_feather(output), expected, check_freq=False)
+    else:
+        assert len(list(output.glob("symbol=BTCUSDT/date=*/*.parquet"))) == 3
+
+    result = CliRunner().invoke(cli.main, [*args, "--compression", "bz3"])
+    assert result.exit_code == 1
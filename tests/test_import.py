@@ -0,0 +1,57 @@
+import re
+import subprocess
+import sys
+
+import pytest
+
+# the maximum time to import ``binance_history.cli`` (and the package) in seconds
+IMPORT_BUDGET = 0.15
+
+HEAVY_MODULES = ["pandas", "numpy", "httpx", "pendulum", "pyarrow", "loguru"]
+
+
+def run_python(code: str, *options: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *options, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import binance_history",
+        "import binance_history.cli",
+        "from binance_history.cli import main; main(['--help'], standalone_mode=False)",
+        "from binance_history.cli import main; main(['cache', '--help'], standalone_mode=False)",
+    ],
+)
+def test_heavy_modules_are_lazy(code):
+    check = f"import sys; print([m for m in {HEAVY_MODULES} if m in sys.modules])"
+    assert run_python(f"{code}\n{check}").stdout.splitlines()[-1] == "[]"
+
+
+def test_lazy_names():
+    code = (
+        "import binance_history as bh, binance_history.syncing\n"
+        "print(callable(bh.sync), bh.config.__name__, bh.__version__)\n"
+        "from binance_history import fetch_klines, BarBuilder\n"
+        "print(sorted(set(bh.__all__) - set(dir(bh))))"
+    )
+    lines = run_python(code).stdout.splitlines()
+    assert lines[0].startswith("True binance_history.config ")
+    assert lines[1] == "[]"
+    with pytest.raises(subprocess.CalledProcessError):
+        run_python("import binance_history; binance_history.nothing")
+
+
+def test_import_time():
+    stderr = run_python("import binance_history.cli", "-X", "importtime").stderr
+    # the cumulative time in microseconds of the package and the modules it imports
+    times = re.findall(
+        r"^import time:\s+\d+ \|\s+(\d+) \| binance_history", stderr, re.MULTILINE
+    )
+    assert times
+    assert sum(map(int, times)) / 10**6 < IMPORT_BUDGET
@@ -0,0 +1,128 @@
+import shutil
+import time
+
+from binance_history import (
+    config,
+    fetch_agg_trades,
+    fetch_klines,
+    index,
+    iter_klines,
+    utils,
+)
+from binance_history.manager import disk_usage, list_cache, prune, scan
+from binance_history.utils import save_data_chunks_to_disk
+
+
+def test_list_cache(mock_binance, monkeypatch):
+    monkeypatch.setattr(config, "CACHE_FORMAT", "parquet")
+    monkeypatch.setattr(config, "KEEP_ARCHIVES", True)
+    fetch_klines("BTCUSDT", "2022-11-1", "2022-11-3", tz="UTC")
+    fetch_agg_trades("ETCBTC", "2022-11-1", "2022-11-1 12:00", tz="UTC")
+    # a file cached by an older version is not in the index
+    legacy = (
+        config.CACHE_DIR / "data/spot/monthly/klines/BTCUSDT/1h/BTCUSDT-1h-2022-01.zip"
+    )
+    legacy.parent.mkdir(parents=True)
+    legacy.write_bytes(b"0" * 100)
+
+    files = list_cache()
+    # the cache, the raw archive and the lock file of every archive
+    assert len(files) == 3 * 3 + 1 * 3 + 1
+    assert set(files.format) == {"parquet", "zip", "lock", "pickle"}
+    assert list(list_cache("etc/btc").date) == ["2022-11-01"] * 3
+    assert len(index.list_entries()) == len(files)
+
+    usage = disk_usage()
+    assert usage.loc[("spot", "klines", "BTCUSDT"), "files"] == 10
+    assert usage["size"].sum() == sum(
+        (config.CACHE_DIR / path).stat().st_size for path in files.path
+    )
+    usage = disk_usage(["timeframe"], data_type="klines")
+    assert usage.loc["1h", "size"] == 100
+
+    legacy.unlink()
+    assert len(list_cache()) == len(index.list_entries()) == 12
+
+
+def test_prune(mock_binance, monkeypatch):
+    monkeypatch.setattr(config, "ACCESS_TIME_RESOLUTION", 0)
+    fetch_klines("BTCUSDT", "2022-11-1", "2022-11-4", tz="UTC")
+    # the archive of the first day is used again
+    time.sleep(0.01)
+    fetch_klines("BTCUSDT", "2022-11-1", "2022-11-1 1:00", tz="UTC")
+    # lock files are never pruned, see test_lock_files_are_not_pruned
+    shutil.rmtree(config.CACHE_DIR / "locks")
+    files = list_cache()
+    assert files.date.iloc[-1] == "2022-11-01"
+
+    size = files["size"].sum()
+    assert prune(max_bytes=size) == []
+    removed = prune(max_bytes=size - 1, dry_run=True)
+    assert [entry.path for entry in removed] == [files.path.iloc[0]]
+    assert len(list_cache()) == 4
+
+    removed = prune(max_bytes=files["size"].iloc[-2:].sum())
+    assert [entry.path for entry in removed] == list(files.path.iloc[:2])
+    assert list(list_cache().path) == list(files.path.iloc[2:])
+
+    index.record_entries([index.list_entries()[0]._replace(accessed_at=0)])
+    removed = prune(max_age=3600)
+    assert [entry.path for entry in removed] == [files.path.iloc[2]]
+    assert list(list_cache().date) == ["2022-11-01"]
+
+
+def test_cache_budget(mock_binance, monkeypatch):
+    symbols = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "ETCBTC", "LTCBTC"]
+    fetch_klines(symbols[0], "2022-11-1", "2022-11-1", tz="UTC")
+    size = list_cache()["size"].max()
+    monkeypatch.setattr(config, "CACHE_MAX_BYTES", int(size * 2.5))
+    for symbol in symbols[1:]:
+        time.sleep(0.01)
+        fetch_klines(symbol, "2022-11-1", "2022-11-1", tz="UTC")
+    files = list_cache()
+    assert list(files[files.format != "lock"].symbol) == ["ETCBTC", "LTCBTC"]
+
+
+def test_lock_files_are_not_pruned(mock_binance):
+    fetch_klines("BTCUSDT", "2022-11-1", "2022-11-2", tz="UTC")
+    locks = sorted((config.CACHE_DIR / "locks").glob("**/*.lock"))
+    assert len(locks) == 2
+
+    removed = prune(max_age=0)
+    assert len(removed) == 2
+    assert not any(entry.path.startswith("locks/") for entry in removed)
+    assert list(list_cache().format) == ["lock", "lock"]
+    assert sorted((config.CACHE_DIR / "locks").glob("**/*.lock")) == locks
+
+
+def test_access_times(mock_binance, monkeypatch):
+    fetch_klines("BTCUSDT", "2022-11-1", "2022-11-1 1:00", tz="UTC")
+    time.sleep(0.01)
+    fetch_klines("BTCUSDT", "2022-11-2", "2022-11-2 1:00", tz="UTC")
+    entries = index.list_entries()
+    assert "2022-11-01" in entries[0].path
+    size = sum(entry.size for entry in entries)
+
+    # reads neither update recent access times nor prune the cache
+    monkeypatch.setattr(config, "CACHE_MAX_BYTES", size // 2)
+    fetch_klines("BTCUSDT", "2022-11-1", "2022-11-1 1:00", tz="UTC")
+    assert index.list_entries() == entries
+
+    monkeypatch.setattr(config, "ACCESS_TIME_RESOLUTION", 0)
+    fetch_klines("BTCUSDT", "2022-11-1", "2022-11-1 1:00", tz="UTC")
+    assert index.list_entries() == entries
+    # the access time is written to the index in a batch, e.g. before a scan
+    assert "2022-11-01" in scan()[-1].path
+
+
+def test_pinned_files_are_not_pruned(mock_binance, monkeypatch):
+    def save_and_prune(url, chunks):
+        save_data_chunks_to_disk(url, chunks)
+        # e.g. a concurrent write exceeding config.CACHE_MAX_BYTES
+        prune(max_bytes=0)
+
+    monkeypatch.setattr(utils, "save_data_chunks_to_disk", save_and_prune)
+    chunks = iter_klines("BTCUSDT", "2022-11-1", "2022-11-2", tz="UTC")
+    assert sum(map(len, chunks)) == 1441
+    files = list_cache()
+    assert list(files[files.format != "lock"].date) == ["2022-11-02"]
@@ -0,0 +1,45 @@
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from binance_history import config, fetch_klines, memo
+from binance_history.memo import MemoryCache
+
+
+def test_memory_cache(mock_binance, monkeypatch):
+    monkeypatch.setattr(config, "MEMORY_CACHE_MAX_BYTES", 100 * 1024**2)
+    memo.clear()
+    klines = fetch_klines("BTCUSDT", "2022-11-2", "2022-11-3", tz="UTC")
+    assert memo.stats().misses == 3 and memo.stats().entries == 3
+
+    # the cached files are not read again
+    for path in (config.CACHE_DIR / "data").rglob("*"):
+        if path.is_file():
+            path.unlink()
+    again = fetch_klines(
+        "BTCUSDT", "2022-11-2 12:00", "2022-11-3", tz="Asia/Shanghai", columns=["close"]
+    )
+    assert memo.stats().hits == 2
+    expected = klines.loc["2022-11-2 4:00":"2022-11-2 16:00", ["close"]]
+    assert_frame_equal(again, expected.tz_convert("Asia/Shanghai"))
+
+    memo.clear()
+    assert memo.stats() == (0, 0, 0, 0)
+
+
+def test_memory_cache_eviction(monkeypatch):
+    df = pd.DataFrame({"a": range(1000)})
+    size = int(df.memory_usage(index=True).sum())
+    monkeypatch.setattr(config, "MEMORY_CACHE_MAX_BYTES", size * 2)
+    cache = MemoryCache()
+    cache.put("a", df)
+    cache.put("b", df)
+    assert cache.get("a") is df
+    cache.put("c", df)
+    assert cache.get("b") is None and cache.get("c") is df
+    assert cache.stats() == (2, 1, 2, size * 2)
+
+    cache.put("big", pd.concat([df] * 3))
+    assert cache.get("big") is None
+
+    monkeypatch.setattr(config, "MEMORY_CACHE_MAX_BYTES", 0)
+    assert cache.get("a") is None
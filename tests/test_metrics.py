@@ -0,0 +1,96 @@
+import pytest
+from click.testing import CliRunner
+
+from binance_history import cli, config, metrics
+from binance_history.api import fetch_klines, iter_data
+
+
+def test_collect(mock_binance):
+    start, end = "2022-11-1", "2022-11-2 23:59"
+    with metrics.collect() as cold:
+        klines = fetch_klines("BTCUSDT", start, end, tz="UTC", max_concurrency=2)
+    with metrics.collect() as warm:
+        fetch_klines("BTCUSDT", start, end, tz="UTC")
+
+    # the archives are downloaded by the worker threads of the pool
+    assert cold.counters["cache_misses"] == 2
+    assert cold.counters["downloaded_bytes"] > 0
+    assert cold.counters["parsed_rows"] == len(klines) == 2880
+    assert set(cold.calls) == set(metrics.STAGES) - {"cache_read"}
+    assert cold.calls["download"] == 2
+
+    assert warm.counters == {"cache_hits": 2}
+    assert set(warm.calls) == {"probe", "cache_read", "concat", "convert_tz"}
+    assert "cache_hits" in warm.format()
+
+    assert metrics.stats().counters["cache_hits"] >= 2
+
+
+def test_collect_nested_and_streamed(mock_binance):
+    with metrics.collect() as outer:
+        with metrics.collect() as inner:
+            trades = iter_data(
+                "ETCBTC",
+                "spot",
+                "aggTrades",
+                "2022-11-1",
+                "2022-11-2",
+                tz="UTC",
+                max_concurrency=2,
+            )
+            rows = sum(map(len, trades))
+    assert inner.counters["parsed_rows"] == outer.counters["parsed_rows"] > rows
+    assert inner.counters["cache_misses"] == 2
+    assert inner.calls["cache_read"] > 0
+
+
+def test_metrics_hook(mock_binance, monkeypatch):
+    events = []
+    monkeypatch.setattr(config, "METRICS_HOOK", lambda *event: events.append(event))
+    fetch_klines("BTCUSDT", "2022-11-2", "2022-11-2 23:59", tz="UTC")
+
+    names = {name for name, _ in events}
+    assert {"download_seconds", "parse_seconds", "cache_misses"} <= names
+    downloaded = sum(value for name, value in events if name == "downloaded_bytes")
+    gets = [path for method, path in mock_binance.requests if method == "GET"]
+    assert downloaded == sum(len(mock_binance.archive(path)) for path in gets)
+
+
+def test_to_prometheus():
+    stats = metrics.Stats()
+    stats.add_time("download", 1.5)
+    stats.add_count("downloaded_bytes", 1024)
+    text = metrics.to_prometheus(stats)
+    assert 'binance_history_stage_seconds_total{stage="download"} 1.5\n' in text
+    assert 'binance_history_stage_calls_total{stage="download"} 1\n' in text
+    assert "# TYPE binance_history_downloaded_bytes_total counter\n" in text
+    assert "binance_history_downloaded_bytes_total 1024\n" in text
+    assert "binance_history_cache_hits_total 0\n" in text
+
+
+@pytest.mark.parametrize("command", [[], ["fetch"]])
+def test_cli_profile(mock_binance, monkeypatch, tmp_path, command):
+    monkeypatch.setattr(cli, "create_client", lambda **kwargs: mock_binance.client())
+    metrics_file = tmp_path / "bh.prom"
+    args = [
+        "--profile",
+        "--metrics-file",
+        str(metrics_file),
+        *command,
+        "--symbol",
+        "BTCUSDT",
+        "--start",
+        "2022-11-1",
+        "--end",
+        "2022-11-1 23:59",
+        "--timeframe",
+        "1m",
+        "--tz",
+        "UTC",
+        "--output-path",
+        str(tmp_path / "out.csv"),
+    ]
+    result = CliRunner().invoke(cli.main, args)
+    assert result.exit_code == 0, result.output
+    assert "download" in result.stderr and "parsed_rows" in result.stderr
+    assert "binance_history_parsed_rows_total 1440\n" in metrics_file.read_text()
@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+from pandas import Timestamp
+
+from binance_history.resample import (
+    check_resampleable,
+    floor_open_datetime,
+    resample_klines,
+)
+
+
+@pytest.fixture
+def daily_klines():
+    index = pd.date_range("2022-1-1", "2022-3-31", freq="D", tz="UTC")
+    return pd.DataFrame(
+        {
+            "open": range(len(index)),
+            "high": range(1, len(index) + 1),
+            "low": range(len(index)),
+            "close": range(1, len(index) + 1),
+            "volume": 1.0,
+            "quote_volume": 2.0,
+            "trades": 3,
+        },
+        index=index.rename("open_datetime"),
+    )
+
+
+def test_resample_weekly_and_monthly(daily_klines):
+    weekly = resample_klines(daily_klines, "1w")
+    assert (weekly.index.weekday == 0).all()
+    # 2022-1-1 is a saturday, its week opens on 2021-12-27
+    assert weekly.index[0] == Timestamp("2021-12-27", tz="UTC")
+    assert weekly.volume[0] == 2 and weekly.volume[1] == 7
+    assert weekly.close_datetime[1] == Timestamp("2022-1-9 23:59:59.999", tz="UTC")
+
+    monthly = resample_klines(daily_klines, "1M")
+    assert list(monthly.index.month) == [1, 2, 3]
+    assert list(monthly.trades) == [93, 84, 93]
+    assert monthly.open[1] == 31 and monthly.close[1] == 59
+    assert monthly.close_datetime[1] == Timestamp("2022-2-28 23:59:59.999", tz="UTC")
+
+    three_days = resample_klines(daily_klines, "3d")
+    assert (three_days.index.asi8 // 86400_000_000_000 % 3 == 0).all()
+
+
+def test_alignment():
+    dt = Timestamp("2022-1-5 10:20", tz="Asia/Shanghai")
+    assert floor_open_datetime(dt, "1h") == Timestamp("2022-1-5 2:00", tz="UTC")
+    assert floor_open_datetime(dt, "1d") == Timestamp("2022-1-5", tz="UTC")
+    assert floor_open_datetime(dt, "1w") == Timestamp("2022-1-3", tz="UTC")
+    assert floor_open_datetime(dt, "1M") == Timestamp("2022-1-1", tz="UTC")
+
+    check_resampleable("4h", "1h")
+    check_resampleable("1M", "8h")
+    for timeframe, base_timeframe in [("1h", "4h"), ("1M", "1w"), ("1w", "3d")]:
+        with pytest.raises(ValueError):
+            check_resampleable(timeframe, base_timeframe)
@@ -0,0 +1,102 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from binance_history import config, session
+from binance_history.exceptions import NetworkError
+from binance_history.utils import download_archive
+
+
+def test_shared_client(monkeypatch):
+    monkeypatch.setattr(config, "TIMEOUT", 3.0)
+    session.set_client(None)
+
+    client = session.get_client()
+    assert session.get_client() is client
+    assert client.timeout == httpx.Timeout(3.0)
+
+    other = httpx.Client()
+    assert session.get_client(other) is other
+
+    session.close_client()
+    assert client.is_closed
+    assert session.get_client() is not client
+    session.close_client()
+
+
+@pytest.fixture
+def flaky(monkeypatch):
+    """a client whose requests fail by the given errors or statuses first"""
+    monkeypatch.setattr(config, "BACKOFF_FACTOR", 0.001)
+    monkeypatch.setattr(session, "RATE_LIMITER", session.RateLimiter())
+    attempts = []
+
+    def create(failures):
+        def handler(request):
+            attempts.append(time.monotonic())
+            if len(attempts) <= len(failures):
+                failure = failures[len(attempts) - 1]
+                if isinstance(failure, Exception):
+                    raise failure
+                return failure
+            return httpx.Response(200, text="ok")
+
+        transport = session.RetryTransport(httpx.MockTransport(handler))
+        return httpx.Client(transport=transport)
+
+    create.attempts = attempts
+    return create
+
+
+def test_retry(flaky, monkeypatch):
+    client = flaky(
+        [
+            httpx.ConnectError("refused"),
+            httpx.Response(503),
+            httpx.Response(429, headers={"Retry-After": "0.2"}),
+        ]
+    )
+    response = client.get("https://data.binance.vision/a.zip")
+    assert response.text == "ok" and len(flaky.attempts) == 4
+    assert flaky.attempts[3] - flaky.attempts[2] >= 0.2
+
+    # the last failure is returned once the retries are exhausted
+    monkeypatch.setattr(config, "RETRIES", 1)
+    flaky.attempts.clear()
+    client = flaky([httpx.Response(500)] * 3)
+    assert client.get("https://data.binance.vision/a.zip").status_code == 500
+    assert len(flaky.attempts) == 2
+
+    # a status which is not transient is returned at once
+    client = flaky([httpx.Response(404)])
+    flaky.attempts.clear()
+    assert client.get("https://data.binance.vision/a.zip").status_code == 404
+    assert len(flaky.attempts) == 1
+
+
+def test_download_retries(flaky, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CACHE_DIR", tmp_path)
+    # connection errors are only retried by the transport
+    client = flaky([httpx.ConnectError("refused")] * 10)
+    with pytest.raises(NetworkError):
+        download_archive(
+            "https://data.binance.vision/a.zip", tmp_path / "a.zip", client
+        )
+    assert len(flaky.attempts) == config.RETRIES + 1
+
+
+def test_retry_after():
+    assert session.retry_after(httpx.Response(503)) is None
+    assert session.retry_after(httpx.Response(503, headers={"Retry-After": "3"})) == 3
+    date = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert session.retry_after(httpx.Response(503, headers={"Retry-After": date})) == 0
+
+
+def test_rate_limit(flaky, monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT", 50)
+    client = flaky([])
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(client.get, ["https://data.binance.vision/a.zip"] * 11))
+    assert flaky.attempts[-1] - flaky.attempts[0] >= 0.19
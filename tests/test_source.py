@@ -0,0 +1,81 @@
+import hashlib
+
+import httpx
+import pytest
+from pandas import Timestamp
+from pandas.testing import assert_frame_equal
+
+from binance_history import config, fetch_klines, session
+from binance_history.cache import get_backend
+from binance_history.source import FileTransport, archive_key, base_url
+from binance_history.testing import ArchiveServer, write_archives
+from binance_history.utils import gen_data_url
+
+DAILY = "data/spot/daily/klines/BTCUSDT/1m/BTCUSDT-1m-2022-11-01.zip"
+MONTHLY = "data/spot/monthly/klines/BTCUSDT/1m/BTCUSDT-1m-2022-10.zip"
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    """a directory of archives in the layout of data.binance.vision, with an empty cache"""
+    monkeypatch.setattr(config, "CACHE_DIR", tmp_path / "cache")
+    write_archives(tmp_path / "mirror", "BTCUSDT", "2022-10-1", "2022-10-1")
+    write_archives(
+        tmp_path / "mirror", "BTCUSDT", "2022-11-1", "2022-11-1", freq="daily"
+    )
+    session.set_client(None)
+    yield tmp_path / "mirror"
+    session.close_client()
+
+
+def test_archive_key(monkeypatch):
+    monkeypatch.setattr(config, "DATA_URL", "/srv/binance")
+    assert base_url() == "file://localhost/srv/binance/"
+    assert archive_key("https://data.binance.vision/" + DAILY) == DAILY
+    assert archive_key("http://mirror:8080/binance/" + DAILY + ".CHECKSUM") == (
+        DAILY + ".CHECKSUM"
+    )
+    monkeypatch.setattr(config, "DATA_URL", "https://mirror/binance")
+    assert base_url() == "https://mirror/binance/"
+    url = gen_data_url(
+        "klines", "spot", "daily", "BTCUSDT", Timestamp("2022-11-1"), "1m"
+    )
+    assert url == "https://mirror/binance/" + DAILY
+
+
+def test_file_transport(mirror):
+    client = httpx.Client(transport=FileTransport())
+    url = "file://localhost" + str(mirror / MONTHLY)
+    content = (mirror / MONTHLY).read_bytes()
+
+    resp = client.head(url)
+    assert resp.headers["Content-Length"] == str(len(content))
+    assert client.get(url).content == content
+    resp = client.get(url, headers={"Range": "bytes=10-19"})
+    assert resp.status_code == 206 and resp.content == content[10:20]
+    assert (
+        client.get(url, headers={"Range": f"bytes={len(content)}-"}).status_code == 416
+    )
+    assert client.get(url + ".CHECKSUM").text.startswith(
+        hashlib.sha256(content).hexdigest()
+    )
+    assert client.get(url + ".zip").status_code == 404
+    with pytest.raises(httpx.UnsupportedProtocol):
+        client.get("https://data.binance.vision/" + MONTHLY)
+
+
+@pytest.mark.parametrize("source", ["path", "file", "http"])
+def test_fetch_from_mirror(mirror, monkeypatch, source):
+    with ArchiveServer(mirror) as server:
+        data_url = {"path": str(mirror), "file": mirror.as_uri(), "http": server.url}
+        monkeypatch.setattr(config, "DATA_URL", data_url[source])
+        df = fetch_klines("BTCUSDT", "2022-10-31", "2022-11-1 23:59", tz="UTC")
+    assert len(df) == 2 * 24 * 60
+
+    # the cache is keyed by the path of archives, so it's shared by every source
+    assert get_backend().exists(config.CACHE_DIR / DAILY)
+    monkeypatch.setattr(config, "DATA_URL", "https://data.binance.vision/")
+    monkeypatch.setattr(config, "OFFLINE", True)
+    assert_frame_equal(
+        fetch_klines("BTCUSDT", "2022-10-31", "2022-11-1 23:59", tz="UTC"), df
+    )
@@ -0,0 +1,58 @@
+from urllib.parse import urlparse
+
+import pytest
+from pandas import Timestamp
+
+from binance_history import SyncResult, config, fetch_klines, sync
+from binance_history.utils import gen_data_url, is_data_on_disk
+
+
+def url(freq, dt):
+    return gen_data_url("klines", "spot", freq, "BTCUSDT", Timestamp(dt), "1m")
+
+
+def test_sync(mock_binance, monkeypatch):
+    monkeypatch.setattr(config, "AVAILABILITY_TTL", 0)
+    mock_binance.last_month = Timestamp("2022-9")
+    mock_binance.last_day = Timestamp("2022-11-3")
+
+    with pytest.raises(ValueError):
+        sync("BTCUSDT")
+
+    result = sync("btc/usdt", start="2022-8-15", end="2022-11-5")
+    assert isinstance(result, SyncResult)
+    assert result.synced_until == Timestamp("2022-11-3")
+    assert url("daily", "2022-8-15") in result.downloaded
+    assert url("monthly", "2022-9") in result.downloaded
+    assert url("daily", "2022-10-1") in result.downloaded
+    assert len(result.downloaded) == 17 + 1 + 31 + 3
+    assert result.compacted == []
+
+    mock_binance.requests.clear()
+    result = sync("BTCUSDT", end="2022-11-5")
+    assert result.downloaded == [] and result.compacted == []
+    # only the monthly archive to compact and the days not published are checked
+    assert sorted(mock_binance.requests) == [
+        ("GET", urlparse(url("daily", "2022-11-4")).path),
+        ("GET", urlparse(url("daily", "2022-11-5")).path),
+        ("HEAD", urlparse(url("monthly", "2022-10")).path),
+    ]
+
+    mock_binance.last_month = Timestamp("2022-10")
+    mock_binance.last_day = Timestamp("2022-11-5")
+    mock_binance.requests.clear()
+    result = sync("BTCUSDT", end="2022-11-5")
+    assert result.synced_until == Timestamp("2022-11-5")
+    assert result.compacted == [url("monthly", "2022-10")]
+    assert result.downloaded == [url("daily", "2022-11-4"), url("daily", "2022-11-5")]
+    assert not is_data_on_disk(url("daily", "2022-10-1"))
+    assert is_data_on_disk(url("monthly", "2022-10"))
+    # august is not synced from its first day, its daily archives are kept
+    assert is_data_on_disk(url("daily", "2022-8-20"))
+    assert is_data_on_disk(url("daily", "2022-11-1"))
+
+    mock_binance.requests.clear()
+    klines = fetch_klines("BTCUSDT", "2022-9-1", "2022-11-5 23:59", tz="UTC")
+    assert [path for method, path in mock_binance.requests if method == "GET"] == []
+    assert len(klines) == (30 + 31 + 5) * 1440
+    assert klines.index.is_monotonic_increasing
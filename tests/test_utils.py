@@ -1,7 +1,18 @@
+import re
+
+import pandas as pd
 import pytest
 from pandas import Timestamp, Timedelta
+from pandas.testing import assert_frame_equal
 
-from binance_history.utils import gen_data_url, gen_dates
+from binance_history.testing import make_agg_trades_csv, make_klines_csv, make_zip
+from binance_history.utils import (
+    gen_data_url,
+    gen_dates,
+    iter_csv_chunks,
+    load_agg_trades,
+    load_klines,
+)
 
 
 def test_gen_data_url():
@@ -55,3 +66,51 @@ def test_gen_dates():
             Timestamp("2021-12-1"),
             "1m",
         )
+
+
+@pytest.mark.parametrize("header", [False, True])
+def test_load_archives(header):
+    klines_csv = make_klines_csv("2022-1-1", "2022-1-2", "1m")
+    trades_csv = make_agg_trades_csv("2025-1-1", "2025-1-2")
+    # spot archives since 2025 use microsecond timestamps
+    trades_csv = re.sub(rb",(\d{13}),", rb",\g<1>000,", trades_csv)
+    if header:
+        klines_csv = (
+            b"open_time,open,high,low,close,volume,close_time,quote_volume,count,taker_buy_volume,taker_buy_quote_volume,ignore\n"
+            + klines_csv
+        )
+        trades_csv = (
+            b"agg_trade_id,price,quantity,first_trade_id,last_trade_id,transact_time,is_buyer_maker,is_best_match\n"
+            + trades_csv
+        )
+    klines_zip = make_zip("a.csv", klines_csv)
+    trades_zip = make_zip("b.csv", trades_csv)
+
+    klines = load_klines(klines_zip, engine="c")
+    assert len(klines) == 1440
+    assert klines.index[0] == Timestamp("2022-1-1", tz="UTC")
+    assert klines.close_datetime[-1] == Timestamp("2022-1-1 23:59:59.999", tz="UTC")
+    assert list(klines.columns) == [
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "quote_volume",
+        "trades",
+        "close_datetime",
+    ]
+    assert_frame_equal(load_klines(klines_zip, engine="pyarrow"), klines)
+
+    trades = load_agg_trades(trades_zip, engine="c")
+    assert len(trades) == 8640
+    assert trades.index[0] == Timestamp("2025-1-1", tz="UTC")
+    assert trades.is_buyer_maker.dtype == bool
+    assert_frame_equal(load_agg_trades(trades_zip, engine="pyarrow"), trades)
+
+    for engine in ["c", "pyarrow"]:
+        chunks = list(iter_csv_chunks("aggTrades", trades_zip, 1000, engine))
+        assert_frame_equal(pd.concat(chunks), trades)
+
+    with pytest.raises(ValueError):
+        load_klines(klines_zip, engine="python")